@@ -1,50 +1,127 @@
+from array import array
+from os import getenv
 from sys import stdin
-from time import sleep
+from time import monotonic, monotonic_ns
 
+import asyncio
 import board
+import busio
+import gc
 import digitalio
 import displayio
+import frames
+import microcontroller
 from adafruit_debouncer import Debouncer
 from adafruit_display_text import label
 from adafruit_displayio_ssd1306 import SSD1306
-from adafruit_pn532.I2C import PN532_I2C
-from foamyguy_displayio_listselect import ListSelect
 from i2cdisplaybus import I2CDisplayBus
 from supervisor import runtime
 from terminalio import FONT
 
 
-class ScreenLabel(label.Label):
+class Screen:
+    WIDTH = 128
+    HEIGHT = 64
+
     def __init__(self):
+        self.display = None
+        # Set by any change since the last refresh. displayio keeps its own
+        # dirty areas and only pushes those
+        self.is_dirty = False
+        self.refreshes = 0
+
+    def attach(self, display):
+        # Refresh explicitly, at most once per tick, instead of on every change
+        display.auto_refresh = False
+
+        self.display = display
+        self.is_dirty = True
+
+    def refresh(self):
+        if self.display is None or not self.is_dirty:
+            return False
+
+        self.display.refresh()
+        self.refreshes += 1
+        self.is_dirty = False
+
+        return True
+
+    def reset_stats(self):
+        self.refreshes = 0
+
+    def summary(self):
+        return f"screen refreshes {self.refreshes}"
+
+
+class ScreenLabel(label.Label):
+    def __init__(self, screen):
         super().__init__(FONT, text="", x=0, y=8)
+        self._screen = screen
 
     def update(self, text=None, x=None, y=None):
-        if text is not None:
+        # Skip no-op changes, setting text re-lays out the whole label
+        is_text_changed = text is not None and text != self.text
+        is_x_changed = x is not None and x != self.x
+        is_y_changed = y is not None and y != self.y
+
+        if not (is_text_changed or is_x_changed or is_y_changed):
+            return
+
+        self._screen.is_dirty = True
+
+        if is_text_changed:
             self.text = text
 
-        if x is not None:
+        if is_x_changed:
             self.x = x
 
-        if y is not None:
+        if is_y_changed:
             self.y = y
 
     def clear(self):
         self.update(text="")
 
 
-class ScreenListSelect(ListSelect):
-    def __init__(self):
-        super().__init__(
-            items=("",), visible_items_count=2, cursor_char="> ", x=0, y=16
-        )
+class Button:
+    def __init__(self, pin):
+        btn_pin = digitalio.DigitalInOut(pin)
+        btn_pin.direction = digitalio.Direction.INPUT
+        btn_pin.pull = digitalio.Pull.UP
 
-    def update(self, items=None):
-        if items is not None:
-            self.items = items
-            self._refresh_label()
+        self._debouncer = Debouncer(btn_pin, interval=0.05)
+        self._fell = False
+        self._rose = False
+
+    @property
+    def fell(self):
+        return self._fell
+
+    @property
+    def rose(self):
+        return self._rose
+
+    @property
+    def value(self):
+        return self._debouncer.value
+
+    def poll(self):
+        self._debouncer.update()
+
+        # Latch edges until the next tick has seen them
+        if self._debouncer.fell:
+            self._fell = True
+            return True
+
+        if self._debouncer.rose:
+            self._rose = True
+            return True
+
+        return False
 
     def clear(self):
-        self.update(items=())
+        self._fell = False
+        self._rose = False
 
 
 class SerialRecvData:
@@ -92,26 +169,186 @@ class SerialRecvData:
         self._err = None
 
 
+_FRAME_START = ord(frames.START)
+
+
+class LineBuffer:
+    # Assembles input into lines across reads, in a fixed ring of bytes so
+    # nothing is allocated until a whole line is taken out. Only printable
+    # ASCII and the frame start are kept. Lines end at "\r", "\n" or both,
+    # one too long for the ring is cut short and the rest of it dropped
+
+    def __init__(self, size=512):
+        self._ring = bytearray(size)
+        self._line = bytearray(size)
+        self._head = 0
+        self._count = 0
+
+        # Bytes of the line not ended yet, which aren't in _count, and the
+        # last character fed
+        self._partial = 0
+        self._last = 0
+
+        # Complete lines waiting in the ring
+        self.lines = 0
+        self.cut_lines = 0
+        self._is_cut = False
+
+    @property
+    def free(self):
+        # Feeding more than this could drop input, leave it in stdin instead
+        return len(self._ring) - self._count - self._partial
+
+    def feed(self, text):
+        ring = self._ring
+        size = len(ring)
+        head = self._head
+        partial = self._partial
+        last = self._last
+
+        for c in text:
+            byte = ord(c)
+
+            if 0x20 <= byte <= 0x7E or byte == _FRAME_START:
+                if partial < size - 1:
+                    ring[head] = byte
+                    head += 1
+                    partial += 1
+
+                    if head == size:
+                        head = 0
+                elif not self._is_cut:
+                    # Keep the last slot for the newline
+                    self._is_cut = True
+                    self.cut_lines += 1
+            elif byte == 0x0A and last == 0x0D:
+                # The rest of a "\r\n"
+                pass
+            elif byte == 0x0A or byte == 0x0D:
+                ring[head] = 0x0A
+                head += 1
+
+                if head == size:
+                    head = 0
+
+                self._count += partial + 1
+                self.lines += 1
+                partial = 0
+                self._is_cut = False
+
+            last = byte
+
+        self._head = head
+        self._partial = partial
+        self._last = last
+
+    def readline(self):
+        # The oldest complete line without its ending, or None
+        if not self.lines:
+            return None
+
+        ring = self._ring
+        size = len(ring)
+        start = (self._head - self._partial - self._count) % size
+        index = start
+
+        while ring[index] != 0x0A:
+            index += 1
+
+            if index == size:
+                index = 0
+
+        self._count -= (index - start) % size + 1
+        self.lines -= 1
+
+        if index >= start:
+            line = memoryview(ring)[start:index]
+        else:
+            # Wraps round, join the two ends
+            length = size - start
+            self._line[0:length] = memoryview(ring)[start:]
+            self._line[length : length + index] = memoryview(ring)[0:index]
+            line = memoryview(self._line)[0 : length + index]
+
+        return str(line, "ascii")
+
+
 class Serial:
     def __init__(self):
         self.state_tag = ""
         self._recv_type = None
         self._data = SerialRecvData()
+        self._commands = {}
+
+        # Framed requests from host tools by type, see frames.py
+        self._requests = {
+            frames.PING: self._request_ping,
+            frames.COMMAND: self._request_command,
+        }
+        self._lines = LineBuffer()
+        # Lines printed while running a framed command, for its reply
+        self._captured = None
+        # Of the frame being handled, for anything sent about it later
+        self.request_id = 0
+
+        self.frames_received = 0
+        self.frame_errors = 0
+
+    def _handle_frame(self, text):
+        frame = frames.decode(text)
+
+        if frame is None:
+            # Too corrupt to trust its request ID
+            self.frame_errors += 1
+            self.send_frame(
+                frames.ERROR, 0, bytes((frames.STATUS_BAD_FRAME,))
+            )
+            return
 
-    @property
-    def _recv_bytes(self):
-        # Check how many bytes are available
-        num_bytes = runtime.serial_bytes_available
+        kind, request_id, payload = frame
+        self.frames_received += 1
+        callback = self._requests.get(kind)
 
-        if num_bytes > 0:
-            # Read data if there are some bytes available
-            input_bytes = stdin.read(num_bytes)
-            # Allow only printable ASCII characters
-            return "".join(
-                c for c in input_bytes if ord(" ") <= ord(c) <= ord("~")
-            )
+        if callback is None:
+            status, reply = frames.STATUS_UNKNOWN_TYPE, b""
+        else:
+            self.request_id = request_id
+            status, reply = callback(payload)
 
-        return None
+        self.send_frame(
+            kind | frames.REPLY, request_id, bytes((status,)) + reply
+        )
+
+    def _request_ping(self, payload):
+        return frames.STATUS_OK, payload
+
+    def _request_command(self, payload):
+        # Runs a "!" command, its output goes back in the reply instead of
+        # to the console
+        try:
+            command = str(payload, "ascii")
+        except UnicodeError:
+            return frames.STATUS_BAD_REQUEST, b""
+
+        self._captured = []
+
+        try:
+            self._run_command(command)
+            lines = self._captured
+        finally:
+            self._captured = None
+
+        return frames.STATUS_OK, "\n".join(lines).encode()
+
+    def add_request(self, kind, callback):
+        # callback takes the payload and returns (status, reply payload)
+        self._requests[kind] = callback
+
+    def send_frame(self, kind, request_id, payload=b""):
+        if not runtime.serial_connected:
+            return
+
+        print(frames.encode(kind, request_id, payload), end="")
 
     @property
     def data(self):
@@ -144,7 +381,26 @@ class Serial:
 
         self._data.update(num=num)
 
+    def _run_command(self, data):
+        # Commands look like "!name [arg]" and can be sent at any prompt
+        parts = data.split(None, 1)
+        name = parts[0] if parts else ""
+        arg = parts[1] if len(parts) > 1 else ""
+
+        if name not in self._commands:
+            self.send_line(f"Unknown command !{name}", is_tagged=False)
+            return
+
+        self._commands[name](arg)
+
+    def add_command(self, name, callback):
+        self._commands[name] = callback
+
     def send_line(self, message, is_tagged=True, **kwargs):
+        if self._captured is not None:
+            self._captured.append(message)
+            return
+
         if not runtime.serial_connected:
             return
 
@@ -161,143 +417,1069 @@ class Serial:
         self.send_line(message, end="", **kwargs)
         self._recv_type = bool
 
-    def send_question_int(self, message, **kwargs):
-        message += ": "
+    def send_question_int(self, message, **kwargs):
+        message += ": "
+
+        self.send_line(message, end="", **kwargs)
+        self._recv_type = int
+
+    def send_question_try_again(self, message, **kwargs):
+        message += ", try again"
+
+        if self._recv_type == int:
+            self.send_question_int(message, **kwargs)
+        else:
+            self.send_question_bool(message, **kwargs)
+
+    def send_answer_if_no_recv(self, data):
+        if self._data.is_set:
+            return
+
+        if self._recv_type == bool:
+            self.send_line("y" if data else "n", is_tagged=False)
+        else:
+            self.send_line(data, is_tagged=False)
+
+        self._recv_type = None
+
+    @property
+    def has_lines(self):
+        return self._lines.lines > 0
+
+    @property
+    def cut_lines(self):
+        return self._lines.cut_lines
+
+    def update(self):
+        num_bytes = min(runtime.serial_bytes_available, self._lines.free)
+
+        if num_bytes > 0:
+            self._lines.feed(stdin.read(num_bytes))
+
+        while True:
+            data = self._lines.readline()
+
+            if data is None:
+                return
+
+            if data.startswith(frames.START):
+                self._handle_frame(data[1:])
+                continue
+
+            if data.startswith("!"):
+                self._run_command(data[1:])
+                continue
+
+            self._data.clear()
+
+            if self._recv_type == bool:
+                self._recv_answer_bool(data)
+            elif self._recv_type == int:
+                self._recv_answer_int(data)
+            else:
+                # Ignore arbitrary data typed into serial
+                continue
+
+            if self._data.err:
+                self.send_question_try_again(self._data.err)
+            else:
+                self._recv_type = None
+
+            # One answer a tick, the state has to act on it before the
+            # next one is read
+            return
+
+
+class StateProfiler:
+    ENTER = 0
+    UPDATE = 1
+
+    def __init__(self, size=64, stall_ms=50):
+        self.stall_us = stall_ms * 1000
+
+        # Most recent samples, overwritten oldest first
+        self._ring_tags = [None] * size
+        self._ring_kinds = bytearray(size)
+        self._ring_us = array("L", [0] * size)
+        self._ring_head = 0
+
+        # Boot phases as (name, us) pairs, kept across resets
+        self._phases = []
+
+        self.reset()
+
+    def reset(self):
+        # Per state: enter count, total us, max us, then the same for update
+        self._totals = {}
+        self._worst_tag = None
+        self._worst_kind = self.ENTER
+        self._worst_us = 0
+
+        self._ticks = 0
+        self._window_ticks = 0
+        self._window_start = monotonic_ns()
+        self.tps = 0
+
+        for i in range(len(self._ring_tags)):
+            self._ring_tags[i] = None
+
+    def record(self, tag, kind, duration_ns):
+        duration_us = duration_ns // 1000
+
+        totals = self._totals.get(tag)
+
+        if totals is None:
+            totals = [0, 0, 0, 0, 0, 0]
+            self._totals[tag] = totals
+
+        offset = kind * 3
+        totals[offset] += 1
+        totals[offset + 1] += duration_us
+
+        if duration_us > totals[offset + 2]:
+            totals[offset + 2] = duration_us
+
+        if duration_us > self._worst_us:
+            self._worst_tag = tag
+            self._worst_kind = kind
+            self._worst_us = duration_us
+
+        head = self._ring_head
+        self._ring_tags[head] = tag
+        self._ring_kinds[head] = kind
+        self._ring_us[head] = min(duration_us, 0xFFFFFFFF)
+        self._ring_head = (head + 1) % len(self._ring_tags)
+
+    def record_phase(self, name, duration_ns):
+        self._phases.append((name, duration_ns // 1000))
+
+    def tick(self):
+        self._ticks += 1
+        self._window_ticks += 1
+
+        # Refresh the tick rate about once a second
+        now = monotonic_ns()
+        elapsed = now - self._window_start
+
+        if elapsed >= 1000000000:
+            self.tps = self._window_ticks * 1000000000 / elapsed
+            self._window_ticks = 0
+            self._window_start = now
+
+    def _kind_name(self, kind):
+        return "enter" if kind == self.ENTER else "update"
+
+    def summary(self):
+        lines = []
+
+        worst = "none"
+        if self._worst_tag is not None:
+            worst = (
+                f"{self._worst_tag}.{self._kind_name(self._worst_kind)}"
+                + f" {self._worst_us / 1000:.1f}ms"
+            )
+
+        lines.append(f"tps {self.tps:.1f} ticks {self._ticks} worst {worst}")
+
+        if self._phases:
+            line = "boot"
+
+            for name, duration_us in self._phases:
+                line += f" {name} {duration_us / 1000:.1f}"
+
+            lines.append(line)
+
+        for tag, totals in self._totals.items():
+            line = tag
+
+            for kind in (self.ENTER, self.UPDATE):
+                count, total_us, max_us = totals[kind * 3 : kind * 3 + 3]
+
+                if count:
+                    line += (
+                        f" {self._kind_name(kind)} {count}x"
+                        + f" avg {total_us / count / 1000:.1f}"
+                        + f" max {max_us / 1000:.1f}"
+                    )
+
+            lines.append(line)
+
+        # Recent samples that went over the stall threshold, oldest first
+        size = len(self._ring_tags)
+
+        for i in range(size):
+            index = (self._ring_head + i) % size
+            tag = self._ring_tags[index]
+
+            if tag is not None and self._ring_us[index] >= self.stall_us:
+                lines.append(
+                    f"stall {tag}.{self._kind_name(self._ring_kinds[index])}"
+                    + f" {self._ring_us[index] / 1000:.1f}ms"
+                )
+
+        return lines
+
+
+class BusScheduler:
+    # The display and an I2C PN532 share one bus. Transfers never overlap,
+    # everything runs on one asyncio loop, but a display push holds up a
+    # badge that is waiting to be read, and a blocking wait for the PN532
+    # holds up the UI. So the PN532 is only read once it has a frame ready,
+    # and display pushes give way to it for up to max_defer_ms.
+    PN532_ADDRESS = 0x24
+
+    def __init__(self, max_defer_ms=100):
+        self.max_defer_ns = max_defer_ms * 1000000
+
+        self._i2c = None
+        self._uart = None
+        self._status = bytearray(1)
+        self._deferred_at = None
+
+        self.reset_stats()
+
+    def attach_i2c(self, i2c):
+        self._i2c = i2c
+
+    def attach_uart(self, uart):
+        self._uart = uart
+
+    def reset_stats(self):
+        self.nfc_waits = 0
+        self.nfc_wait_ns = 0
+        self.display_defers = 0
+        self.display_wait_ns = 0
+
+    def is_nfc_ready(self):
+        # Whether the PN532 has a frame for us, without blocking. None when
+        # the transport can't tell, SPI needs the driver's own status read
+        if self._uart is not None:
+            return self._uart.in_waiting > 0
+
+        if self._i2c is None:
+            return None
+
+        if not self._i2c.try_lock():
+            return False
+
+        # The first byte of every read is the PN532 status, 0x01 when ready
+        try:
+            self._i2c.readfrom_into(self.PN532_ADDRESS, self._status)
+        except OSError:
+            return False
+        finally:
+            self._i2c.unlock()
+
+        return self._status[0] == 0x01
+
+    def should_defer_display(self):
+        now = monotonic_ns()
+
+        if self.is_nfc_ready():
+            if self._deferred_at is None:
+                self._deferred_at = now
+                self.display_defers += 1
+
+            if now - self._deferred_at < self.max_defer_ns:
+                return True
+
+        # Nothing waiting, or the UI waited long enough
+        self.end_display_defer()
+
+        return False
+
+    def end_display_defer(self):
+        # The deferred push went out, here or from a state's own refresh
+        if self._deferred_at is not None:
+            self.display_wait_ns += monotonic_ns() - self._deferred_at
+            self._deferred_at = None
+
+    def record_nfc_wait(self, wait_ns):
+        self.nfc_waits += 1
+        self.nfc_wait_ns += wait_ns
+
+    def summary(self):
+        nfc_ms = self.nfc_wait_ns / 1000000
+        display_ms = self.display_wait_ns / 1000000
+
+        return (
+            f"bus nfc waits {self.nfc_waits} total {nfc_ms:.1f}"
+            + f" display defers {self.display_defers} total {display_ms:.1f}"
+        )
+
+
+class WriteQueue:
+    # Badge IDs waiting to be written by BadgeProvisionState, in order. Kept
+    # as runs of consecutive IDs, each with the request ID of the frame that
+    # queued it (0 if typed), so a batch of hundreds takes one slot
+    def __init__(self, size=32):
+        self._firsts = array("H", [0] * size)
+        self._counts = array("H", [0] * size)
+        self._request_ids = array("H", [0] * size)
+        self._head = 0
+        self._runs = 0
+
+        # IDs waiting over all runs
+        self.length = 0
+
+    @property
+    def free_runs(self):
+        return len(self._firsts) - self._runs
+
+    def add(self, first, count, request_id=0):
+        if not self.free_runs:
+            return False
+
+        tail = (self._head + self._runs) % len(self._firsts)
+        self._firsts[tail] = first
+        self._counts[tail] = count
+        self._request_ids[tail] = request_id
+        self._runs += 1
+        self.length += count
+
+        return True
+
+    def peek(self):
+        # (badge ID, request ID) of the next write, or None
+        if not self._runs:
+            return None
+
+        return self._firsts[self._head], self._request_ids[self._head]
+
+    def pop(self):
+        head = self._head
+        self._firsts[head] += 1
+        self._counts[head] -= 1
+        self.length -= 1
+
+        if not self._counts[head]:
+            self._head = (head + 1) % len(self._firsts)
+            self._runs -= 1
+
+    def clear(self):
+        self._runs = 0
+        self.length = 0
+
+
+class SavedBadgeId:
+    # The last badge ID written, kept in the first bytes of nvm (in front of
+    # the redemptions) so provisioning carries on from it after a reset.
+    # Stored with its complement, blank or torn bytes read as nothing saved
+    SIZE = 4
+
+    def __init__(self, storage):
+        self._storage = storage
+        self.badge_id = 0
+
+    def load(self):
+        data = bytes(self._storage[0 : self.SIZE])
+        badge_id = int.from_bytes(data[0:2])
+
+        if badge_id ^ int.from_bytes(data[2:4]) == 0xFFFF:
+            self.badge_id = badge_id
+
+        return self.badge_id
+
+    def save(self, badge_id):
+        # One nvm write per new ID, repeats of the same one are skipped
+        if badge_id == self.badge_id:
+            return
+
+        self.badge_id = badge_id
+        check = badge_id ^ 0xFFFF
+        self._storage[0 : self.SIZE] = badge_id.to_bytes(2) + check.to_bytes(2)
+
+
+class State:
+    tag = "_state"
+    # Keep ticking every tick budget instead of only on input events
+    continuous = False
+    # Keep the PN532 listening for a badge while this state is active
+    nfc_listen = False
+
+    def __init__(self):
+        pass
+
+    def load(self, machine):
+        # Import heavy dependencies here, this only runs on the first visit
+        pass
+
+    def enter(self, machine, state_tag):
+        machine.serial.state_tag = state_tag
+
+    def leave(self, machine):
+        pass
+
+    def update(self, machine):
+        pass
+
+
+class StateMachine:
+    def __init__(
+        self,
+        poll_interval=0.01,
+        tick_budget=0.05,
+        idle_sleep=1.0,
+        flush_interval=1.0,
+    ):
+        self.state = None
+        self.states = {}
+        self.state_classes = {}
+        self.state_heap = {}
+
+        # Scheduler timings, in seconds
+        self.poll_interval = poll_interval
+        self.tick_budget = tick_budget
+        self.idle_sleep = idle_sleep
+        self.flush_interval = flush_interval
+        self._wake = asyncio.Event()
+
+        self.profiler = StateProfiler()
+        self.bus = BusScheduler()
+
+        self.serial = Serial()
+
+        self.ctx = None
+        self.screen = Screen()
+        self.label_title = ScreenLabel(self.screen)
+        self.label_body_top = ScreenLabel(self.screen)
+        self.label_body_bottom = ScreenLabel(self.screen)
+        self.body_layer = displayio.Group()
+        self.menu = None
+        self.label_btn_a = ScreenLabel(self.screen)
+        self.label_btn_b = ScreenLabel(self.screen)
+        self.label_btn_c = ScreenLabel(self.screen)
+        self.pn532 = None
+        # How the PN532 is wired, e.g. "i2c 100kHz", see InitState
+        self.nfc_transport = None
+        # Page cache of the tag in the field, see ntag.py
+        self.tag_pages = None
+        # Which badges claimed food in which meal session, see redemptions.py
+        self.redemptions = None
+        self.btn_a = None
+        self.btn_b = None
+        self.btn_c = None
+        # Badges the poll task found this tick, as (target number, UID)
+        # pairs, and the UID of the first one
+        self.nfc_targets = ()
+        self.nfc_uid = None
+        self.nfc_uid_at = 0
+        self.max_nfc_targets = 2
+
+        # Carried over resets through saved_badge_id once InitState loads it
+        self.last_written_badge_id = 0
+        self.saved_badge_id = None
+        # Badge IDs queued from serial for BadgeProvisionState to write
+        self.write_queue = WriteQueue()
+
+        self.serial.add_command("stats", self._send_stats)
+        self.serial.add_command("heap", self._send_heap)
+        self.serial.add_command("bench", self._send_bench)
+        self.serial.add_command("session", self._send_session)
+        self.serial.add_command("nfcbench", self._send_nfc_bench)
+        self.serial.add_command("queue", self._send_queue)
+        self.serial.add_request(frames.READ_BADGE, self._request_read_badge)
+        self.serial.add_request(frames.WRITE_BADGE, self._request_write_badge)
+        self.serial.add_request(
+            frames.QUEUE_WRITES, self._request_queue_writes
+        )
+
+    def add_state(self, state_class):
+        self.state_classes[state_class.tag] = state_class
+
+    def _build_state(self, state_name):
+        gc.collect()
+        mem_free = gc.mem_free()
+
+        state = self.state_classes[state_name]()
+        state.load(self)
+
+        gc.collect()
+        self.state_heap[state_name] = mem_free - gc.mem_free()
+        self.states[state_name] = state
+
+        return state
+
+    def go_to_state(self, state_name, **kwargs):
+        if self.state:
+            self.state.leave(self)
+
+        # States are only built the first time they are visited
+        self.state = self.states.get(state_name)
+
+        if self.state is None:
+            self.state = self._build_state(state_name)
+
+        started = monotonic_ns()
+        self.state.enter(self, **kwargs)
+        self.profiler.record(
+            state_name, StateProfiler.ENTER, monotonic_ns() - started
+        )
+
+    def wake(self):
+        self._wake.set()
+
+    def _send_stats(self, arg):
+        if arg == "reset":
+            self.profiler.reset()
+            self.screen.reset_stats()
+            self.bus.reset_stats()
+            self.serial.send_line("stats: reset", is_tagged=False)
+            return
+
+        for line in self.profiler.summary():
+            self.serial.send_line(f"stats: {line}", is_tagged=False)
+
+        self.serial.send_line(
+            f"stats: {self.screen.summary()}", is_tagged=False
+        )
+        self.serial.send_line(f"stats: {self.bus.summary()}", is_tagged=False)
+        self.serial.send_line(
+            f"stats: serial frames {self.serial.frames_received}"
+            + f" errors {self.serial.frame_errors}"
+            + f" cut lines {self.serial.cut_lines}",
+            is_tagged=False,
+        )
+
+    def _select_badge(self):
+        # UID of the badge on the reader for a framed request, or the status
+        # to reply with if there is none to be had
+        if self.pn532 is None or (self.state and self.state.nfc_listen):
+            # Not up yet, or the poll task is talking to the reader
+            return None, frames.STATUS_BUSY
+
+        uid = self.pn532.read_passive_target(timeout=0.5)
+
+        if uid is None:
+            return None, frames.STATUS_NO_BADGE
+
+        self.tag_pages.select(uid)
+
+        return uid, frames.STATUS_OK
+
+    def _request_read_badge(self, payload):
+        # Reply: badge ID (4 bytes), then the UID
+        uid, status = self._select_badge()
+
+        if uid is None:
+            return status, b""
+
+        badge_id_bytes = self.tag_pages.read(0x04)
+
+        if badge_id_bytes is None:
+            return frames.STATUS_READ_FAILED, uid
+
+        return frames.STATUS_OK, badge_id_bytes + uid
+
+    def _request_write_badge(self, payload):
+        # Request: badge ID (4 bytes). Reply: the badge ID it replaced, then
+        # the UID
+        if len(payload) != 4 or int.from_bytes(payload) > 9999:
+            return frames.STATUS_BAD_REQUEST, b""
+
+        uid, status = self._select_badge()
+
+        if uid is None:
+            return status, b""
+
+        old_badge_id_bytes = self.tag_pages.write_verified(0x04, payload)
+
+        if old_badge_id_bytes is None:
+            return frames.STATUS_WRITE_FAILED, uid
+
+        self.set_last_written(int.from_bytes(payload))
+
+        return frames.STATUS_OK, old_badge_id_bytes + uid
+
+    def set_last_written(self, badge_id):
+        self.last_written_badge_id = badge_id
+
+        if self.saved_badge_id is not None:
+            self.saved_badge_id.save(badge_id)
+
+    def _send_heap(self, arg):
+        gc.collect()
+        self.serial.send_line(
+            f"heap: free {gc.mem_free()} used {gc.mem_alloc()}",
+            is_tagged=False,
+        )
+
+        for tag, used in self.state_heap.items():
+            self.serial.send_line(f"heap: {tag} {used}", is_tagged=False)
+
+    def _send_session(self, arg):
+        redemptions = self.redemptions
+
+        if redemptions is None:
+            self.serial.send_line("session: not loaded", is_tagged=False)
+            return
+
+        if arg == "clear":
+            redemptions.clear_session()
+        elif arg:
+            try:
+                redemptions.set_session(int(arg) - 1)
+            except ValueError:
+                self.serial.send_line(
+                    f"session: pick 1 to {redemptions.sessions}",
+                    is_tagged=False,
+                )
+                return
+
+        if redemptions.is_persistent:
+            storage = (
+                f"journal {redemptions.journal_count}"
+                + f"/{redemptions.journal_capacity}"
+            )
+        else:
+            storage = "ram only"
+
+        self.serial.send_line(
+            f"session: {redemptions.session + 1} of {redemptions.sessions}"
+            + f" served {redemptions.count()} ({storage})",
+            is_tagged=False,
+        )
+
+    def _queue_writes(self, runs, request_id=0):
+        # Queues (first badge ID, count) runs, all or none of them. Runs
+        # the queue straight away from the menu, nobody is there to pick
+        # provisioning
+        for first, count in runs:
+            if count < 1 or first < 1 or first + count - 1 > 9999:
+                return frames.STATUS_BAD_REQUEST
+
+        if len(runs) > self.write_queue.free_runs:
+            return frames.STATUS_QUEUE_FULL
+
+        for first, count in runs:
+            self.write_queue.add(first, count, request_id)
+
+        if self.state and self.state.tag == MenuState.tag:
+            self.go_to_state(BadgeProvisionState.tag)
+        elif self.state and self.state.tag == BadgeProvisionState.tag:
+            self.state.show_next(self)
+
+        return frames.STATUS_OK
+
+    def _request_queue_writes(self, payload):
+        # Request: runs of (first badge ID, count), 2 bytes each. Reply: how
+        # many IDs are waiting, 2 bytes. WRITE_DONE follows for each badge
+        if not payload or len(payload) % 4:
+            return frames.STATUS_BAD_REQUEST, b""
+
+        runs = []
+
+        for i in range(0, len(payload), 4):
+            runs.append(
+                (
+                    payload[i] << 8 | payload[i + 1],
+                    payload[i + 2] << 8 | payload[i + 3],
+                )
+            )
+
+        status = self._queue_writes(runs, self.serial.request_id)
+
+        return status, self.write_queue.length.to_bytes(2, "big")
+
+    def _send_queue(self, arg):
+        # "!queue 1200-1699 1800", "!queue clear", or just "!queue"
+        queue = self.write_queue
+
+        if arg == "clear":
+            queue.clear()
+        elif arg:
+            runs = []
+            status = frames.STATUS_BAD_REQUEST
+
+            try:
+                for part in arg.split():
+                    first, _, last = part.partition("-")
+                    first = int(first)
+                    last = int(last) if last else first
+                    runs.append((first, last - first + 1))
+            except ValueError:
+                runs = None
+
+            if runs is not None:
+                status = self._queue_writes(runs)
+
+            if status == frames.STATUS_BAD_REQUEST:
+                self.serial.send_line(
+                    "queue: IDs go from 1 to 9999, like 1200-1699",
+                    is_tagged=False,
+                )
+                return
+
+            if status == frames.STATUS_QUEUE_FULL:
+                self.serial.send_line(
+                    f"queue: full, room for {queue.free_runs} more ranges",
+                    is_tagged=False,
+                )
+                return
+
+        next_write = queue.peek()
+        next_text = f", next {next_write[0]}" if next_write else ""
+
+        self.serial.send_line(
+            f"queue: {queue.length} waiting{next_text}", is_tagged=False
+        )
+
+    def update(self):
+        self.profiler.tick()
+        self.serial.update()
+
+        if self.state:
+            state = self.state
+            started = monotonic_ns()
+            state.update(self)
+            self.profiler.record(
+                state.tag, StateProfiler.UPDATE, monotonic_ns() - started
+            )
+
+        # Input events are only reported to the tick that follows them
+        for btn in (self.btn_a, self.btn_b, self.btn_c):
+            if btn:
+                btn.clear()
+
+        self.nfc_targets = ()
+        self.nfc_uid = None
+
+        # A badge the PN532 already has goes first, the screen is still
+        # dirty next tick
+        is_nfc_listening = self.pn532 and self.state and self.state.nfc_listen
+
+        if is_nfc_listening and self.screen.is_dirty:
+            if self.bus.should_defer_display():
+                return
+        else:
+            self.bus.end_display_defer()
+
+        # Push everything this tick changed to the display in one go
+        started = monotonic_ns()
+
+        if self.screen.refresh():
+            self.profiler.record(
+                "screen", StateProfiler.UPDATE, monotonic_ns() - started
+            )
+
+    async def _poll_buttons(self):
+        while True:
+            for btn in (self.btn_a, self.btn_b, self.btn_c):
+                if btn and btn.poll():
+                    self.wake()
+
+            await asyncio.sleep(self.poll_interval)
+
+    async def _poll_serial(self):
+        while True:
+            if runtime.serial_bytes_available > 0 or self.serial.has_lines:
+                self.wake()
+
+            await asyncio.sleep(self.poll_interval)
+
+    async def _poll_nfc(self):
+        is_listening = False
+        is_failing = False
+        poll_interval_ns = int(self.poll_interval * 1000000000)
+
+        while True:
+            slept_at = monotonic_ns()
+            refreshes = self.screen.refreshes
+            await asyncio.sleep(self.poll_interval)
+
+            if not (self.pn532 and self.state and self.state.nfc_listen):
+                is_listening = False
+                continue
+
+            try:
+                if not is_listening:
+                    is_listening = self.tag_pages.listen_for_targets(
+                        self.max_nfc_targets
+                    )
+                    continue
+
+                # Only talk to the PN532 once it has the answer, waiting for
+                # it in the driver would block the whole loop
+                is_ready = self.bus.is_nfc_ready()
+
+                if is_ready is False:
+                    continue
+
+                if is_ready and self.screen.refreshes != refreshes:
+                    # The badge was kept waiting by a display push
+                    late_ns = monotonic_ns() - slept_at - poll_interval_ns
+
+                    if late_ns > 0:
+                        self.bus.record_nfc_wait(late_ns)
+
+                targets = self.tag_pages.get_targets(
+                    timeout=self.poll_interval
+                )
+            except self.tag_pages.ERRORS as e:
+                # A bus glitch mustn't end polling. Logged once until a
+                # badge is read again, a failing bus fails every poll
+                if not is_failing:
+                    self.serial.send_line(f"NFC: poll failed: {e!r}")
+
+                is_failing = True
+                is_listening = False
+                continue
+
+            is_failing = False
+
+            if targets is None:
+                continue
+
+            is_listening = False
+
+            if targets:
+                self.nfc_targets = targets
+                self.nfc_uid = targets[0][1]
+                self.nfc_uid_at = monotonic_ns()
+                self.wake()
+
+    async def _flush_redemptions(self):
+        # Scans only touch memory, their journal records reach flash here in
+        # batches, which keeps flash wear and scan latency down
+        while True:
+            await asyncio.sleep(self.flush_interval)
+
+            redemptions = self.redemptions
+
+            if redemptions is None:
+                continue
+
+            started = monotonic_ns()
+
+            if redemptions.needs_compaction:
+                redemptions.compact()
+            elif not redemptions.flush():
+                continue
+
+            self.profiler.record(
+                "journal", StateProfiler.UPDATE, monotonic_ns() - started
+            )
+
+    async def run(self, state_name):
+        asyncio.create_task(self._poll_buttons())
+        asyncio.create_task(self._poll_serial())
+        asyncio.create_task(self._poll_nfc())
+        asyncio.create_task(self._flush_redemptions())
+
+        self.go_to_state(state_name)
+
+        while True:
+            started = monotonic()
+            self.update()
+
+            # Sleep until an input task wakes us, or until the next tick is due
+            # A display push that gave way to NFC is retried soon too
+            is_continuous = self.state and self.state.continuous
+
+            if is_continuous or self.screen.is_dirty:
+                timeout = self.tick_budget
+            else:
+                timeout = self.idle_sleep
+
+            timeout -= monotonic() - started
+
+            if timeout > 0 and not self._wake.is_set():
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await asyncio.sleep(0)
+
+            self._wake.clear()
 
-        self.send_line(message, end="", **kwargs)
-        self._recv_type = int
+    def add_layer(self, layer):
+        # Layers stay in the display group for good and are only hidden, so
+        # switching between them doesn't reallocate the group
+        layer.hidden = True
+        self.ctx.append(layer)
 
-    def send_question_try_again(self, message, **kwargs):
-        message += ", try again"
+    def _show_layer(self, shown, hidden):
+        started = monotonic_ns()
 
-        if self._recv_type == int:
-            self.send_question_int(message, **kwargs)
-        else:
-            self.send_question_bool(message, **kwargs)
+        if hidden is not None and not hidden.hidden:
+            hidden.hidden = True
+            self.screen.is_dirty = True
 
-    def send_answer_if_no_recv(self, data):
-        if self._data.is_set:
-            return
+        if shown is not None and shown.hidden:
+            shown.hidden = False
+            self.screen.is_dirty = True
 
-        if self._recv_type == bool:
-            self.send_line("y" if data else "n", is_tagged=False)
-        else:
-            self.send_line(data, is_tagged=False)
+        self.profiler.record(
+            "layers", StateProfiler.UPDATE, monotonic_ns() - started
+        )
 
-        self._recv_type = None
+    def set_body_visible(self):
+        self._show_layer(self.body_layer, self.menu)
 
-    def update(self):
-        data = self._recv_bytes
+    def set_menu_visible(self):
+        self._show_layer(self.menu, self.body_layer)
 
-        if data is None:
+    def _send_bench(self, arg):
+        if self.menu is None:
+            self.serial.send_line("bench: menu not loaded", is_tagged=False)
             return
 
-        self._data.clear()
+        try:
+            rounds = int(arg) if arg else 50
+        except ValueError:
+            self.serial.send_line("bench: bad round count", is_tagged=False)
+            return
 
-        if self._recv_type == bool:
-            self._recv_answer_bool(data)
-        elif self._recv_type == int:
-            self._recv_answer_int(data)
-        else:
-            # Ignore arbitrary data typed into serial
-            pass
+        is_menu_visible = not self.menu.hidden
+        total_ns = 0
+        max_ns = 0
 
-        if self._data.err:
-            self.send_question_try_again(self._data.err)
-        else:
-            self._recv_type = None
+        # Time full menu <-> body switches, including the display refresh
+        for _ in range(rounds):
+            for show in (self.set_menu_visible, self.set_body_visible):
+                started = monotonic_ns()
+                show()
+                self.screen.refresh()
+                duration_ns = monotonic_ns() - started
 
+                total_ns += duration_ns
+                max_ns = max(max_ns, duration_ns)
 
-class State:
-    tag = "_state"
+        if is_menu_visible:
+            self.set_menu_visible()
 
-    def __init__(self):
-        pass
+        avg_ms = total_ns / (rounds * 2) / 1000000
 
-    def enter(self, machine, state_tag):
-        machine.serial.state_tag = state_tag
+        self.serial.send_line(
+            f"bench: layers {rounds * 2}x avg {avg_ms:.2f}"
+            + f" max {max_ns / 1000000:.2f}",
+            is_tagged=False,
+        )
 
-    def leave(self, machine):
-        pass
+    def _time_nfc(self, totals, name, call, *args):
+        # totals[name] is [count, total ns, max ns, failures]
+        started = monotonic_ns()
+        result = call(*args)
+        duration_ns = monotonic_ns() - started
 
-    def update(self, machine):
-        machine.btn_a.update()
-        machine.btn_b.update()
-        machine.btn_c.update()
-        machine.serial.update()
+        counts = totals[name]
+        counts[0] += 1
+        counts[1] += duration_ns
+        counts[2] = max(counts[2], duration_ns)
 
+        if result is None or result is False:
+            counts[3] += 1
 
-class StateMachine:
-    def __init__(self):
-        self.state = None
-        self.states = {}
+        return result
 
-        self.serial = Serial()
+    def _send_nfc_bench(self, arg):
+        if self.pn532 is None:
+            self.serial.send_line(
+                "nfcbench: reader not ready", is_tagged=False
+            )
+            return
 
-        self.ctx = None
-        self.label_title = ScreenLabel()
-        self.label_body_top = ScreenLabel()
-        self.label_body_bottom = ScreenLabel()
-        self.menu = ScreenListSelect()
-        self.label_btn_a = ScreenLabel()
-        self.label_btn_b = ScreenLabel()
-        self.label_btn_c = ScreenLabel()
-        self.pn532 = None
-        self.btn_a = None
-        self.btn_b = None
-        self.btn_c = None
+        if self.state and self.state.nfc_listen:
+            # The poll task would be talking to the reader at the same time
+            self.serial.send_line(
+                "nfcbench: leave the scan screen first", is_tagged=False
+            )
+            return
 
-        self.last_written_badge_id = 0
+        try:
+            rounds = int(arg) if arg else 20
+        except ValueError:
+            self.serial.send_line("nfcbench: bad round count", is_tagged=False)
+            return
 
-    def add_state(self, state):
-        self.states[state.tag] = state
+        pn532 = self.pn532
+        tag_pages = self.tag_pages
+        totals = {
+            "detect": [0, 0, 0, 0],
+            "read": [0, 0, 0, 0],
+            "write": [0, 0, 0, 0],
+        }
+
+        # Round trips with the badge left on the reader. Writes put back
+        # what was read, so the badge keeps its ID
+        for _ in range(rounds):
+            uid = self._time_nfc(
+                totals, "detect", pn532.read_passive_target, 0x00, 0.5
+            )
 
-    def go_to_state(self, state_name, **kwargs):
-        if self.state:
-            self.state.leave(self)
+            if uid is None:
+                continue
 
-        self.state = self.states[state_name]
-        self.state.enter(self, **kwargs)
+            tag_pages.select(uid)
+            data = self._time_nfc(
+                totals, "read", tag_pages.read, 0x04, 1, True
+            )
 
-    def update(self):
-        if self.state:
-            self.state.update(self)
+            if data is not None:
+                self._time_nfc(totals, "write", tag_pages.write, 0x04, data)
 
-    def set_body_visible(self):
-        if self.ctx:
-            self.ctx.pop()
-            self.ctx.append(self.label_body_top)
-            self.ctx.append(self.label_body_bottom)
+        if totals["detect"][0] == totals["detect"][3]:
+            self.serial.send_line(
+                "nfcbench: no badge on the reader", is_tagged=False
+            )
+            return
 
-    def set_menu_visible(self):
-        if self.ctx:
-            self.ctx.pop()
-            self.ctx.pop()
-            self.ctx.append(self.menu)
-            self.label_body_top.clear()
-            self.label_body_bottom.clear()
+        for name, (count, total_ns, max_ns, failures) in totals.items():
+            if not count:
+                continue
+
+            self.serial.send_line(
+                f"nfcbench: {self.nfc_transport} {name} {count}x"
+                + f" avg {total_ns / count / 1000000:.2f}"
+                + f" max {max_ns / 1000000:.2f} failed {failures}",
+                is_tagged=False,
+            )
 
 
 class InitState(State):
     tag = "init"
+    continuous = True
 
-    def __init__(self):
-        pass
+    def __init__(self, splash_time=3):
+        self.pn532_args = None
+        self.transport = None
+        self.i2c_frequency = 100000
+        self.redemptions_class = None
+        self.splash_time = splash_time
+        self.started = 0
+
+    def load(self, machine):
+        from redemptions import Redemptions
+
+        # How the PN532 is wired is set in settings.toml
+        self.transport = getenv("PN532_TRANSPORT", "i2c").lower()
+
+        if self.transport not in ("i2c", "spi", "uart"):
+            print(f"Unknown PN532_TRANSPORT {self.transport}, using i2c")
+            self.transport = "i2c"
+
+        self.redemptions_class = Redemptions
 
     def enter(self, machine):
         super().enter(machine, self.tag)
 
+        self.started = monotonic_ns()
+
         # Release any resources currently in use for the displays
         displayio.release_displays()
 
-        # Set up I2C communication
-        i2c = board.I2C()
+        # Set up I2C communication, the display shares the bus with the
+        # PN532 when that is on I2C too
+        self.i2c_frequency = getenv("PN532_I2C_FREQUENCY", 100000)
+        i2c = busio.I2C(board.SCL, board.SDA, frequency=self.i2c_frequency)
         display_bus = I2CDisplayBus(i2c, device_address=0x3C)
         display = SSD1306(display_bus, width=128, height=64)
 
         # Make the display context
         machine.ctx = displayio.Group()
         display.root_group = machine.ctx
+        machine.screen.attach(display)
 
         # Create title label
         machine.label_title.update(text="HnR'26 NFC controller")
@@ -313,53 +1495,161 @@ class InitState(State):
         machine.label_btn_c.update(y=56)
         machine.ctx.append(machine.label_btn_c)
 
-         
-        
-        # Connect to PN532 NFC module
-        
-        machine.label_body_top.update(text="I coloured my badge\nand all I got was \nthis lousy PCB", y=24)
-        machine.ctx.append(machine.label_body_top)
-        sleep(3)
-        #machine.label_body_top.update(text="Loading...", y=24)
-        
+        # Show the splash while everything else comes up
+        machine.label_body_top.update(
+            text="I coloured my badge\nand all I got was \nthis lousy PCB",
+            y=24,
+        )
+        machine.body_layer.append(machine.label_body_top)
+
         machine.label_body_bottom.update(y=36)
-        machine.ctx.append(machine.label_body_bottom)
+        machine.body_layer.append(machine.label_body_bottom)
+
+        machine.ctx.append(machine.body_layer)
+
+        machine.profiler.record_phase(
+            "display", monotonic_ns() - self.started
+        )
+
+        # Set up buttons
+        phase_started = monotonic_ns()
+
+        machine.btn_a = Button(board.D7)
+        machine.btn_b = Button(board.D9)
+        machine.btn_c = Button(board.D8)
+
+        machine.profiler.record_phase(
+            "buttons", monotonic_ns() - phase_started
+        )
+
+        # Load who already ate and where provisioning got to, both have to
+        # survive resets
+        phase_started = monotonic_ns()
+
+        machine.saved_badge_id = SavedBadgeId(microcontroller.nvm)
+        machine.last_written_badge_id = machine.saved_badge_id.load()
+        machine.redemptions = self.redemptions_class(
+            microcontroller.nvm, offset=SavedBadgeId.SIZE
+        )
+        machine.redemptions.load()
+
+        machine.profiler.record_phase(
+            "redemptions", monotonic_ns() - phase_started
+        )
+
+        # Connect to PN532 NFC module in the background, the menu is usable
+        # without it
+        self.pn532_args = self._open_nfc_bus(machine, i2c)
+        asyncio.create_task(self._connect_nfc(machine))
+
+    def _open_nfc_bus(self, machine, i2c):
+        # Pins are board pin names, any free GPIO works on the ESP32-C3
+        if self.transport == "spi":
+            spi = busio.SPI(
+                getattr(board, getenv("PN532_SCK", "D1")),
+                MOSI=getattr(board, getenv("PN532_MOSI", "D10")),
+                MISO=getattr(board, getenv("PN532_MISO", "D2")),
+            )
+            cs = digitalio.DigitalInOut(
+                getattr(board, getenv("PN532_CS", "D3"))
+            )
+            machine.nfc_transport = "spi"
+
+            return (spi, cs)
+
+        if self.transport == "uart":
+            baudrate = getenv("PN532_UART_BAUDRATE", 115200)
+            uart = busio.UART(
+                getattr(board, getenv("PN532_TX", "D6")),
+                getattr(board, getenv("PN532_RX", "D0")),
+                baudrate=baudrate,
+                timeout=0.1,
+            )
+            machine.nfc_transport = f"uart {baudrate}"
+            machine.bus.attach_uart(uart)
+
+            return (uart,)
+
+        machine.nfc_transport = f"i2c {self.i2c_frequency // 1000}kHz"
+        machine.bus.attach_i2c(i2c)
+
+        return (i2c,)
+
+    def _import_nfc(self):
+        # Only the driver for the configured transport is imported, after
+        # the splash is on screen
+        if self.transport == "spi":
+            from adafruit_pn532.spi import PN532_SPI
+
+            return PN532_SPI
+
+        if self.transport == "uart":
+            from adafruit_pn532.uart import PN532_UART
+
+            return PN532_UART
+
+        from adafruit_pn532.I2C import PN532_I2C
+
+        return PN532_I2C
+
+    async def _connect_nfc(self, machine):
+        # First runs once the main loop has pushed the splash to the display,
+        # so the driver imports don't hold up the first frame
+        phase_started = monotonic_ns()
+        pn532_class = self._import_nfc()
+
+        from ntag import NtagPages
+
+        machine.profiler.record_phase(
+            "nfc_import", monotonic_ns() - phase_started
+        )
+        phase_started = monotonic_ns()
 
         while True:
             try:
-                machine.pn532 = PN532_I2C(i2c)
+                pn532 = pn532_class(*self.pn532_args)
             except (ValueError, RuntimeError):
                 print("Cannot connect to PN532 NFC, trying again...")
-                sleep(1)
+                await asyncio.sleep(1)
             else:
                 break
 
-        # Configure PN532 to communicate with MiFare cards
-        machine.pn532.SAM_configuration()
-
-        # Set up buttons
-        btn_a_pin = digitalio.DigitalInOut(board.D7)
-        btn_a_pin.direction = digitalio.Direction.INPUT
-        btn_a_pin.pull = digitalio.Pull.UP
-        machine.btn_a = Debouncer(btn_a_pin, interval=0.05)
+        machine.profiler.record_phase("pn532", monotonic_ns() - phase_started)
+        phase_started = monotonic_ns()
 
-        btn_b_pin = digitalio.DigitalInOut(board.D9)
-        btn_b_pin.direction = digitalio.Direction.INPUT
-        btn_b_pin.pull = digitalio.Pull.UP
-        machine.btn_b = Debouncer(btn_b_pin, interval=0.05)
+        # Configure PN532 to communicate with MiFare cards
+        pn532.SAM_configuration()
 
-        btn_c_pin = digitalio.DigitalInOut(board.D8)
-        btn_c_pin.direction = digitalio.Direction.INPUT
-        btn_c_pin.pull = digitalio.Pull.UP
-        machine.btn_c = Debouncer(btn_c_pin, interval=0.05)
+        machine.profiler.record_phase("sam", monotonic_ns() - phase_started)
+        machine.profiler.record_phase(
+            "nfc_ready", monotonic_ns() - self.started
+        )
 
-        machine.go_to_state(MenuState.tag)
+        machine.tag_pages = NtagPages(pn532)
+        machine.pn532 = pn532
+        machine.wake()
 
     def leave(self, machine):
-        pass
+        machine.profiler.record_phase(
+            "menu_ready", monotonic_ns() - self.started
+        )
 
     def update(self, machine):
-        pass
+        is_skipped = machine.btn_a.fell or machine.btn_b.fell
+        is_skipped = is_skipped or machine.btn_c.fell
+        is_splash_done = (
+            monotonic_ns() - self.started >= self.splash_time * 1000000000
+        )
+
+        if not (is_skipped or is_splash_done):
+            return
+
+        if machine.write_queue.length:
+            # IDs the host queued while booting go out straight away, as
+            # if queued from the menu
+            machine.go_to_state(BadgeProvisionState.tag)
+        else:
+            machine.go_to_state(MenuState.tag)
 
 
 class MenuState(State):
@@ -370,14 +1660,39 @@ class MenuState(State):
             "Scan badge for food",
             "Read badge ID",
             "Write badge ID",
+            "Provision badges",
             "[Debug] NFC info",
         )
         self.states = (
             ScanFoodState.tag,
             BadgeReadState.tag,
             BadgeWriteState.tag,
+            BadgeProvisionState.tag,
             NfcInfoState.tag,
         )
+        self.needs_nfc = (True, True, True, True, True)
+
+    def load(self, machine):
+        from screen_list_select import ScreenListSelect
+
+        machine.menu = ScreenListSelect(machine.screen)
+        machine.add_layer(machine.menu)
+
+    def _is_available(self, machine, index):
+        return machine.pn532 is not None or not self.needs_nfc[index]
+
+    def _show_availability(self, machine):
+        # Items that need the NFC reader are greyed out until it shows up
+        if self._is_available(machine, machine.menu.selected_index):
+            cursor_char = "> "
+            machine.label_btn_c.update(text="go")
+        else:
+            cursor_char = "x "
+            machine.label_btn_c.update(text="--")
+
+        if machine.menu.cursor_char != cursor_char:
+            machine.menu.cursor_char = cursor_char
+            machine.menu._refresh_label()
 
     def enter(self, machine):
         super().enter(machine, self.tag)
@@ -385,12 +1700,14 @@ class MenuState(State):
         machine.label_title.update(text="HnR'26 NFC controller")
         machine.label_btn_a.update(text="up")
         machine.label_btn_b.update(text="down", x=52)
-        machine.label_btn_c.update(text="go", x=117)
+        machine.label_btn_c.update(x=117)
 
         # Create list select menu
         machine.menu.update(items=self.items)
         machine.set_menu_visible()
 
+        self._show_availability(machine)
+
     def leave(self, machine):
         machine.set_body_visible()
 
@@ -398,7 +1715,13 @@ class MenuState(State):
         super().update(machine)
 
         if machine.btn_c.fell:
-            machine.go_to_state(self.states[machine.menu.selected_index])
+            index = machine.menu.selected_index
+
+            if self._is_available(machine, index):
+                machine.go_to_state(self.states[index])
+                return
+
+            machine.serial.send_line("NFC reader is not ready yet")
         elif machine.btn_a.fell and not machine.btn_b.fell:
             if machine.menu.selected_index == 0:
                 machine.menu.selected_index = len(machine.menu.items) - 1
@@ -410,31 +1733,151 @@ class MenuState(State):
             else:
                 machine.menu.move_selection_down()
 
+        # Moving the cursor or the reader showing up can change what's usable
+        self._show_availability(machine)
+
 
 class ScanFoodState(State):
     tag = "scan_food"
+    nfc_listen = True
 
-    def __init__(self):
-        pass
+    def __init__(self, repeat_time=2):
+        # A badge left on the reader is only counted again after it has been
+        # away for this long
+        self.repeat_time = repeat_time
+        self.recent_tags = None
+
+    def load(self, machine):
+        from ntag import RecentTags
+
+        self.recent_tags = RecentTags(ttl=self.repeat_time)
 
     def enter(self, machine):
         super().enter(machine, self.tag)
 
-        machine.label_title.update(text="Scan badge for food")
-        machine.label_body_top.update(text="Not implemented yet!")
-        machine.label_body_bottom.clear()
+        redemptions = machine.redemptions
+
+        machine.label_title.update(
+            text=f"Food session {redemptions.session + 1}"
+        )
+        machine.label_body_top.update(text="Tap a badge...")
+        machine.label_body_bottom.update(
+            text=f"{redemptions.count()} served"
+        )
         machine.label_btn_a.clear()
         machine.label_btn_b.clear()
         machine.label_btn_c.update(text="menu", x=105)
 
+        machine.serial.send_line("Tap badges on the reader, menu to stop")
+
     def leave(self, machine):
         pass
 
+    def _send_scan(self, machine, outcome, badge_id, uid):
+        # Tells host tools what a scan found: outcome, the badge ID (4
+        # bytes), the UID
+        machine.serial.send_frame(
+            frames.FOOD_SCAN,
+            0,
+            bytes((outcome,)) + badge_id.to_bytes(4, "big") + uid,
+        )
+
+    def _redeem(self, machine, uid, badge_id):
+        # Claim food for one badge, returns what to show for it
+        redemptions = machine.redemptions
+        badge_id_text = f"Badge ID: {badge_id}"
+
+        # Blank tags read as 0, they were never provisioned
+        if not 0 < badge_id < redemptions.MAX_BADGES:
+            machine.serial.send_line(f"{badge_id_text} unknown")
+            self._send_scan(machine, frames.SCAN_UNKNOWN, badge_id, uid)
+            return "Unknown badge!"
+
+        if redemptions.redeem(badge_id, uid):
+            machine.serial.send_line(f"{badge_id_text} OK")
+            self._send_scan(machine, frames.SCAN_OK, badge_id, uid)
+            return "OK!"
+
+        machine.serial.send_line(f"{badge_id_text} already claimed")
+        self._send_scan(machine, frames.SCAN_CLAIMED, badge_id, uid)
+        return "Already claimed!"
+
+    def _scan(self, machine, target, uid):
+        # Repeat sightings of a resting badge are handled from memory,
+        # without touching the tag or the screen
+        if self.recent_tags.get(uid) is not None:
+            return None
+
+        machine.tag_pages.select(uid, target)
+        badge_id_bytes = machine.tag_pages.read(0x04)
+
+        if badge_id_bytes is None:
+            # Pulled away too early or a glitch, a badge left on the reader
+            # is only tried again once the TTL is up
+            self.recent_tags.put(uid, self.recent_tags.FAILED)
+            machine.serial.send_line(f"NFC: 0x{uid.hex()} read failed")
+            self._send_scan(machine, frames.SCAN_READ_FAILED, 0, uid)
+            return None, "Read failed ;-;"
+
+        badge_id = int.from_bytes(badge_id_bytes)
+        self.recent_tags.put(uid, badge_id)
+
+        return badge_id, self._redeem(machine, uid, badge_id)
+
+    def _show(self, machine, results):
+        if len(results) > 1:
+            # Overlapping badges were both handled, one line each
+            labels = (machine.label_body_top, machine.label_body_bottom)
+
+            for body_label, (badge_id, text) in zip(labels, results):
+                if badge_id is None:
+                    body_label.update(text=text)
+                else:
+                    body_label.update(text=f"{badge_id} {text}")
+
+            return
+
+        badge_id, text = results[0]
+
+        if badge_id is None:
+            machine.label_body_top.update(text=text)
+            machine.label_body_bottom.update(text="Tap again")
+            return
+
+        if text == "OK!":
+            text = f"OK! {machine.redemptions.count()} served"
+
+        machine.label_body_top.update(text=f"Badge ID: {badge_id}")
+        machine.label_body_bottom.update(text=text)
+
     def update(self, machine):
         super().update(machine)
 
         if machine.btn_c.fell:
             machine.go_to_state(MenuState.tag)
+            return
+
+        results = []
+
+        for target, uid in machine.nfc_targets:
+            result = self._scan(machine, target, uid)
+
+            if result is not None:
+                results.append(result)
+
+        if not results:
+            return
+
+        self._show(machine, results)
+
+        # Show the result now instead of at the end of the tick, and time it
+        # from when the poll task saw the badge
+        machine.screen.refresh()
+        machine.profiler.record(
+            "scan_feedback",
+            StateProfiler.UPDATE,
+            monotonic_ns() - machine.nfc_uid_at,
+        )
 
 
 class BadgeReadState(State):
@@ -486,6 +1929,9 @@ class BadgeReadResultState(State):
         machine.label_btn_b.clear()
         machine.label_btn_c.clear()
 
+        # Show progress before blocking on the reader
+        machine.screen.refresh()
+
         # Check if a badge is available to read
         self.nfc_id = machine.pn532.read_passive_target()
 
@@ -499,7 +1945,8 @@ class BadgeReadResultState(State):
             machine.label_body_top.update(text=nfc_id_text)
             machine.serial.send_line(nfc_id_text)
 
-            self.badge_id_bytes = machine.pn532.ntag2xx_read_block(0x04)
+            machine.tag_pages.select(self.nfc_id)
+            self.badge_id_bytes = machine.tag_pages.read(0x04)
 
             if self.badge_id_bytes is None:
                 machine.label_body_bottom.update(text="Try again!")
@@ -679,6 +2126,11 @@ class BadgeWriteResultState(State):
         machine.label_btn_c.clear()
 
         self.is_write_success = False
+        self.old_badge_id_bytes = None
+        self.new_badge_id_bytes = None
+
+        # Show progress before blocking on the reader
+        machine.screen.refresh()
 
         # Check if a badge is available to read
         self.nfc_id = machine.pn532.read_passive_target()
@@ -691,23 +2143,17 @@ class BadgeWriteResultState(State):
             machine.label_body_top.update(text=nfc_id_text)
             machine.serial.send_line(nfc_id_text)
 
-            self.old_badge_id_bytes = machine.pn532.ntag2xx_read_block(0x04)
-
-            if self.old_badge_id_bytes is not None:
-                self.is_write_success = machine.pn532.ntag2xx_write_block(
-                    0x04, badge_id.to_bytes(4)
-                )
-
-                if self.is_write_success:
-                    self.new_badge_id_bytes = machine.pn532.ntag2xx_read_block(
-                        0x04
-                    )
+            # Retries by itself if the badge slips out of the field, and
+            # only succeeds once the tag reads back what was written
+            machine.tag_pages.select(self.nfc_id)
+            self.old_badge_id_bytes = machine.tag_pages.write_verified(
+                0x04, badge_id.to_bytes(4)
+            )
+            self.is_write_success = self.old_badge_id_bytes is not None
 
-                    if (
-                        self.new_badge_id_bytes is not None
-                        and self.new_badge_id_bytes == badge_id
-                    ):
-                        self.is_write_success = True
+            if self.is_write_success:
+                # Verified, so this comes from the cache
+                self.new_badge_id_bytes = machine.tag_pages.read(0x04)
 
         if self.is_write_success:
             badge_id_text = (
@@ -722,7 +2168,7 @@ class BadgeWriteResultState(State):
             machine.serial.send_line(badge_id_text)
             machine.serial.send_question_bool("Write another badge ID?")
 
-            machine.last_written_badge_id = badge_id
+            machine.set_last_written(badge_id)
         else:
             machine.label_body_bottom.update(text="FAILED TO WRITE!")
             machine.label_btn_c.update(text="retry", x=99)
@@ -758,6 +2204,247 @@ class BadgeWriteResultState(State):
                 )
 
 
+class BadgeProvisionState(State):
+    tag = "badge_provision"
+    nfc_listen = True
+
+    def __init__(self, repeat_time=2, rate_window=10):
+        # A provisioned badge left on the reader is only looked at again
+        # after it has been away for this long
+        self.repeat_time = repeat_time
+        self.recent_tags = None
+
+        # Times of the last few writes, for the badges per minute rate
+        self.write_times = [0.0] * rate_window
+        self.write_count = 0
+        self.skip_count = 0
+        self.badge_id = 0
+        # Taking IDs from machine.write_queue rather than counting up, set
+        # once anything is queued until the menu is back
+        self.is_queued = False
+        # UIDs of the badges last found on the reader together
+        self.conflict_uids = None
+
+    def load(self, machine):
+        from ntag import RecentTags
+
+        self.recent_tags = RecentTags(ttl=self.repeat_time)
+
+    def enter(self, machine):
+        super().enter(machine, self.tag)
+
+        self.recent_tags.clear()
+        self.write_count = 0
+        self.skip_count = 0
+        self.badge_id = machine.last_written_badge_id + 1
+        self.is_queued = machine.write_queue.length > 0
+        self.conflict_uids = None
+
+        machine.label_title.update(text="Provision badges")
+        machine.label_btn_a.clear()
+        machine.label_btn_b.clear()
+        machine.label_btn_c.update(text="menu", x=105)
+        machine.label_body_bottom.update(text="0 written")
+
+        if self.is_queued:
+            self.show_next(machine)
+            machine.serial.send_line(
+                f"Tap blank badges, {machine.write_queue.length} IDs queued,"
+                + " menu to stop"
+            )
+            return
+
+        if self.badge_id > 9999:
+            self._show_out_of_ids(machine)
+            return
+
+        machine.label_body_top.update(text=f"Tap for ID {self.badge_id}")
+
+        machine.serial.send_line(
+            f"Tap blank badges, IDs from {self.badge_id}, menu to stop"
+        )
+
+    def leave(self, machine):
+        machine.serial.send_line(
+            f"Provisioned {self.write_count} badges, "
+            + f"skipped {self.skip_count}"
+        )
+
+    def _next_write(self, machine):
+        # (badge ID, request ID) for the next blank badge, or None
+        if self.is_queued:
+            return machine.write_queue.peek()
+
+        if self.badge_id > 9999:
+            return None
+
+        return self.badge_id, 0
+
+    def show_next(self, machine):
+        # Also called by the machine when more IDs are queued
+        self.is_queued = self.is_queued or machine.write_queue.length > 0
+        next_write = self._next_write(machine)
+
+        if next_write is None and self.is_queued:
+            machine.label_body_top.update(text="Queue empty")
+        elif next_write is None:
+            self._show_out_of_ids(machine)
+        else:
+            machine.label_body_top.update(text=f"Tap for ID {next_write[0]}")
+
+    def _send_result(self, machine, status, next_write, old_badge_id, uid):
+        # Streams the outcome of a queued write back to the host: status,
+        # the queued badge ID, the one the badge had (4 bytes each), its UID
+        if not self.is_queued:
+            return
+
+        badge_id, request_id = next_write
+        machine.serial.send_frame(
+            frames.WRITE_DONE,
+            request_id,
+            bytes((status,))
+            + badge_id.to_bytes(4, "big")
+            + old_badge_id.to_bytes(4, "big")
+            + uid,
+        )
+
+    def _show_out_of_ids(self, machine):
+        machine.label_body_top.update(text="Out of badge IDs!")
+        machine.label_body_bottom.update(text="Write one to restart")
+        machine.serial.send_line("No badge IDs left after 9999")
+
+    def _rate(self):
+        # Over the last few writes, so it follows the current pace
+        size = len(self.write_times)
+        count = min(self.write_count, size)
+
+        if count < 2:
+            return 0
+
+        first = self.write_times[(self.write_count - count) % size]
+        last = self.write_times[(self.write_count - 1) % size]
+
+        if last <= first:
+            return 0
+
+        return round((count - 1) * 60 / (last - first))
+
+    def _show_count(self, machine):
+        machine.label_body_bottom.update(
+            text=f"{self.write_count} written {self._rate()}/min"
+        )
+
+    def _show_conflict(self, machine):
+        # Which badge got which ID would be anyone's guess, write neither
+        uids = tuple(uid for _, uid in machine.nfc_targets)
+
+        if uids == self.conflict_uids:
+            return
+
+        self.conflict_uids = uids
+
+        machine.label_body_top.update(text="One badge at a time!")
+        machine.serial.send_line("Several badges on the reader, none written")
+        machine.screen.refresh()
+
+    def _provision(self, machine, uid):
+        # Repeat sightings of a resting badge are handled from memory
+        if self.recent_tags.get(uid) is not None:
+            return
+
+        self._write(machine, uid)
+
+        # Show the result straight away, the next badge is usually coming
+        machine.screen.refresh()
+        machine.profiler.record(
+            "provision_feedback",
+            StateProfiler.UPDATE,
+            monotonic_ns() - machine.nfc_uid_at,
+        )
+
+    def _write(self, machine, uid):
+        next_write = self._next_write(machine)
+        tag_pages = machine.tag_pages
+        tag_pages.select(uid)
+        old_badge_id_bytes = tag_pages.read(0x04)
+
+        if old_badge_id_bytes is None:
+            # Pulled away too early, nothing is remembered so a retry works
+            machine.label_body_top.update(text="Read failed ;-;")
+            machine.serial.send_line(f"NFC: 0x{uid.hex()} read failed")
+            self._send_result(
+                machine, frames.STATUS_READ_FAILED, next_write, 0, uid
+            )
+            return
+
+        old_badge_id = int.from_bytes(old_badge_id_bytes)
+
+        if 0 < old_badge_id <= 9999:
+            # Already provisioned, blank tags read as 0
+            self.recent_tags.put(uid, old_badge_id)
+            self.skip_count += 1
+
+            machine.label_body_top.update(text=f"Has ID {old_badge_id}!")
+            machine.serial.send_line(f"Badge ID: {old_badge_id} kept")
+            self._send_result(
+                machine, frames.STATUS_HAS_ID, next_write, old_badge_id, uid
+            )
+            return
+
+        badge_id = next_write[0]
+
+        if tag_pages.write_verified(0x04, badge_id.to_bytes(4)) is None:
+            machine.label_body_top.update(text="Write failed ;-;")
+            machine.serial.send_line(f"Badge ID: {badge_id} write failed")
+            self._send_result(
+                machine,
+                frames.STATUS_WRITE_FAILED,
+                next_write,
+                old_badge_id,
+                uid,
+            )
+            return
+
+        self.recent_tags.put(uid, badge_id)
+        self.write_times[self.write_count % len(self.write_times)] = (
+            monotonic()
+        )
+        self.write_count += 1
+        machine.set_last_written(badge_id)
+        machine.serial.send_line(f"Badge ID: {old_badge_id} > {badge_id}")
+        self._send_result(
+            machine, frames.STATUS_OK, next_write, old_badge_id, uid
+        )
+
+        if self.is_queued:
+            machine.write_queue.pop()
+        else:
+            self.badge_id += 1
+
+        self._show_count(machine)
+        next_write = self._next_write(machine)
+
+        if next_write is None and self.is_queued:
+            machine.label_body_top.update(text=f"{badge_id} OK, all done")
+        elif next_write is None:
+            self._show_out_of_ids(machine)
+        else:
+            machine.label_body_top.update(
+                text=f"{badge_id} OK, next {next_write[0]}"
+            )
+
+    def update(self, machine):
+        super().update(machine)
+
+        if machine.btn_c.fell:
+            machine.go_to_state(MenuState.tag)
+        elif len(machine.nfc_targets) > 1:
+            self._show_conflict(machine)
+        elif machine.nfc_uid is not None and self._next_write(machine):
+            self.conflict_uids = None
+            self._provision(machine, machine.nfc_uid)
+
+
 class NfcInfoState(State):
     tag = "nfc_info"
 
@@ -777,6 +2464,8 @@ class NfcInfoState(State):
         machine.label_btn_b.clear()
         machine.label_btn_c.clear()
 
+        # Show progress before blocking on the reader
+        machine.screen.refresh()
         self.ic, self.ver, self.rev, self.sup = machine.pn532.firmware_version
 
         machine.label_body_top.update(
@@ -801,23 +2490,21 @@ def main():
     # states
     machine = StateMachine()
 
-    # Add all the possible states to the state machine
-    machine.add_state(InitState())
-    machine.add_state(MenuState())
-    machine.add_state(ScanFoodState())
-    machine.add_state(BadgeReadState())
-    machine.add_state(BadgeReadResultState())
-    machine.add_state(BadgeWriteState())
-    machine.add_state(BadgeWriteConfirmState())
-    machine.add_state(BadgeWriteResultState())
-    machine.add_state(NfcInfoState())
-
-    # Set the state entry point
-    machine.go_to_state(InitState.tag)
-
-    # Keep the state machine updated every tick
-    while True:
-        machine.update()
+    # Register all the possible states, they are built on first use
+    machine.add_state(InitState)
+    machine.add_state(MenuState)
+    machine.add_state(ScanFoodState)
+    machine.add_state(BadgeReadState)
+    machine.add_state(BadgeReadResultState)
+    machine.add_state(BadgeWriteState)
+    machine.add_state(BadgeWriteConfirmState)
+    machine.add_state(BadgeWriteResultState)
+    machine.add_state(BadgeProvisionState)
+    machine.add_state(NfcInfoState)
+
+    # Start from the entry point, then tick the state machine whenever
+    # buttons, serial or NFC have news
+    asyncio.run(machine.run(InitState.tag))
 
 
 if __name__ == "__main__":
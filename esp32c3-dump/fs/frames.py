@@ -0,0 +1,109 @@
+from array import array
+from binascii import a2b_base64, b2a_base64
+
+# Framed messages for host tools, sharing the console with the text prompts.
+# A frame is its type, a request ID (2 bytes), the payload, then a
+# CRC-16/CCITT-FALSE of all of that (2 bytes), all big endian. On the wire
+# it goes as base64 between an RS character (0x1e) and a newline: raw bytes
+# can't cross the console (0x03 interrupts the program), and text output
+# never holds an RS, so frames can't be mistaken for log lines or prompts.
+
+START = "\x1e"
+
+# Requests. The reply has the same type with REPLY set, the same request ID,
+# and a status byte before its payload
+PING = 0x01
+READ_BADGE = 0x02
+WRITE_BADGE = 0x03
+COMMAND = 0x04
+QUEUE_WRITES = 0x05
+REPLY = 0x80
+
+# Sent unprompted, with the request ID of the request they follow up on
+WRITE_DONE = 0x40
+# Sent unprompted with request ID 0, one per badge scanned for food
+FOOD_SCAN = 0x41
+
+# Reply to a frame too corrupt to tell what it asked, with request ID 0
+ERROR = 0xFF
+
+STATUS_OK = 0x00
+STATUS_NO_BADGE = 0x01
+STATUS_READ_FAILED = 0x02
+STATUS_WRITE_FAILED = 0x03
+STATUS_BAD_REQUEST = 0x04
+STATUS_BUSY = 0x05
+STATUS_UNKNOWN_TYPE = 0x06
+STATUS_BAD_FRAME = 0x07
+STATUS_QUEUE_FULL = 0x08
+STATUS_HAS_ID = 0x09
+
+# What a FOOD_SCAN found
+SCAN_OK = 0x00
+SCAN_CLAIMED = 0x01
+SCAN_UNKNOWN = 0x02
+SCAN_READ_FAILED = 0x03
+
+# Longest base64 text accepted for a request, about 256 bytes of frame
+MAX_TEXT = 344
+
+
+def _crc_table():
+    table = array("H", [0] * 256)
+
+    for i in range(256):
+        crc = i << 8
+
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = (crc << 1) ^ 0x1021
+            else:
+                crc <<= 1
+
+        table[i] = crc & 0xFFFF
+
+    return table
+
+
+_CRC_TABLE = _crc_table()
+
+
+def crc16(data, crc=0xFFFF):
+    for byte in data:
+        crc = ((crc << 8) & 0xFF00) ^ _CRC_TABLE[(crc >> 8) ^ byte]
+
+    return crc
+
+
+def encode(kind, request_id, payload=b""):
+    # The line to print for a frame, newline included
+    frame = bytearray(len(payload) + 5)
+    frame[0] = kind
+    frame[1] = (request_id >> 8) & 0xFF
+    frame[2] = request_id & 0xFF
+    frame[3 : 3 + len(payload)] = payload
+
+    crc = crc16(frame[:-2])
+    frame[-2] = crc >> 8
+    frame[-1] = crc & 0xFF
+
+    return START + b2a_base64(frame).decode()
+
+
+def decode(text):
+    # (type, request ID, payload) from a frame's base64, None if corrupt
+    if len(text) > MAX_TEXT:
+        return None
+
+    try:
+        frame = a2b_base64(text.encode())
+    except ValueError:
+        return None
+
+    if len(frame) < 5:
+        return None
+
+    if crc16(frame[:-2]) != (frame[-2] << 8 | frame[-1]):
+        return None
+
+    return frame[0], frame[1] << 8 | frame[2], bytes(frame[3:-2])
@@ -0,0 +1,303 @@
+from time import monotonic
+
+from adafruit_pn532.adafruit_pn532 import BusyError
+
+_INDATAEXCHANGE = 0x40
+_INLISTPASSIVETARGET = 0x4A
+
+_ISO14443A = 0x00
+
+_NTAG_READ = 0x30
+_NTAG_FAST_READ = 0x3A
+_NTAG_WRITE = 0xA2
+
+
+class NtagPages:
+    # What the driver raises when a transfer goes wrong, e.g. a glitch on the
+    # bus or a garbled frame
+    ERRORS = (BusyError, RuntimeError, OSError)
+
+    # Enough for the biggest of the NTAG21x stickers, the NTAG216
+    MAX_PAGES = 231
+    # One READ always returns 4 pages
+    READ_PAGES = 4
+    # FAST_READ replies have to fit in one PN532 frame
+    FAST_READ_PAGES = 60
+
+    def __init__(self, pn532, reselect_timeout=0.5):
+        self.pn532 = pn532
+        self.uid = None
+        # PN532 target number of the selected tag, 1 or 2
+        self.target = 1
+        self.reselect_timeout = reselect_timeout
+
+        # Pages read from the selected tag, with a flag per cached page
+        self._data = bytearray(self.MAX_PAGES * 4)
+        self._is_cached = bytearray(self.MAX_PAGES)
+
+        self.transactions = 0
+        self.retries = 0
+
+    def listen_for_targets(self, max_targets=2, timeout=1):
+        # Like PN532.listen_for_passive_target, but the PN532 activates up
+        # to two tags at once, so overlapping badges are both read
+        try:
+            return self.pn532.send_command(
+                _INLISTPASSIVETARGET,
+                params=(max_targets, _ISO14443A),
+                timeout=timeout,
+            )
+        except BusyError:
+            return False
+
+    def get_targets(self, timeout=1):
+        # (target number, UID) of each tag found, or None if not done yet.
+        # Each target is Tg, SENS_RES (2), SEL_RES, UID length, then the UID
+        response = self.pn532.process_response(
+            _INLISTPASSIVETARGET, response_length=25, timeout=timeout
+        )
+
+        if response is None or len(response) < 1:
+            return None
+
+        targets = []
+        offset = 1
+
+        for _ in range(response[0]):
+            if offset + 5 > len(response):
+                break
+
+            uid_length = response[offset + 4]
+            uid = bytes(response[offset + 5 : offset + 5 + uid_length])
+
+            if uid_length > 7 or len(uid) != uid_length:
+                break
+
+            targets.append((response[offset], uid))
+            offset += 5 + uid_length
+
+        return targets
+
+    def select(self, uid, target=1):
+        # Called with each new passive target, whatever was cached came from
+        # an earlier selection and may be stale
+        self.uid = uid
+        self.target = target
+        self.invalidate()
+
+    def invalidate(self, page=0, count=None):
+        if count is None:
+            count = self.MAX_PAGES - page
+
+        for i in range(page, min(page + count, self.MAX_PAGES)):
+            self._is_cached[i] = 0
+
+    def _exchange(self, params, response_length):
+        self.transactions += 1
+
+        try:
+            response = self.pn532.call_function(
+                _INDATAEXCHANGE,
+                params=(self.target,) + params,
+                response_length=response_length,
+            )
+        except self.ERRORS:
+            return None
+
+        # First byte is the PN532 status, 0x00 on success
+        if response is None or len(response) < 1 or response[0] != 0x00:
+            return None
+
+        return response[1:]
+
+    def _store(self, page, data):
+        count = min(len(data) // 4, self.MAX_PAGES - page)
+        self._data[page * 4 : (page + count) * 4] = data[: count * 4]
+
+        for i in range(page, page + count):
+            self._is_cached[i] = 1
+
+    def _fetch(self, first, last):
+        page = first
+
+        while page <= last:
+            count = last - page + 1
+
+            if count <= self.READ_PAGES:
+                # READ gets 4 pages for the price of 1
+                data = self._exchange(
+                    (_NTAG_READ, page), 1 + self.READ_PAGES * 4
+                )
+                count = self.READ_PAGES
+            else:
+                count = min(count, self.FAST_READ_PAGES)
+                data = self._exchange(
+                    (_NTAG_FAST_READ, page, page + count - 1),
+                    1 + count * 4,
+                )
+
+            # A short reply would leave pages uncached that read() returns
+            if data is None or len(data) < count * 4:
+                return False
+
+            self._store(page, data)
+            page += count
+
+        return True
+
+    def read(self, page, count=1, refresh=False):
+        if page < 0 or page + count > self.MAX_PAGES:
+            return None
+
+        if refresh:
+            self.invalidate(page, count)
+
+        # Fetch everything missing from the range in one go
+        first = None
+        last = None
+
+        for i in range(page, page + count):
+            if not self._is_cached[i]:
+                if first is None:
+                    first = i
+
+                last = i
+
+        if first is not None and not self._fetch(first, last):
+            return None
+
+        return bytes(self._data[page * 4 : (page + count) * 4])
+
+    def write(self, page, data):
+        if len(data) != 4 or page < 0 or page >= self.MAX_PAGES:
+            return False
+
+        # Whatever the tag holds now has to be read back from it
+        self.invalidate(page, 1)
+
+        return (
+            self._exchange((_NTAG_WRITE, page) + tuple(data), 1)
+            is not None
+        )
+
+    def _reselect(self):
+        # The tag may have slipped out of the field, only carry on if the
+        # same one comes back
+        try:
+            uid = self.pn532.read_passive_target(
+                timeout=self.reselect_timeout
+            )
+        except self.ERRORS:
+            return False
+
+        if uid is None or uid != self.uid:
+            return False
+
+        # Listed on its own this time
+        self.target = 1
+
+        return True
+
+    def write_verified(self, page, data, attempts=3):
+        # Read-modify-write-verify of one page, returning what the page held
+        # before, or None if no attempt could confirm the new contents
+        data = bytes(data)
+        old = None
+
+        for attempt in range(attempts):
+            if attempt:
+                self.retries += 1
+
+                if not self._reselect():
+                    continue
+
+            if old is None:
+                old = self.read(page)
+
+                if old is None:
+                    continue
+
+                if old == data:
+                    # Already holds it, read in this selection
+                    return old
+
+            if not self.write(page, data):
+                continue
+
+            # Byte for byte, from the tag rather than the cache
+            if self.read(page, refresh=True) == data:
+                return old
+
+        return None
+
+
+class RecentTags:
+    # Badges seen lately, so one resting on the reader is only handled once.
+    # An entry expires once its tag hasn't been seen for ttl seconds; every
+    # sighting restarts the clock. Fixed size, the least recently seen entry
+    # makes way for a new one.
+
+    # Stands in for the badge ID of a tag that couldn't be read. Sightings
+    # don't restart its clock, so a resting tag is retried every ttl seconds
+    FAILED = -1
+
+    def __init__(self, size=8, ttl=2):
+        self.ttl = ttl
+
+        self._uids = [None] * size
+        self._badge_ids = [0] * size
+        self._seen = [0.0] * size
+
+        self.hits = 0
+        self.misses = 0
+
+    def _find(self, uid):
+        for i in range(len(self._uids)):
+            if self._uids[i] == uid:
+                return i
+
+        return -1
+
+    def get(self, uid):
+        # Badge ID of a tag seen within the TTL, or None
+        now = monotonic()
+        i = self._find(uid)
+
+        if i < 0 or now - self._seen[i] >= self.ttl:
+            self.misses += 1
+            return None
+
+        if self._badge_ids[i] != self.FAILED:
+            self._seen[i] = now
+
+        self.hits += 1
+
+        return self._badge_ids[i]
+
+    def put(self, uid, badge_id):
+        i = self._find(uid)
+
+        if i < 0:
+            i = self._find(None)
+
+        if i < 0:
+            # Full, the least recently seen tag makes way
+            i = 0
+
+            for j in range(1, len(self._seen)):
+                if self._seen[j] < self._seen[i]:
+                    i = j
+
+        self._uids[i] = bytes(uid)
+        self._badge_ids[i] = badge_id
+        self._seen[i] = monotonic()
+
+    def forget(self, uid):
+        i = self._find(uid)
+
+        if i >= 0:
+            self._uids[i] = None
+
+    def clear(self):
+        for i in range(len(self._uids)):
+            self._uids[i] = None
@@ -0,0 +1,300 @@
+from time import monotonic
+
+_MAGIC = b"RDM1"
+_HEADER_SIZE = 6
+
+_JOURNAL_MAGIC = b"JNL1"
+_JOURNAL_HEADER_SIZE = 6
+
+# Journal records: generation, kind << 4 | session, UID (7 bytes, zero
+# padded), badge ID (2 bytes), timestamp in ms (4 bytes), checksum
+RECORD_SIZE = 16
+RECORD_REDEEM = 0
+RECORD_CLEAR = 1
+
+# Set bits in each nibble, for counting redemptions
+_NIBBLE_BITS = (
+    b"\x00\x01\x01\x02\x01\x02\x02\x03\x01\x02\x02\x03\x02\x03\x03\x04"
+)
+
+
+def _checksum(record):
+    total = 0
+
+    for i in range(RECORD_SIZE - 1):
+        total += record[i]
+
+    return ~total & 0xFF
+
+
+class Redemptions:
+    # Badge IDs are 0-9999, see BadgeWriteState
+    MAX_BADGES = 10000
+    SESSION_BYTES = MAX_BADGES // 8
+
+    def __init__(self, storage=None, sessions=4, batch_records=32, offset=0):
+        # storage is anything indexable like microcontroller.nvm. From
+        # offset on it holds a snapshot (magic, session count, current
+        # session, then one bitmap per session) followed by a journal of
+        # what happened since
+        self._storage = storage
+        self._offset = offset
+        self.sessions = sessions
+        self.session = 0
+
+        self._bits = bytearray(sessions * self.SESSION_BYTES)
+        self._counts = [0] * sessions
+
+        # Journal records not written yet, flushed in batches to save flash
+        self._pending = bytearray(batch_records * RECORD_SIZE)
+        self._pending_count = 0
+        self._record = bytearray(RECORD_SIZE)
+
+        self._generation = 0
+        self._journal_count = 0
+
+        self.flushes = 0
+        self.compactions = 0
+
+    @property
+    def size(self):
+        return _HEADER_SIZE + len(self._bits)
+
+    @property
+    def journal_capacity(self):
+        if self._storage is None:
+            return 0
+
+        space = len(self._storage) - self._offset - self.size
+        space -= _JOURNAL_HEADER_SIZE
+
+        return max(space // RECORD_SIZE, 0)
+
+    @property
+    def is_persistent(self):
+        return self.journal_capacity > 0
+
+    @property
+    def pending_count(self):
+        return self._pending_count
+
+    @property
+    def journal_count(self):
+        return self._journal_count
+
+    @property
+    def needs_compaction(self):
+        # Leave room for the next batch
+        free = self.journal_capacity - self._journal_count
+
+        return free < len(self._pending) // RECORD_SIZE
+
+    def load(self):
+        if not self.is_persistent:
+            return False
+
+        start = self._offset
+        header = bytes(self._storage[start : start + _HEADER_SIZE])
+
+        if header[0:4] != _MAGIC or header[4] != self.sessions:
+            # Blank or laid out differently, start over
+            self._bits[:] = bytes(len(self._bits))
+            self.session = 0
+            self._storage[start : start + self.size] = (
+                self._header() + self._bits
+            )
+            self._reset_journal(0)
+        else:
+            self.session = min(header[5], self.sessions - 1)
+            self._bits[:] = self._storage[
+                start + _HEADER_SIZE : start + self.size
+            ]
+            self._replay()
+
+        for session in range(self.sessions):
+            self._counts[session] = self._count(session)
+
+        return True
+
+    def _header(self):
+        return _MAGIC + bytes((self.sessions, self.session))
+
+    def _journal_header(self):
+        return _JOURNAL_MAGIC + bytes((self._generation, 0))
+
+    def _reset_journal(self, generation):
+        # 0xff is what blank flash reads as, never use it as a generation
+        self._generation = generation % 0xFF
+        self._journal_count = 0
+        offset = self._offset + self.size
+        self._storage[offset : offset + _JOURNAL_HEADER_SIZE] = (
+            self._journal_header()
+        )
+
+    def _replay(self):
+        offset = self._offset + self.size
+        header = bytes(self._storage[offset : offset + _JOURNAL_HEADER_SIZE])
+
+        if header[0:4] != _JOURNAL_MAGIC:
+            self._reset_journal(0)
+            return
+
+        self._generation = header[4]
+        self._journal_count = 0
+        offset += _JOURNAL_HEADER_SIZE
+
+        # Records are valid up to the first one that is torn, blank or left
+        # over from before the last compaction
+        for i in range(self.journal_capacity):
+            start = offset + i * RECORD_SIZE
+            record = self._storage[start : start + RECORD_SIZE]
+
+            if record[0] != self._generation:
+                break
+
+            if record[RECORD_SIZE - 1] != _checksum(record):
+                break
+
+            badge_id = record[9] << 8 | record[10]
+            self._apply(record[1] >> 4, record[1] & 0x0F, badge_id)
+            self._journal_count += 1
+
+    def _apply(self, kind, session, badge_id):
+        if session >= self.sessions:
+            return
+
+        if kind == RECORD_CLEAR:
+            start = session * self.SESSION_BYTES
+            end = start + self.SESSION_BYTES
+            self._bits[start:end] = bytes(self.SESSION_BYTES)
+        elif kind == RECORD_REDEEM and badge_id < self.MAX_BADGES:
+            index = session * self.SESSION_BYTES + (badge_id >> 3)
+            self._bits[index] |= 1 << (badge_id & 7)
+
+    def _append(self, kind, badge_id=0, uid=b""):
+        if not self.is_persistent:
+            return
+
+        if self._pending_count * RECORD_SIZE >= len(self._pending):
+            # Batch full before the background flush came round
+            self.flush()
+
+        record = self._record
+        record[0] = self._generation
+        record[1] = kind << 4 | self.session
+        uid = uid[:7]
+        record[2:9] = uid + bytes(7 - len(uid))
+        record[9] = badge_id >> 8
+        record[10] = badge_id & 0xFF
+        timestamp = int(monotonic() * 1000) & 0xFFFFFFFF
+        record[11:15] = timestamp.to_bytes(4, "big")
+        record[15] = _checksum(record)
+
+        start = self._pending_count * RECORD_SIZE
+        self._pending[start : start + RECORD_SIZE] = record
+        self._pending_count += 1
+
+    def flush(self):
+        # Write the pending records with one storage write, returns how
+        # many went out
+        count = self._pending_count
+
+        if count == 0:
+            return 0
+
+        if self._journal_count + count > self.journal_capacity:
+            # The snapshot covers them, memory already has every change
+            self.compact()
+            return count
+
+        offset = self._offset + self.size + _JOURNAL_HEADER_SIZE
+        offset += self._journal_count * RECORD_SIZE
+        self._storage[offset : offset + count * RECORD_SIZE] = self._pending[
+            0 : count * RECORD_SIZE
+        ]
+
+        self._journal_count += count
+        self._pending_count = 0
+        self.flushes += 1
+
+        return count
+
+    def compact(self):
+        # A reset halfway through replays the old journal over whatever of
+        # the snapshot got written. That gives the same bitmap only if the
+        # journal has everything the snapshot does, a CLEAR in it would
+        # wipe redemptions that were still pending. So pending records go
+        # to the old journal first, and the snapshot and the new
+        # generation's header go out in one write
+        if not self.is_persistent:
+            return
+
+        count = self._pending_count
+
+        if count and self._journal_count + count <= self.journal_capacity:
+            self.flush()
+
+        self._generation = (self._generation + 1) % 0xFF
+        self._journal_count = 0
+        self._pending_count = 0
+
+        start = self._offset
+        end = start + self.size + _JOURNAL_HEADER_SIZE
+        self._storage[start:end] = (
+            self._header() + self._bits + self._journal_header()
+        )
+        self.compactions += 1
+
+    def _count(self, session):
+        count = 0
+        start = session * self.SESSION_BYTES
+
+        for byte in self._bits[start : start + self.SESSION_BYTES]:
+            count += _NIBBLE_BITS[byte & 0x0F] + _NIBBLE_BITS[byte >> 4]
+
+        return count
+
+    def _locate(self, badge_id, session):
+        if session is None:
+            session = self.session
+
+        if not 0 <= badge_id < self.MAX_BADGES:
+            raise ValueError("Badge ID out of range")
+
+        return session * self.SESSION_BYTES + (badge_id >> 3), badge_id & 7
+
+    def is_redeemed(self, badge_id, session=None):
+        index, bit = self._locate(badge_id, session)
+
+        return bool(self._bits[index] >> bit & 1)
+
+    def redeem(self, badge_id, uid=b""):
+        # True if the badge hadn't claimed this session yet. Only memory is
+        # touched here, the journal record goes out with the next flush
+        index, bit = self._locate(badge_id, None)
+
+        if self._bits[index] >> bit & 1:
+            return False
+
+        self._bits[index] |= 1 << bit
+        self._counts[self.session] += 1
+        self._append(RECORD_REDEEM, badge_id, uid)
+
+        return True
+
+    def count(self, session=None):
+        return self._counts[self.session if session is None else session]
+
+    def set_session(self, session):
+        if not 0 <= session < self.sessions:
+            raise ValueError("Session out of range")
+
+        self.session = session
+
+        if self.is_persistent:
+            self._storage[self._offset + 5] = session
+
+    def clear_session(self):
+        self._apply(RECORD_CLEAR, self.session, 0)
+        self._counts[self.session] = 0
+        self._append(RECORD_CLEAR)
@@ -0,0 +1,60 @@
+from foamyguy_displayio_listselect import ListSelect
+
+
+class ScreenListSelect(ListSelect):
+    # Set once the widget is built, ListSelect refreshes during __init__
+    _screen = None
+
+    # What the label currently shows, so unchanged windows are skipped
+    _window_items = None
+    _window_start = -1
+    _window_selected = -1
+    _window_cursor = None
+
+    def __init__(self, screen):
+        super().__init__(
+            items=("",), visible_items_count=2, cursor_char="> ", x=0, y=16
+        )
+        self._screen = screen
+
+    def _refresh_label(self):
+        # Only the visible window is rendered, so the cost of a cursor move
+        # doesn't depend on how many items there are
+        count = len(self.items)
+        visible = self.visible_items_count or count
+        start = max(min(self.visible_index, count - visible), 0)
+        selected = self._selected_index
+
+        if (
+            self.items is self._window_items
+            and start == self._window_start
+            and selected == self._window_selected
+            and self.cursor_char == self._window_cursor
+        ):
+            return
+
+        self._window_items = self.items
+        self._window_start = start
+        self._window_selected = selected
+        self._window_cursor = self.cursor_char
+
+        rows = []
+
+        for i in range(start, min(start + visible, count)):
+            if i == selected:
+                rows.append(self.cursor_char + self.items[i])
+            else:
+                rows.append(" " + self.items[i])
+
+        self._label.text = "\n".join(rows)
+
+        if self._screen is not None:
+            self._screen.is_dirty = True
+
+    def update(self, items=None):
+        if items is not None:
+            self.items = items
+            self._refresh_label()
+
+    def clear(self):
+        self.update(items=())
@@ -0,0 +1 @@
+"""Host-side tooling for the HnR'26 NFC badge reader."""
@@ -0,0 +1,479 @@
+"""Benchmarks for the firmware hot paths, run on the simulated badge.
+
+    python -m hnr26_badge_nfc.bench --save-baseline bench_baseline.json
+    python -m hnr26_badge_nfc.bench --baseline bench_baseline.json
+
+Results are printed as JSON. With a baseline, any metric that got worse by
+more than the tolerance is listed under "regressions" and the exit status is
+1, so it can gate firmware changes.
+
+Host throughput (ops_per_sec) depends on the machine the suite runs on, so
+only compare it against baselines saved on the same machine. Simulated time
+and bus traffic are deterministic, heap use nearly so.
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import platform
+import re
+import sys
+import tracemalloc
+from pathlib import Path
+from time import perf_counter
+
+from hnr26_badge_nfc.sim import NtagTag, Simulator
+
+FIRMWARE_PATH = Path(__file__).parent.parent / "esp32c3-dump" / "fs"
+
+# Metric: (higher is better, absolute slack on top of the tolerance)
+METRICS = {
+    "ops_per_sec": (True, 0),
+    "peak_bytes": (False, 1024),
+    "retained_bytes_per_op": (False, 16),
+    "sim_ms_per_op": (False, 0.01),
+    "i2c_bytes_per_op": (False, 1),
+    "display_bytes_per_op": (False, 1),
+    "detect_ms": (False, 0.01),
+    "read_ms": (False, 0.01),
+    "write_ms": (False, 0.01),
+}
+
+_benchmarks = {}
+
+
+def benchmark(name, ops):
+    """Register a micro benchmark, run ``ops`` times on a booted machine."""
+
+    def register(setup):
+        _benchmarks[name] = (setup, ops)
+        return setup
+
+    return register
+
+
+def _state_classes(firmware):
+    base = firmware["State"]
+
+    return [
+        value
+        for value in firmware.values()
+        if isinstance(value, type) and issubclass(value, base)
+        if value is not base
+    ]
+
+
+async def _boot(sim, firmware):
+    machine = firmware["StateMachine"]()
+
+    for state_class in _state_classes(firmware):
+        machine.add_state(state_class)
+
+    machine.go_to_state(firmware["InitState"].tag)
+
+    # The reader connects in the background
+    while machine.pn532 is None:
+        await asyncio.sleep(0.05)
+
+    machine.go_to_state(firmware["MenuState"].tag)
+    machine.screen.refresh()
+    sim.take_output()
+
+    return machine
+
+
+def _measure(sim, step, ops):
+    # Throughput, best of three so a noisy host counts less
+    best = None
+    i2c = sim.board.i2c
+    i2c_bytes = i2c.bytes
+    sim_started = sim.now
+
+    for _ in range(3):
+        started = perf_counter()
+
+        for i in range(ops):
+            step(i)
+
+        elapsed = perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    sim_ms_per_op = (sim.now - sim_started) * 1000 / (ops * 3)
+    i2c_bytes_per_op = (i2c.bytes - i2c_bytes) / (ops * 3)
+
+    # Heap, on its own pass as tracing slows everything down
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+
+    for i in range(ops):
+        step(i)
+
+    gc.collect()
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "ops": ops,
+        "ops_per_sec": round(ops / best, 1),
+        "peak_bytes": peak - before,
+        "retained_bytes_per_op": round((after - before) / ops, 2),
+        "sim_ms_per_op": round(sim_ms_per_op, 3),
+        "i2c_bytes_per_op": round(i2c_bytes_per_op, 1),
+    }
+
+
+@benchmark("tick_idle", ops=20000)
+def _tick_idle(sim, machine):
+    # StateMachine.update with nothing happening, the common case
+    def step(i):
+        machine.update()
+
+    return step
+
+
+@benchmark("tick_input", ops=1000)
+def _tick_input(sim, machine):
+    # Menu ticks that each see a button edge and move the cursor
+    def step(i):
+        machine.btn_b._fell = True
+        machine.update()
+
+    return step
+
+
+@benchmark("serial_parse", ops=20000)
+def _serial_parse(sim, machine):
+    serial = machine.serial
+    lines = (("42\n", int), ("y\n", bool), ("no\n", bool), ("x1\n", int))
+
+    def step(i):
+        line, recv_type = lines[i % len(lines)]
+        serial._recv_type = recv_type
+        sim.send(line)
+        serial.update()
+
+        # Replies to bad input pile up otherwise
+        if i % 64 == 0:
+            sim.take_output()
+
+    return step
+
+
+@benchmark("menu_scroll", ops=20000)
+def _menu_scroll(sim, machine):
+    menu = machine.menu
+    menu.update(items=tuple(f"Item {i}" for i in range(32)))
+    machine.set_menu_visible()
+
+    def step(i):
+        if menu.selected_index == len(menu.items) - 1:
+            menu.selected_index = 0
+        else:
+            menu.move_selection_down()
+
+    return step
+
+
+@benchmark("label_churn", ops=20000)
+def _label_churn(sim, machine):
+    labels = (machine.label_body_top, machine.label_body_bottom)
+    texts = tuple(f"Badge ID: {i}" for i in range(8))
+
+    def step(i):
+        labels[i & 1].update(text=texts[i % len(texts)])
+
+    return step
+
+
+@benchmark("tag_record_read", ops=500)
+def _tag_record_read(sim, machine):
+    # A 12 page badge record off a freshly selected tag
+    tag_pages = machine.tag_pages
+    uid = sim.place_tag(NtagTag(badge_id=42)).uid
+
+    def step(i):
+        tag_pages.select(uid)
+        tag_pages.read(0x04, 12)
+
+    return step
+
+
+def _run_micro(name):
+    setup, ops = _benchmarks[name]
+
+    with Simulator(FIRMWARE_PATH, compute_scale=0) as sim:
+        firmware = sim.load()
+        result = {}
+
+        async def main():
+            machine = await _boot(sim, firmware)
+            step = setup(sim, machine)
+
+            # Warm up caches, so only the steady state is measured
+            for i in range(min(ops, 100)):
+                step(i)
+
+            result.update(_measure(sim, step, ops))
+
+        asyncio.run(main())
+
+    return result
+
+
+async def _read_flow(sim, rounds):
+    sim.place_tag(NtagTag(badge_id=42))
+
+    # Past the splash screen, the reader is up well before it ends
+    await asyncio.sleep(3.5)
+
+    # Menu -> "Read badge ID" -> first read
+    await sim.press("b")
+    await sim.press("c")
+    await sim.wait_for_output("Scan badge ID? (Y/n): ")
+    sim.send("y\n")
+    await sim.wait_for_output("Scan another badge ID? (Y/n): ")
+
+    return [
+        (sim.send, "y\n", "Scan another badge ID? (Y/n): ")
+        for _ in range(rounds)
+    ]
+
+
+async def _write_flow(sim, rounds):
+    sim.place_tag(NtagTag(badge_id=1))
+
+    # Past the splash screen, the reader is up well before it ends
+    await asyncio.sleep(3.5)
+
+    # Menu -> "Write badge ID" -> first write
+    await sim.press("b")
+    await sim.press("b")
+    await sim.press("c")
+
+    steps = []
+
+    for i in range(rounds + 1):
+        badge_id = 100 + i
+        steps += [
+            (sim.send, f"{badge_id}\n", f"Write badge ID {badge_id}? (Y/n): "),
+            (sim.send, "y\n", "another badge ID? (Y/n): "),
+            (sim.send, "y\n", "Write badge ID (<0 to menu): "),
+        ]
+
+    await sim.wait_for_output("Write badge ID (<0 to menu): ")
+
+    # The first round is the warm up
+    for action, arg, expect in steps[:3]:
+        action(arg)
+        await sim.wait_for_output(expect)
+
+    return steps[3:]
+
+
+_flows = {"read_flow": (_read_flow, 100), "write_flow": (_write_flow, 100)}
+
+# Flow throughput is the best of this many runs of their rounds, a flow takes
+# a few ms per round and host noise would swamp one run
+_FLOW_REPEATS = 5
+
+
+def _run_flow(name):
+    prepare, rounds = _flows[name]
+    result = {}
+
+    with Simulator(FIRMWARE_PATH, compute_scale=0) as sim:
+
+        async def scenario(sim):
+            steps = await prepare(sim, rounds * _FLOW_REPEATS)
+            per_run = len(steps) // _FLOW_REPEATS
+            i2c = sim.board.i2c
+            i2c_bytes = i2c.bytes
+            display_bytes = sim.display.data_bytes
+            sim_started = sim.now
+            best = None
+
+            for run in range(_FLOW_REPEATS):
+                started = perf_counter()
+
+                for action, arg, expect in steps[
+                    run * per_run : (run + 1) * per_run
+                ]:
+                    action(arg)
+                    await sim.wait_for_output(expect)
+
+                elapsed = perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+
+            total = rounds * _FLOW_REPEATS
+            result.update(
+                {
+                    "ops": rounds,
+                    "ops_per_sec": round(rounds / best, 1),
+                    "sim_ms_per_op": round(
+                        (sim.now - sim_started) * 1000 / total, 3
+                    ),
+                    "i2c_bytes_per_op": round(
+                        (i2c.bytes - i2c_bytes) / total, 1
+                    ),
+                    "display_bytes_per_op": round(
+                        (sim.display.data_bytes - display_bytes) / total, 1
+                    ),
+                }
+            )
+
+        sim.run(scenario=scenario)
+
+    return result
+
+
+# PN532 wirings, as settings.toml overrides, timed with the firmware's own
+# !nfcbench
+_transports = {
+    "nfc_i2c_100k": {},
+    "nfc_i2c_400k": {"PN532_I2C_FREQUENCY": 400000},
+    "nfc_spi": {"PN532_TRANSPORT": "spi"},
+    "nfc_uart_115200": {"PN532_TRANSPORT": "uart"},
+}
+
+_NFC_BENCH_ROUNDS = 20
+_NFC_BENCH_LINE = re.compile(
+    r"nfcbench: .* (\w+) (\d+)x avg ([\d.]+) max [\d.]+ failed (\d+)"
+)
+
+
+def _run_transport(name):
+    result = {"ops": _NFC_BENCH_ROUNDS}
+
+    with Simulator(
+        FIRMWARE_PATH, compute_scale=0, settings=_transports[name]
+    ) as sim:
+
+        async def scenario(sim):
+            sim.place_tag(NtagTag(badge_id=42))
+
+            # Past the splash screen, the reader is up well before it ends
+            await asyncio.sleep(3.5)
+
+            sim.send(f"!nfcbench {_NFC_BENCH_ROUNDS}\n")
+            output = await sim.wait_for_output("nfcbench: ", timeout=60)
+            output += await sim.wait_for_output("write", timeout=60)
+            output += await sim.wait_for_output("\n")
+
+            for match in _NFC_BENCH_LINE.finditer(output):
+                operation, _, avg_ms, failures = match.groups()
+                result[f"{operation}_ms"] = float(avg_ms)
+
+                if int(failures):
+                    result[f"{operation}_failures"] = int(failures)
+
+        sim.run(scenario=scenario)
+
+    return result
+
+
+def run(names=None):
+    results = {}
+
+    for name in list(_benchmarks) + list(_flows) + list(_transports):
+        if names and name not in names:
+            continue
+
+        if name in _flows:
+            results[name] = _run_flow(name)
+        elif name in _transports:
+            results[name] = _run_transport(name)
+        else:
+            results[name] = _run_micro(name)
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """List every metric worse than the baseline by more than tolerance."""
+    regressions = []
+
+    for name, metrics in results.items():
+        for metric, old in baseline.get(name, {}).items():
+            if metric not in METRICS or metric not in metrics:
+                continue
+
+            is_higher_better, slack = METRICS[metric]
+            new = metrics[metric]
+
+            if is_higher_better:
+                is_worse = new < old * (1 - tolerance) - slack
+            else:
+                is_worse = new > old * (1 + tolerance) + slack
+
+            if is_worse:
+                regressions.append(
+                    {
+                        "benchmark": name,
+                        "metric": metric,
+                        "baseline": old,
+                        "result": new,
+                    }
+                )
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m hnr26_badge_nfc.bench")
+    parser.add_argument(
+        "names",
+        nargs="*",
+        metavar="NAME",
+        help=f"benchmarks to run, out of {', '.join(_benchmarks)}, "
+        + f"{', '.join(_flows)}, {', '.join(_transports)} (default: all)",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        help="results to compare against, exits with 1 on regressions",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="how much worse than the baseline a metric may get "
+        + "(default: 0.2, i.e. 20%%)",
+    )
+    parser.add_argument(
+        "--save-baseline", type=Path, help="write the results to this file"
+    )
+    args = parser.parse_args()
+
+    unknown = set(args.names) - set(_benchmarks) - set(_flows)
+    unknown -= set(_transports)
+
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    results = run(args.names)
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "benchmarks": results,
+    }
+
+    if args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text())
+        report["regressions"] = compare(
+            results, baseline.get("benchmarks", {}), args.tolerance
+        )
+
+    if args.save_baseline is not None:
+        args.save_baseline.write_text(
+            json.dumps({"benchmarks": results}, indent=2) + "\n"
+        )
+
+    print(json.dumps(report, indent=2))
+
+    return 1 if report.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
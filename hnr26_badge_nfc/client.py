@@ -0,0 +1,379 @@
+"""Asyncio client for a badge reader on a serial port.
+
+    async with BadgeReader("/dev/ttyACM0") as reader:
+        badge = await reader.read_badge()
+        await reader.queue_writes([range(1200, 1700)])
+
+        while True:
+            result = await reader.write_results.get()
+
+Requests go out as frames (see protocol.py) and are matched to their replies
+by request ID, so any number can be in flight at once. The port is opened
+with pyserial but read and written non-blocking from the event loop, one
+loop drives any number of readers without a thread each. This relies on
+``loop.add_reader``, so it needs a POSIX system.
+
+When the port goes away (the badge resets and USB enumerates again), pending
+requests fail with ConnectionError and the port is reopened in the
+background; new requests wait for it within their timeout. Pass a
+``/dev/serial/by-id/`` path, the ``/dev/ttyACM*`` number can change.
+"""
+
+import asyncio
+import os
+from collections import namedtuple
+
+import serial
+
+from hnr26_badge_nfc import protocol
+
+Badge = namedtuple("Badge", "badge_id uid")
+
+# A queued write that finished, see BadgeReader.queue_writes
+WriteResult = namedtuple(
+    "WriteResult", "status badge_id old_badge_id uid request_id"
+)
+
+# A badge scanned for food, outcome is one of protocol.SCAN_*
+FoodScan = namedtuple("FoodScan", "outcome badge_id uid")
+
+
+class ReaderError(Exception):
+    """The reader answered a request with a status other than ok."""
+
+    def __init__(self, status, uid=None):
+        self.status = status
+        self.uid = uid
+
+        name = protocol.STATUS_NAMES.get(status, f"status {status:#04x}")
+        super().__init__(f"Reader replied {name}")
+
+
+class BadgeReader:
+    def __init__(
+        self,
+        port,
+        baudrate=115200,
+        timeout=2.0,
+        reconnect_interval=0.5,
+        log_size=1000,
+    ):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.reconnect_interval = reconnect_interval
+
+        # What the firmware prints besides frames, oldest dropped when full
+        self.log = asyncio.Queue(maxsize=log_size)
+        # WriteResult for every badge written from the queue
+        self.write_results = asyncio.Queue()
+        # FoodScan for every badge scanned for food, oldest dropped when full
+        self.scans = asyncio.Queue(maxsize=log_size)
+
+        self.reconnects = 0
+        self.frame_errors = 0
+
+        self._serial = None
+        self._loop = None
+        self._reader = protocol.FrameReader()
+        self._unsent = bytearray()
+        self._pending = {}
+        self._last_request_id = 0
+        self._connected = asyncio.Event()
+        self._reconnect_task = None
+        self._is_closing = False
+
+    def __repr__(self):
+        return f"<BadgeReader {self.port}>"
+
+    # Connection
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+        return False
+
+    @property
+    def is_connected(self):
+        return self._connected.is_set()
+
+    async def connect(self):
+        """Open the port, raising serial.SerialException if it can't be."""
+        self._loop = asyncio.get_running_loop()
+        self._is_closing = False
+        self._open()
+
+    async def close(self):
+        self._is_closing = True
+
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+
+        self._drop(ConnectionError(f"{self.port} closed"))
+
+    async def wait_connected(self):
+        await self._connected.wait()
+
+    def _open(self):
+        port = serial.Serial(self.port, self.baudrate, timeout=0)
+        fd = port.fileno()
+        os.set_blocking(fd, False)
+
+        self._serial = port
+        self._reader.reset()
+        self._loop.add_reader(fd, self._on_readable)
+        self._connected.set()
+
+    def _drop(self, exc):
+        # Forget the port and fail whatever was waiting on it
+        port, self._serial = self._serial, None
+        self._connected.clear()
+        self._unsent.clear()
+
+        if port is not None:
+            self._loop.remove_reader(port.fileno())
+            self._loop.remove_writer(port.fileno())
+            port.close()
+
+        pending, self._pending = self._pending, {}
+
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(exc)
+
+    def _lost(self, exc):
+        self._drop(ConnectionError(f"{self.port} lost: {exc}"))
+
+        if not self._is_closing and self._reconnect_task is None:
+            self._reconnect_task = self._loop.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        try:
+            while not self._is_closing:
+                await asyncio.sleep(self.reconnect_interval)
+
+                try:
+                    self._open()
+                except (OSError, serial.SerialException):
+                    continue
+
+                self.reconnects += 1
+                return
+        finally:
+            self._reconnect_task = None
+
+    # Bytes in and out
+
+    def _on_readable(self):
+        try:
+            data = os.read(self._serial.fileno(), 4096)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self._lost(e)
+            return
+
+        if not data:
+            self._lost("end of file")
+            return
+
+        for is_frame, item in self._reader.feed(data):
+            if is_frame:
+                self._on_frame(item)
+            else:
+                self._on_line(item)
+
+    @staticmethod
+    def _put_latest(queue, item):
+        if queue.full():
+            queue.get_nowait()
+
+        queue.put_nowait(item)
+
+    def _on_line(self, line):
+        self._put_latest(self.log, line)
+
+    def _on_frame(self, frame):
+        if frame is None or frame[0] == protocol.ERROR:
+            # Garbled one way or the other, its request will time out
+            self.frame_errors += 1
+            return
+
+        kind, request_id, payload = frame
+
+        if kind == protocol.WRITE_DONE and len(payload) >= 9:
+            self.write_results.put_nowait(
+                WriteResult(
+                    payload[0],
+                    int.from_bytes(payload[1:5]),
+                    int.from_bytes(payload[5:9]),
+                    payload[9:],
+                    request_id,
+                )
+            )
+            return
+
+        if kind == protocol.FOOD_SCAN and len(payload) >= 5:
+            scan = FoodScan(
+                payload[0], int.from_bytes(payload[1:5]), payload[5:]
+            )
+            self._put_latest(self.scans, scan)
+            return
+
+        future = self._pending.get(request_id)
+
+        if kind & protocol.REPLY and future is not None and not future.done():
+            if payload:
+                future.set_result((payload[0], payload[1:]))
+            else:
+                future.set_result((protocol.STATUS_BAD_FRAME, b""))
+
+    def _send(self, data):
+        if not self._unsent:
+            try:
+                sent = os.write(self._serial.fileno(), data)
+            except BlockingIOError:
+                sent = 0
+            except OSError as e:
+                self._lost(e)
+                raise ConnectionError(f"{self.port} lost: {e}") from e
+
+            data = data[sent:]
+
+            if not data:
+                return
+
+            self._loop.add_writer(self._serial.fileno(), self._on_writable)
+
+        self._unsent += data
+
+    def _on_writable(self):
+        try:
+            sent = os.write(self._serial.fileno(), self._unsent)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self._lost(e)
+            return
+
+        del self._unsent[:sent]
+
+        if not self._unsent:
+            self._loop.remove_writer(self._serial.fileno())
+
+    # Requests
+
+    def _new_request_id(self):
+        # 0 is what the firmware uses for unprompted frames
+        request_id = self._last_request_id
+
+        while True:
+            request_id = request_id % 0xFFFF + 1
+
+            if request_id not in self._pending:
+                self._last_request_id = request_id
+                return request_id
+
+    async def request(self, kind, payload=b"", timeout=None):
+        """Send one request and wait for its (status, payload) reply."""
+        if len(payload) > protocol.MAX_PAYLOAD:
+            raise ValueError("Payload too long for one frame")
+
+        if timeout is None:
+            timeout = self.timeout
+
+        async with asyncio.timeout(timeout):
+            await self._connected.wait()
+
+            request_id = self._new_request_id()
+            future = self._loop.create_future()
+            self._pending[request_id] = future
+
+            try:
+                self._send(protocol.encode_frame(kind, request_id, payload))
+                return await future
+            finally:
+                if self._pending.get(request_id) is future:
+                    del self._pending[request_id]
+
+    async def ping(self, payload=b""):
+        """Round trip time to the firmware in seconds."""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        status, reply = await self.request(protocol.PING, payload)
+
+        if status != protocol.STATUS_OK or reply != payload:
+            raise ReaderError(status)
+
+        return loop.time() - started
+
+    async def read_badge(self, timeout=None):
+        """The Badge on the reader, or None if there is none."""
+        status, reply = await self.request(protocol.READ_BADGE, b"", timeout)
+
+        if status == protocol.STATUS_NO_BADGE:
+            return None
+
+        if status != protocol.STATUS_OK:
+            raise ReaderError(status, reply or None)
+
+        return Badge(int.from_bytes(reply[:4]), reply[4:])
+
+    async def write_badge(self, badge_id, timeout=None):
+        """Write and verify a badge ID, returning the Badge as it was."""
+        status, reply = await self.request(
+            protocol.WRITE_BADGE, badge_id.to_bytes(4, "big"), timeout
+        )
+
+        if status != protocol.STATUS_OK:
+            raise ReaderError(status, reply or None)
+
+        return Badge(int.from_bytes(reply[:4]), reply[4:])
+
+    async def command(self, text, timeout=None):
+        """Run a ``!`` command (without the ``!``), returning its lines."""
+        status, reply = await self.request(
+            protocol.COMMAND, text.encode("ascii"), timeout
+        )
+
+        if status != protocol.STATUS_OK:
+            raise ReaderError(status)
+
+        return reply.decode("ascii").splitlines()
+
+    async def stats(self):
+        """The ``!stats`` lines, without their prefix."""
+        return [
+            line.removeprefix("stats: ")
+            for line in await self.command("stats")
+        ]
+
+    async def queue_writes(self, runs):
+        """Queue badge IDs for provisioning, returning how many now wait.
+
+        ``runs`` holds ranges, or (first badge ID, count) pairs. Each badge
+        written from the queue turns up in ``write_results``, tagged with
+        this request's ID.
+        """
+        payload = bytearray()
+
+        for run in runs:
+            if isinstance(run, range):
+                if run.step != 1:
+                    raise ValueError("Only consecutive badge IDs queue")
+
+                run = (run.start, len(run))
+
+            first, count = run
+            payload += first.to_bytes(2, "big") + count.to_bytes(2, "big")
+
+        status, reply = await self.request(protocol.QUEUE_WRITES, payload)
+
+        if status != protocol.STATUS_OK:
+            raise ReaderError(status)
+
+        return int.from_bytes(reply[:2])
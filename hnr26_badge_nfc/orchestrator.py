@@ -0,0 +1,566 @@
+"""Run every badge reader plugged into this host together.
+
+    python -m hnr26_badge_nfc.orchestrator list
+    python -m hnr26_badge_nfc.orchestrator provision 1200-1699
+    python -m hnr26_badge_nfc.orchestrator scans
+
+Readers are found by USB vendor ID, or named with ``--port`` (repeatable),
+which also takes ptys like the ones ``python -m hnr26_badge_nfc.sim --pty``
+serves. One connection is kept open per reader for the whole run.
+
+Provisioning shares the badge ID range out in blocks. Each reader is kept a
+couple of blocks ahead, so it never waits on the others and throughput grows
+with the number of readers. No ID goes to two readers. IDs a reader had
+queued when it dropped out go back to the pool for the others, readers that
+ran out of IDs wait for them until the run is over; a write it
+finished just as it dropped out may then be written again elsewhere, so
+check for duplicates after a run with disconnects. A block that may or may
+not have reached a reader, when queueing it timed out and its queue
+couldn't be cleared either, is never handed out again; those IDs are listed
+as lost at the end.
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from collections import deque, namedtuple
+
+import serial
+from serial.tools import list_ports
+
+from hnr26_badge_nfc import protocol
+from hnr26_badge_nfc.client import BadgeReader
+
+# Espressif's USB vendor ID, which the ESP32-C3's own USB port reports
+ESPRESSIF_VID = 0x303A
+
+# A badge scanned for food on one of the readers, outcome is one of
+# protocol.SCAN_*
+Scan = namedtuple("Scan", "port badge_id outcome uid")
+Provisioned = namedtuple("Provisioned", "port badge_id old_badge_id uid")
+
+
+def find_ports():
+    """Serial ports that look like badge readers, by USB vendor ID."""
+    return sorted(
+        port.device
+        for port in list_ports.comports()
+        if port.vid == ESPRESSIF_VID
+    )
+
+
+def _runs(badge_ids):
+    # Sorted badge IDs as ranges of consecutive ones
+    runs = []
+
+    for badge_id in badge_ids:
+        if runs and runs[-1].stop == badge_id:
+            runs[-1] = range(runs[-1].start, badge_id + 1)
+        else:
+            runs.append(range(badge_id, badge_id + 1))
+
+    return runs
+
+
+class IdAllocator:
+    """Shares a range of badge IDs out in blocks, each ID to one reader.
+
+    Blocks given back, by a reader that dropped out before writing them, go
+    out again before any fresh ones. ``outstanding`` counts the IDs taken
+    and neither written, given back nor lost yet.
+    """
+
+    def __init__(self, first, last, block=20):
+        self.block = block
+        self.outstanding = 0
+        # Ranges a reader might still write, see lose()
+        self.lost = []
+
+        self._next = first
+        self._last = last
+        self._returned = deque()
+        self._changed = asyncio.Event()
+
+    @property
+    def remaining(self):
+        fresh = max(self._last - self._next + 1, 0)
+
+        return fresh + sum(len(run) for run in self._returned)
+
+    @property
+    def is_done(self):
+        """Every ID written, none left to take or waiting on a reader."""
+        return not self.remaining and not self.outstanding
+
+    def take(self):
+        """The next block as a range, or None once all are out."""
+        if self._returned:
+            block = self._returned.popleft()
+        elif self._next > self._last:
+            return None
+        else:
+            stop = min(self._next + self.block, self._last + 1)
+            block = range(self._next, stop)
+            self._next = stop
+
+        self.outstanding += len(block)
+
+        return block
+
+    def give_back(self, badge_ids):
+        runs = _runs(sorted(badge_ids))
+
+        if not runs:
+            return
+
+        self._returned.extend(runs)
+        self.outstanding -= sum(len(run) for run in runs)
+        self._wake()
+
+    def lose(self, badge_ids):
+        """Never hand these out again, a reader may or may not hold them."""
+        runs = _runs(sorted(badge_ids))
+
+        if not runs:
+            return
+
+        self.lost.extend(runs)
+        self.outstanding -= sum(len(run) for run in runs)
+        self._wake()
+
+    def mark_written(self):
+        """Count one taken ID as done for good."""
+        self.outstanding -= 1
+        self._wake()
+
+    async def wait_changed(self):
+        """Wait for an ID to be given back or written."""
+        await self._changed.wait()
+
+    def _wake(self):
+        # Every waiter holds the old event, the next ones get a fresh one
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def unused(self):
+        """Ranges of the IDs nobody has taken, in order."""
+        badge_ids = set(range(self._next, self._last + 1))
+
+        for run in self._returned:
+            badge_ids.update(run)
+
+        return _runs(sorted(badge_ids))
+
+
+class ReaderPool:
+    """An open BadgeReader per port, with their output gathered in one place.
+
+    ``lines`` gets (port, line) for everything the readers log, oldest
+    dropped when full, and ``scans`` a Scan for each badge scanned for food,
+    from the readers' scan frames.
+    """
+
+    def __init__(self, ports=None, **reader_options):
+        self.ports = ports
+        self.reader_options = reader_options
+
+        self.readers = []
+        # Ports that couldn't be opened, with the reason
+        self.failed = {}
+
+        self.lines = asyncio.Queue(maxsize=10000)
+        self.scans = asyncio.Queue()
+
+        self._tasks = []
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+        return False
+
+    async def open(self):
+        ports = find_ports() if self.ports is None else self.ports
+
+        for port in ports:
+            reader = BadgeReader(port, **self.reader_options)
+
+            try:
+                await reader.connect()
+            except (OSError, serial.SerialException) as e:
+                self.failed[port] = e
+                continue
+
+            self.readers.append(reader)
+            self._tasks += [
+                asyncio.create_task(self._gather_lines(reader)),
+                asyncio.create_task(self._gather_scans(reader)),
+            ]
+
+        return self.readers
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+        for reader in self.readers:
+            await reader.close()
+
+    async def _gather_lines(self, reader):
+        while True:
+            line = await reader.log.get()
+
+            if self.lines.full():
+                self.lines.get_nowait()
+
+            self.lines.put_nowait((reader.port, line))
+
+    async def _gather_scans(self, reader):
+        while True:
+            scan = await reader.scans.get()
+            self.scans.put_nowait(
+                Scan(reader.port, scan.badge_id, scan.outcome, scan.uid)
+            )
+
+    async def each(self, call):
+        """Run ``call(reader)`` on every reader at once, results by port.
+
+        A reader that failed has its exception as its result.
+        """
+        results = await asyncio.gather(
+            *(call(reader) for reader in self.readers), return_exceptions=True
+        )
+
+        return {
+            reader.port: result
+            for reader, result in zip(self.readers, results)
+        }
+
+    async def provision(
+        self, allocator, ahead=2, on_written=None, reconnect_timeout=10
+    ):
+        """Write the allocator's badge IDs with every reader at once.
+
+        Each reader is topped up to ``ahead`` blocks queued. A reader with
+        nothing left to take waits while others still hold IDs, in case
+        they drop out and give them back. One that is gone for longer than
+        ``reconnect_timeout`` seconds is left out of the rest of the run.
+
+        Returns a Provisioned for each badge written, once every ID is or
+        no reader is left. ``on_written`` is called with each as it comes
+        in. Cancelling clears the readers' queues and gives their IDs back
+        to the allocator.
+        """
+        written = []
+        ahead *= allocator.block
+
+        try:
+            await asyncio.gather(
+                *(
+                    self._provision_on(
+                        reader,
+                        allocator,
+                        ahead,
+                        reconnect_timeout,
+                        written,
+                        on_written,
+                    )
+                    for reader in self.readers
+                )
+            )
+        finally:
+            # Nothing queued is written behind the allocator's back
+            await self.each(lambda reader: reader.command("queue clear"))
+
+        return written
+
+    async def _provision_on(
+        self, reader, allocator, ahead, reconnect_timeout, written, notify
+    ):
+        # IDs this reader will write next, in the order it writes them
+        queued = deque()
+        reconnects = reader.reconnects
+
+        try:
+            while True:
+                is_reset = reader.reconnects != reconnects
+
+                if is_reset or not reader.is_connected:
+                    # Its queue is gone, the others can take the IDs
+                    allocator.give_back(queued)
+                    queued.clear()
+
+                    try:
+                        async with asyncio.timeout(reconnect_timeout):
+                            await reader.wait_connected()
+                    except TimeoutError:
+                        # Gone for good, its IDs already went back
+                        return
+
+                    reconnects = reader.reconnects
+
+                try:
+                    result = await self._next_result(
+                        reader, allocator, ahead, queued
+                    )
+                except (ConnectionError, TimeoutError):
+                    # Lost, or just no badge lately, look again
+                    continue
+
+                if result is None:
+                    if allocator.is_done:
+                        return
+
+                    # Others still hold IDs, they may give them back
+                    await allocator.wait_changed()
+                    continue
+
+                if result.status != protocol.STATUS_OK:
+                    # Not written, the same ID goes to the next badge
+                    continue
+
+                if not queued or result.badge_id != queued[0]:
+                    # Left over from before this run, or from a block it
+                    # was given up on
+                    print(
+                        f"{reader.port}: wrote {result.badge_id}, which it"
+                        + " wasn't expected to",
+                        file=sys.stderr,
+                    )
+                    continue
+
+                queued.popleft()
+                allocator.mark_written()
+                item = Provisioned(
+                    reader.port,
+                    result.badge_id,
+                    result.old_badge_id,
+                    result.uid,
+                )
+                written.append(item)
+
+                if notify is not None:
+                    notify(item)
+        finally:
+            allocator.give_back(queued)
+
+    async def _next_result(self, reader, allocator, ahead, queued):
+        # Tops the reader's queue up, then waits a second for a write. None
+        # once it has nothing left to write
+        while len(queued) < ahead:
+            block = allocator.take()
+
+            if block is None:
+                break
+
+            try:
+                await reader.queue_writes([block])
+            except (TimeoutError, asyncio.CancelledError):
+                # It may have got there with the reply lost on the way back
+                await self._take_back(reader, allocator, block, queued)
+                raise
+            except BaseException:
+                # Refused, or reset along with its queue
+                allocator.give_back(block)
+                raise
+
+            queued.extend(block)
+
+        if not queued:
+            return None
+
+        async with asyncio.timeout(1):
+            return await reader.write_results.get()
+
+    async def _take_back(self, reader, allocator, block, queued):
+        # Only a cleared queue says the reader doesn't hold the block, then
+        # what it had queued before goes back too
+        try:
+            await reader.command("queue clear")
+        except Exception:
+            allocator.lose(block)
+            return
+
+        # Writes it finished before the clear came back ahead of its reply.
+        # Those IDs stay queued, for the results to be counted against
+        results = []
+
+        while not reader.write_results.empty():
+            results.append(reader.write_results.get_nowait())
+
+        held = set(queued) | set(block)
+        done = []
+
+        for result in results:
+            reader.write_results.put_nowait(result)
+
+            if result.status == protocol.STATUS_OK and result.badge_id in held:
+                held.discard(result.badge_id)
+                done.append(result.badge_id)
+
+        allocator.give_back(held)
+        queued.clear()
+        queued.extend(done)
+
+
+def _parse_range(text):
+    first, _, last = text.partition("-")
+
+    try:
+        first = int(first)
+        last = int(last) if last else first
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a badge ID range: {text}")
+
+    if not 1 <= first <= last <= 9999:
+        raise argparse.ArgumentTypeError("badge IDs go from 1 to 9999")
+
+    return first, last
+
+
+async def _list(pool, args):
+    async def ping(reader):
+        return await reader.ping()
+
+    for port, result in (await pool.each(ping)).items():
+        if isinstance(result, Exception):
+            print(f"{port}: no answer ({result!r})")
+        else:
+            print(f"{port}: ok, {result * 1000:.1f}ms round trip")
+
+
+async def _stats(pool, args):
+    async def stats(reader):
+        return await reader.stats()
+
+    for port, result in (await pool.each(stats)).items():
+        if isinstance(result, Exception):
+            print(f"{port}: no answer ({result!r})")
+            continue
+
+        for line in result:
+            print(f"{port}: {line}")
+
+
+async def _scans(pool, args):
+    while True:
+        scan = await pool.scans.get()
+        outcome = protocol.SCAN_NAMES.get(scan.outcome, "?")
+        print(
+            f"{scan.port}: {scan.badge_id} {outcome} ({scan.uid.hex()})",
+            flush=True,
+        )
+
+
+async def _provision(pool, args):
+    first, last = args.range
+    allocator = IdAllocator(first, last, block=args.block)
+    started = time.monotonic()
+
+    def report(item):
+        print(
+            f"{item.port}: {item.old_badge_id} > {item.badge_id}"
+            + f" ({item.uid.hex()})",
+            flush=True,
+        )
+
+    try:
+        written = await pool.provision(allocator, on_written=report)
+    finally:
+        unused = ", ".join(
+            f"{run.start}-{run.stop - 1}" for run in allocator.unused()
+        )
+
+        if unused:
+            print(f"unused IDs: {unused}")
+
+        lost = ", ".join(
+            f"{run.start}-{run.stop - 1}" for run in allocator.lost
+        )
+
+        if lost:
+            print(f"lost IDs, may have been written: {lost}")
+
+    elapsed = time.monotonic() - started
+    rate = len(written) * 60 / elapsed if elapsed else 0
+    readers = "reader" if len(pool.readers) == 1 else "readers"
+    print(
+        f"provisioned {len(written)} badges in {elapsed:.1f}s"
+        + f" on {len(pool.readers)} {readers}, {rate:.0f}/min"
+    )
+
+
+async def _run(args):
+    async with ReaderPool(args.port or None, timeout=args.timeout) as pool:
+        for port, e in pool.failed.items():
+            print(f"{port}: can't open ({e})", file=sys.stderr)
+
+        if not pool.readers:
+            print("no badge readers found", file=sys.stderr)
+            return 1
+
+        await args.command(pool, args)
+
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m hnr26_badge_nfc.orchestrator"
+    )
+    parser.add_argument(
+        "--port",
+        action="append",
+        default=[],
+        help="a reader's serial port, can be repeated (default: every "
+        + "connected ESP32-C3)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=2.0,
+        help="seconds to wait for each reply (default: 2)",
+    )
+    commands = parser.add_subparsers(required=True)
+
+    command = commands.add_parser("list", help="ping every reader")
+    command.set_defaults(command=_list)
+
+    command = commands.add_parser("stats", help="show every reader's !stats")
+    command.set_defaults(command=_stats)
+
+    command = commands.add_parser(
+        "scans", help="show food scans from every reader as they happen"
+    )
+    command.set_defaults(command=_scans)
+
+    command = commands.add_parser(
+        "provision", help="write a range of badge IDs using every reader"
+    )
+    command.add_argument(
+        "range", type=_parse_range, help="first and last ID, e.g. 1200-1699"
+    )
+    command.add_argument(
+        "--block",
+        type=int,
+        default=20,
+        help="IDs handed to a reader at a time (default: 20)",
+    )
+    command.set_defaults(command=_provision)
+
+    args = parser.parse_args()
+
+    try:
+        sys.exit(asyncio.run(_run(args)))
+    except KeyboardInterrupt:
+        sys.exit(130)
+
+
+if __name__ == "__main__":
+    main()
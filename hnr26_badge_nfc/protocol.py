@@ -0,0 +1,152 @@
+"""The framed serial protocol of the badge firmware, from the host side.
+
+Mirrors ``esp32c3-dump/fs/frames.py``, see "framed requests" in the README.
+A frame is its type, a request ID (2 bytes), the payload and a
+CRC-16/CCITT-FALSE of all that (2 bytes), big endian, sent as base64 between
+an RS character and a newline. Everything else the firmware prints is log
+output.
+"""
+
+import binascii
+
+START = b"\x1e"
+
+# Requests, replies have the same type with REPLY set
+PING = 0x01
+READ_BADGE = 0x02
+WRITE_BADGE = 0x03
+COMMAND = 0x04
+QUEUE_WRITES = 0x05
+REPLY = 0x80
+
+# Sent unprompted, with the request ID of the request they follow up on
+WRITE_DONE = 0x40
+# Sent unprompted with request ID 0, one per badge scanned for food
+FOOD_SCAN = 0x41
+
+# The firmware's reply to a frame it couldn't decode, with request ID 0
+ERROR = 0xFF
+
+STATUS_OK = 0x00
+STATUS_NO_BADGE = 0x01
+STATUS_READ_FAILED = 0x02
+STATUS_WRITE_FAILED = 0x03
+STATUS_BAD_REQUEST = 0x04
+STATUS_BUSY = 0x05
+STATUS_UNKNOWN_TYPE = 0x06
+STATUS_BAD_FRAME = 0x07
+STATUS_QUEUE_FULL = 0x08
+STATUS_HAS_ID = 0x09
+
+STATUS_NAMES = {
+    STATUS_OK: "ok",
+    STATUS_NO_BADGE: "no badge",
+    STATUS_READ_FAILED: "read failed",
+    STATUS_WRITE_FAILED: "write failed",
+    STATUS_BAD_REQUEST: "bad request",
+    STATUS_BUSY: "busy",
+    STATUS_UNKNOWN_TYPE: "unknown type",
+    STATUS_BAD_FRAME: "bad frame",
+    STATUS_QUEUE_FULL: "queue full",
+    STATUS_HAS_ID: "already has an ID",
+}
+
+# What a FOOD_SCAN found
+SCAN_OK = 0x00
+SCAN_CLAIMED = 0x01
+SCAN_UNKNOWN = 0x02
+SCAN_READ_FAILED = 0x03
+
+SCAN_NAMES = {
+    SCAN_OK: "OK",
+    SCAN_CLAIMED: "already claimed",
+    SCAN_UNKNOWN: "unknown",
+    SCAN_READ_FAILED: "read failed",
+}
+
+# The firmware drops requests longer than this, see frames.MAX_TEXT
+MAX_PAYLOAD = 250
+
+
+def crc16(data):
+    # crc_hqx is the CCITT polynomial, starting from 0xffff makes it FALSE
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def encode_frame(kind, request_id, payload=b""):
+    """The bytes to send for a frame, RS and newline included."""
+    frame = bytes((kind,)) + request_id.to_bytes(2, "big") + bytes(payload)
+    frame += crc16(frame).to_bytes(2, "big")
+
+    return START + binascii.b2a_base64(frame)
+
+
+def decode_frame(text):
+    """(type, request ID, payload) from a frame's base64, None if corrupt."""
+    try:
+        frame = binascii.a2b_base64(text, strict_mode=True)
+    except binascii.Error:
+        return None
+
+    if len(frame) < 5 or crc16(frame[:-2]) != int.from_bytes(frame[-2:]):
+        return None
+
+    return frame[0], int.from_bytes(frame[1:3]), frame[3:-2]
+
+
+class FrameReader:
+    """Splits what the firmware prints into frames and log lines.
+
+    ``feed`` returns what the new bytes completed, in order: ``(True,
+    frame)`` for a frame, decoded or None if corrupt, and ``(False, line)``
+    for a log line. A frame runs from an RS to the end of its line, so one
+    printed right after an unanswered prompt still comes out whole.
+    """
+
+    def __init__(self, max_line=4096):
+        self.max_line = max_line
+
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        items = []
+        self._buffer += data
+
+        while True:
+            end = self._buffer.find(b"\n")
+
+            if end < 0:
+                break
+
+            line = bytes(self._buffer[:end])
+            del self._buffer[: end + 1]
+            items.extend(self._split(line))
+
+        if len(self._buffer) > self.max_line:
+            # Runaway output without newlines, pass it on as it is
+            items.extend(self._split(bytes(self._buffer)))
+            self._buffer.clear()
+
+        return items
+
+    def reset(self):
+        self._buffer.clear()
+
+    def _split(self, line):
+        start = line.find(START)
+
+        if start < 0:
+            return [(False, self._text(line))]
+
+        items = []
+
+        if start:
+            items.append((False, self._text(line[:start])))
+
+        items.append((True, decode_frame(line[start + 1 :].strip())))
+
+        return items
+
+    @staticmethod
+    def _text(data):
+        return data.decode("ascii", "replace").rstrip("\r")
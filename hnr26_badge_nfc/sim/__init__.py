@@ -0,0 +1,7 @@
+"""Simulated badge hardware for running the firmware under CPython."""
+
+from hnr26_badge_nfc.sim.devices import NtagTag
+from hnr26_badge_nfc.sim.hardware import SimulationStop
+from hnr26_badge_nfc.sim.simulator import Simulator
+
+__all__ = ("NtagTag", "SimulationStop", "Simulator")
@@ -0,0 +1,132 @@
+"""Run a firmware script on the simulated badge and show what it did.
+
+    python -m hnr26_badge_nfc.sim esp32c3-dump/fs --duration 5 --tag 42
+
+With ``--pty`` the serial console is served on a pty instead, in real time,
+until interrupted. Its path is printed first, for host tools to open:
+
+    python -m hnr26_badge_nfc.sim esp32c3-dump/fs --pty --tap-blank 1
+"""
+
+import argparse
+import asyncio
+import os
+import pty
+import sys
+import tomllib
+import tty
+
+from hnr26_badge_nfc.sim import NtagTag, Simulator
+
+
+async def _tap_blank(sim, interval, hold=0.3):
+    while True:
+        await asyncio.sleep(interval - hold)
+        await sim.tap(NtagTag(), hold=hold)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m hnr26_badge_nfc.sim")
+    parser.add_argument("fs_path", help="directory holding the firmware")
+    parser.add_argument("--script", default="code.py")
+    parser.add_argument(
+        "--duration",
+        type=float,
+        help="simulated seconds to run for (default: 5, or until "
+        + "interrupted with --pty)",
+    )
+    parser.add_argument(
+        "--tag",
+        type=int,
+        action="append",
+        default=[],
+        metavar="BADGE_ID",
+        help="put a badge with this ID on the reader, can be repeated",
+    )
+    parser.add_argument(
+        "--send",
+        action="append",
+        default=[],
+        metavar="LINE",
+        help="type a line into the serial console, can be repeated",
+    )
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="override a settings.toml entry, e.g. PN532_TRANSPORT='\"spi\"'",
+    )
+    parser.add_argument(
+        "--pty",
+        action="store_true",
+        help="serve the serial console on a pty, printing its path",
+    )
+    parser.add_argument(
+        "--tap-blank",
+        type=float,
+        metavar="SECONDS",
+        help="tap a new blank badge on the reader this often",
+    )
+    args = parser.parse_args()
+
+    try:
+        settings = tomllib.loads("\n".join(args.set))
+    except tomllib.TOMLDecodeError as e:
+        parser.error(f"bad --set: {e}")
+
+    duration = args.duration
+
+    if duration is None and not args.pty:
+        duration = 5.0
+
+    tasks = []
+    echo = sys.stdout
+    compute_scale = 1.0
+
+    if args.pty:
+        master, slave = pty.openpty()
+        tty.setraw(slave)
+        print(os.ttyname(slave), flush=True)
+        tasks.append(lambda sim: sim.serve_pty(master))
+        # Whatever the firmware prints is for the host on the pty, and
+        # the pty paces the clock
+        echo = None
+        compute_scale = 0
+
+    if args.tap_blank:
+        tasks.append(lambda sim: _tap_blank(sim, args.tap_blank))
+
+    async def scenario(sim):
+        await asyncio.gather(*(task(sim) for task in tasks))
+
+    with Simulator(
+        args.fs_path,
+        compute_scale=compute_scale,
+        echo=echo,
+        settings=settings,
+    ) as sim:
+        for badge_id in args.tag:
+            sim.place_tag(NtagTag(badge_id=badge_id))
+
+        for line in args.send:
+            sim.send(line + "\n")
+
+        try:
+            sim.run(
+                script=args.script,
+                scenario=scenario if tasks else None,
+                duration=duration,
+            )
+        except KeyboardInterrupt:
+            pass
+
+        screen = sim.screen_text(on="#", off=" ")
+        now = sim.now
+
+    print(f"\n--- screen after {now:.2f}s ---")
+    print(screen)
+
+
+if __name__ == "__main__":
+    main()
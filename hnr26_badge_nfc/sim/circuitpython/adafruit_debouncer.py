@@ -0,0 +1,92 @@
+"""Stand-in for ``adafruit_debouncer``, same state machine as upstream."""
+
+from adafruit_ticks import ticks_diff, ticks_ms
+
+_DEBOUNCED_STATE = 0x01
+_UNSTABLE_STATE = 0x02
+_CHANGED_STATE = 0x04
+
+
+class Debouncer:
+    def __init__(self, io_or_predicate, interval=0.010):
+        self.state = 0x00
+
+        if hasattr(io_or_predicate, "value"):
+            self.function = lambda: io_or_predicate.value
+        else:
+            self.function = io_or_predicate
+
+        if self.function():
+            self._set_state(_DEBOUNCED_STATE | _UNSTABLE_STATE)
+
+        self._last_bounce_ticks = 0
+        self._last_duration_ticks = 0
+        self._state_changed_ticks = 0
+        self._interval_ticks = int(interval * 1000)
+
+    def _set_state(self, bits):
+        self.state |= bits
+
+    def _unset_state(self, bits):
+        self.state &= ~bits
+
+    def _toggle_state(self, bits):
+        self.state ^= bits
+
+    def _get_state(self, bits):
+        return (self.state & bits) != 0
+
+    def update(self, new_state=None):
+        self._unset_state(_CHANGED_STATE)
+
+        if new_state is None:
+            current_state = self.function()
+        else:
+            current_state = bool(new_state)
+
+        if current_state != self._get_state(_UNSTABLE_STATE):
+            self._last_bounce_ticks = ticks_ms()
+            self._toggle_state(_UNSTABLE_STATE)
+        elif ticks_diff(ticks_ms(), self._last_bounce_ticks) >= (
+            self._interval_ticks
+        ):
+            if current_state != self._get_state(_DEBOUNCED_STATE):
+                self._last_bounce_ticks = ticks_ms()
+                self._toggle_state(_DEBOUNCED_STATE)
+                self._set_state(_CHANGED_STATE)
+                self._last_duration_ticks = ticks_diff(
+                    ticks_ms(), self._state_changed_ticks
+                )
+                self._state_changed_ticks = ticks_ms()
+
+    @property
+    def interval(self):
+        return self._interval_ticks / 1000
+
+    @interval.setter
+    def interval(self, new_interval_s):
+        self._interval_ticks = int(new_interval_s * 1000)
+
+    @property
+    def value(self):
+        return self._get_state(_DEBOUNCED_STATE)
+
+    @property
+    def rose(self):
+        return self._get_state(_DEBOUNCED_STATE) and self._get_state(
+            _CHANGED_STATE
+        )
+
+    @property
+    def fell(self):
+        return (not self._get_state(_DEBOUNCED_STATE)) and self._get_state(
+            _CHANGED_STATE
+        )
+
+    @property
+    def last_duration(self):
+        return self._last_duration_ticks / 1000
+
+    @property
+    def current_duration(self):
+        return ticks_diff(ticks_ms(), self._state_changed_ticks) / 1000
@@ -0,0 +1,162 @@
+"""Stand-in for ``adafruit_display_text``.
+
+Glyphs are not the real terminalio font: each character gets a fixed,
+made-up 5x8 pattern inside its 6x12 cell. Sizes and positions follow the
+library, so layout, damage and bus traffic match the device.
+"""
+
+from displayio import Group
+
+_LINE_SPACING = 1.25
+_glyphs = {}
+
+
+def _glyph(char):
+    rows = _glyphs.get(char)
+
+    if rows is None:
+        if char == " ":
+            rows = ()
+        else:
+            bits = (ord(char) * 0x9E3779B1) & 0xFFFFFFFFFF
+            rows = tuple(
+                (bits >> (row * 5)) & 0x1F or 0x04 for row in range(8)
+            )
+
+        _glyphs[char] = rows
+
+    return rows
+
+
+class LabelBase(Group):
+    def __init__(
+        self,
+        font,
+        x=0,
+        y=0,
+        text="",
+        color=0xFFFFFF,
+        background_color=None,
+        line_spacing=_LINE_SPACING,
+        anchor_point=None,
+        anchored_position=None,
+        scale=1,
+        **kwargs,
+    ):
+        super().__init__(x=x, y=y, scale=scale)
+
+        self._font = font
+        self._char_width, self._char_height = font.get_bounding_box()
+        self._text = ""
+        self._lines = ()
+        self.color = color
+        self.background_color = background_color
+        self._line_spacing = line_spacing
+        self._anchor_point = anchor_point
+        self._anchored_position = anchored_position
+
+        self.text = text
+
+    @property
+    def font(self):
+        return self._font
+
+    @property
+    def text(self):
+        return self._text
+
+    @text.setter
+    def text(self, new_text):
+        self._text = str(new_text)
+        self._lines = tuple(self._text.split("\n")) if self._text else ()
+        self._update_anchored_position()
+
+    @property
+    def line_spacing(self):
+        return self._line_spacing
+
+    @property
+    def _line_height(self):
+        return int(self._char_height * self._line_spacing)
+
+    @property
+    def bounding_box(self):
+        if not self._lines:
+            return 0, 0, 0, 0
+
+        width = max(len(line) for line in self._lines) * self._char_width
+        height = self._char_height + self._line_height * (len(self._lines) - 1)
+
+        return 0, -(self._char_height // 2), width, height
+
+    @property
+    def width(self):
+        return self.bounding_box[2]
+
+    @property
+    def height(self):
+        return self.bounding_box[3]
+
+    @property
+    def anchor_point(self):
+        return self._anchor_point
+
+    @anchor_point.setter
+    def anchor_point(self, new_anchor_point):
+        self._anchor_point = new_anchor_point
+        self._update_anchored_position()
+
+    @property
+    def anchored_position(self):
+        return self._anchored_position
+
+    @anchored_position.setter
+    def anchored_position(self, new_position):
+        self._anchored_position = new_position
+        self._update_anchored_position()
+
+    def _update_anchored_position(self):
+        if self._anchor_point is None or self._anchored_position is None:
+            return
+
+        box_x, box_y, width, height = self.bounding_box
+        self.x = int(
+            self._anchored_position[0] - box_x - self._anchor_point[0] * width
+        )
+        self.y = int(
+            self._anchored_position[1] - box_y - self._anchor_point[1] * height
+        )
+
+    def _signature(self):
+        return (
+            self.x,
+            self.y,
+            self.hidden,
+            self._text,
+            self.color,
+            self.background_color,
+        )
+
+    def _render(self, frame, x, y):
+        x += self.x
+        y += self.y
+        box_x, box_y, width, height = self.bounding_box
+
+        if self.background_color is not None:
+            frame.fill_rect(x + box_x, y + box_y, width, height, False)
+
+        is_on = bool(self.color)
+        top = y + box_y
+
+        for line in self._lines:
+            left = x + box_x
+
+            for char in line:
+                for row, mask in enumerate(_glyph(char)):
+                    for col in range(5):
+                        if mask >> col & 1:
+                            frame.set_pixel(left + col, top + 2 + row, is_on)
+
+                left += self._char_width
+
+            top += self._line_height
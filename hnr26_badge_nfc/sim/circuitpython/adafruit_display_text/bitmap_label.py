@@ -0,0 +1,7 @@
+"""Stand-in for ``adafruit_display_text.bitmap_label``."""
+
+from adafruit_display_text import LabelBase
+
+
+class Label(LabelBase):
+    pass
@@ -0,0 +1,137 @@
+"""Stand-in for ``adafruit_displayio_ssd1306``.
+
+Renders the root group to a frame on refresh and pushes only the page and
+column window that changed since the last frame, the way displayio pushes
+its dirty areas. Frames are only rendered when a group or label changed.
+With auto_refresh on, a refresh runs every 1/60s of simulated time.
+"""
+
+from displayio import Frame
+
+from hnr26_badge_nfc.sim import hardware
+
+_INIT_SEQUENCE = (
+    b"\xae\xd5\x80\xa8\x3f\xd3\x00\x40\x8d\x14\x20\x00\xa1\xc8\xda\x12"
+    b"\x81\xcf\xd9\xf1\xdb\x40\xa4\xa6\xaf"
+)
+_AUTO_REFRESH_INTERVAL = 1 / 60
+
+
+class SSD1306:
+    def __init__(self, bus, *, width=128, height=64, rotation=0, **kwargs):
+        self.bus = bus
+        self.width = width
+        self.height = height
+        self.rotation = rotation
+        self.root_group = None
+        self.brightness = 1.0
+
+        self._frame = Frame(width, height)
+        self._signature = None
+        self._auto_refresh = True
+        self._is_awake = True
+
+        self.refreshes = 0
+        self.skipped_refreshes = 0
+
+        bus.send_commands(_INIT_SEQUENCE)
+
+        board = hardware.current
+        board.displays.append(self)
+        board.clock.call_later(_AUTO_REFRESH_INTERVAL, self._background)
+
+    @property
+    def auto_refresh(self):
+        return self._auto_refresh
+
+    @auto_refresh.setter
+    def auto_refresh(self, value):
+        self._auto_refresh = bool(value)
+
+    @property
+    def is_awake(self):
+        return self._is_awake
+
+    def sleep(self):
+        self.bus.send_commands(b"\xae")
+        self._is_awake = False
+
+    def wake(self):
+        self.bus.send_commands(b"\xaf")
+        self._is_awake = True
+
+    def _background(self):
+        board = hardware.current
+
+        if self not in board.displays:
+            return
+
+        if self._auto_refresh:
+            self._refresh()
+
+        board.clock.call_later(_AUTO_REFRESH_INTERVAL, self._background)
+
+    def _render(self):
+        frame = Frame(self.width, self.height)
+
+        if self.root_group is not None and not self.root_group.hidden:
+            self.root_group._render(frame, 0, 0)
+
+        return frame
+
+    def _refresh(self):
+        group = self.root_group
+        signature = (
+            id(group),
+            group._signature() if group is not None else None,
+        )
+
+        if signature == self._signature:
+            # Nothing moved since the last frame made it out
+            return True
+
+        frame = self._render()
+        old = self._frame.pages
+        new = frame.pages
+        width = self.width
+
+        # Find the page/column window holding every changed byte
+        changed = [i for i in range(len(new)) if new[i] != old[i]]
+
+        if not changed:
+            self._signature = signature
+            return True
+
+        pages = [i // width for i in changed]
+        cols = [i % width for i in changed]
+        page_start, page_end = min(pages), max(pages)
+        col_start, col_end = min(cols), max(cols)
+
+        window = bytes(
+            (0x21, col_start, col_end, 0x22, page_start, page_end)
+        )
+
+        if not self.bus.send_commands(window):
+            # Bus busy, try again on the next refresh
+            self.skipped_refreshes += 1
+            return False
+
+        data = bytearray()
+
+        for page in range(page_start, page_end + 1):
+            data += new[page * width + col_start : page * width + col_end + 1]
+
+        if not self.bus.send_pixels(data):
+            self.skipped_refreshes += 1
+            return False
+
+        self._frame = frame
+        self._signature = signature
+        self.refreshes += 1
+
+        return True
+
+    def refresh(
+        self, *, target_frames_per_second=None, minimum_frames_per_second=0
+    ):
+        return self._refresh()
@@ -0,0 +1,83 @@
+"""Stand-in for ``adafruit_pn532.i2c``.
+
+The device filesystem is case-insensitive, which is why the firmware can
+import this module as ``adafruit_pn532.I2C``; ``i2c.py`` re-exports it.
+"""
+
+import time
+
+from adafruit_bus_device import i2c_device
+from digitalio import Direction
+
+from adafruit_pn532.adafruit_pn532 import PN532, BusyError
+
+_I2C_ADDRESS = 0x24
+
+
+class PN532_I2C(PN532):
+    """Driver for the PN532 connected over I2C."""
+
+    def __init__(
+        self,
+        i2c,
+        address=_I2C_ADDRESS,
+        *,
+        irq=None,
+        reset=None,
+        req=None,
+        debug=False,
+    ):
+        self.debug = debug
+        self._req = req
+        self._i2c = i2c_device.I2CDevice(i2c, address)
+        super().__init__(debug=debug, irq=irq, reset=reset)
+
+    def _wakeup(self):
+        if self._reset_pin:
+            self._reset_pin.value = True
+            time.sleep(0.01)
+
+        if self._req:
+            self._req.direction = Direction.OUTPUT
+            self._req.value = False
+            time.sleep(0.01)
+            self._req.value = True
+            time.sleep(0.01)
+
+        self.low_power = False
+        self.SAM_configuration()
+
+    def _wait_ready(self, timeout=1):
+        status = bytearray(1)
+        timestamp = time.monotonic()
+
+        while (time.monotonic() - timestamp) < timeout:
+            try:
+                with self._i2c:
+                    self._i2c.readinto(status)
+            except OSError:
+                continue
+
+            if status == b"\x01":
+                return True
+
+            time.sleep(0.01)
+
+        return False
+
+    def _read_data(self, count):
+        frame = bytearray(count + 1)
+
+        with self._i2c as i2c:
+            i2c.readinto(frame, end=1)
+
+            if frame[0] != 0x01:
+                raise BusyError
+
+            i2c.readinto(frame)
+
+        return frame[1:]
+
+    def _write_data(self, framebytes):
+        with self._i2c as i2c:
+            i2c.write(framebytes)
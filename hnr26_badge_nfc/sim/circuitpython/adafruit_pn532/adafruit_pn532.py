@@ -0,0 +1,314 @@
+"""Stand-in for ``adafruit_pn532.adafruit_pn532``.
+
+Follows the Adafruit library closely, so the frames it puts on the bus and
+the way it waits for them are what the firmware sees on the device.
+"""
+
+import time
+
+_PREAMBLE = 0x00
+_STARTCODE1 = 0x00
+_STARTCODE2 = 0xFF
+_POSTAMBLE = 0x00
+
+_HOSTTOPN532 = 0xD4
+_PN532TOHOST = 0xD5
+
+_COMMAND_DIAGNOSE = 0x00
+_COMMAND_GETFIRMWAREVERSION = 0x02
+_COMMAND_SAMCONFIGURATION = 0x14
+_COMMAND_POWERDOWN = 0x16
+_COMMAND_RFCONFIGURATION = 0x32
+_COMMAND_INDATAEXCHANGE = 0x40
+_COMMAND_INCOMMUNICATETHRU = 0x42
+_COMMAND_INLISTPASSIVETARGET = 0x4A
+_COMMAND_INRELEASE = 0x52
+_COMMAND_TGINITASTARGET = 0x8C
+
+_WAKEUP = 0x55
+
+MIFARE_ISO14443A = 0x00
+
+MIFARE_CMD_AUTH_A = 0x60
+MIFARE_CMD_AUTH_B = 0x61
+MIFARE_CMD_READ = 0x30
+MIFARE_CMD_WRITE = 0xA0
+MIFARE_ULTRALIGHT_CMD_WRITE = 0xA2
+
+_ACK = b"\x00\x00\xff\x00\xff\x00"
+_FRAME_START = b"\x00\xff"
+
+
+class BusyError(Exception):
+    """Base class for exceptions in this module."""
+
+
+class PN532:
+    """PN532 driver base, must be extended for I2C/SPI/UART interfacing"""
+
+    def __init__(self, *, debug=False, irq=None, reset=None):
+        self.low_power = True
+        self.debug = debug
+        self._irq = irq
+        self._reset_pin = reset
+        self.reset()
+        _ = self.firmware_version
+
+    def _read_data(self, count):
+        raise NotImplementedError
+
+    def _write_data(self, framebytes):
+        raise NotImplementedError
+
+    def _wait_ready(self, timeout):
+        raise NotImplementedError
+
+    def _wakeup(self):
+        raise NotImplementedError
+
+    def reset(self):
+        if self._reset_pin:
+            self._reset_pin.value = True
+            time.sleep(0.1)
+            self._reset_pin.value = False
+            time.sleep(0.5)
+            self._reset_pin.value = True
+            time.sleep(0.1)
+
+    def _write_frame(self, data):
+        assert (
+            data is not None and 1 < len(data) < 255
+        ), "Data must be array of 1 to 255 bytes."
+        length = len(data)
+        frame = bytearray(length + 8)
+        frame[0] = _PREAMBLE
+        frame[1] = _STARTCODE1
+        frame[2] = _STARTCODE2
+        checksum = sum(frame[0:3])
+        frame[3] = length & 0xFF
+        frame[4] = (~length + 1) & 0xFF
+        frame[5:-2] = data
+        checksum += sum(data)
+        frame[-2] = ~checksum & 0xFF
+        frame[-1] = _POSTAMBLE
+        self._write_data(bytes(frame))
+
+    def _read_frame(self, length):
+        response = self._read_data(length + 7)
+
+        offset = 0
+
+        while response[offset] == 0x00:
+            offset += 1
+
+            if offset >= len(response):
+                raise RuntimeError(
+                    "Response frame preamble does not contain 0x00FF!"
+                )
+
+        if response[offset] != 0xFF:
+            raise RuntimeError(
+                "Response frame preamble does not contain 0x00FF!"
+            )
+
+        offset += 1
+
+        if offset >= len(response):
+            raise RuntimeError("Response contains no data!")
+
+        frame_len = response[offset]
+
+        if (frame_len + response[offset + 1]) & 0xFF != 0:
+            raise RuntimeError(
+                "Response length checksum did not match length!"
+            )
+
+        checksum = (
+            sum(response[offset + 2 : offset + 2 + frame_len + 1]) & 0xFF
+        )
+
+        if checksum != 0:
+            raise RuntimeError(
+                "Response checksum did not match expected value: ", checksum
+            )
+
+        return response[offset + 2 : offset + 2 + frame_len]
+
+    def call_function(self, command, response_length=0, params=[], timeout=1):
+        if not self.send_command(command, params=params, timeout=timeout):
+            return None
+
+        return self.process_response(
+            command, response_length=response_length, timeout=timeout
+        )
+
+    def send_command(self, command, params=[], timeout=1):
+        if self.low_power:
+            self._wakeup()
+
+        data = bytearray(2 + len(params))
+        data[0] = _HOSTTOPN532
+        data[1] = command & 0xFF
+
+        for i, val in enumerate(params):
+            data[2 + i] = val
+
+        try:
+            self._write_frame(data)
+        except OSError:
+            return False
+
+        if not self._wait_ready(timeout):
+            return False
+
+        if not _ACK == self._read_data(len(_ACK)):
+            raise RuntimeError("Did not receive expected ACK from PN532!")
+
+        return True
+
+    def process_response(self, command, response_length=0, timeout=1):
+        if not self._wait_ready(timeout):
+            return None
+
+        response = self._read_frame(response_length + 2)
+
+        if not (response[0] == _PN532TOHOST and response[1] == (command + 1)):
+            raise RuntimeError("Received unexpected command response!")
+
+        return response[2:]
+
+    def power_down(self):
+        if self._reset_pin:
+            self._reset_pin.value = False
+            self.low_power = True
+        else:
+            response = self.call_function(
+                _COMMAND_POWERDOWN, params=[0xB0, 0x00]
+            )
+            self.low_power = response[0] == 0x00
+
+        time.sleep(0.005)
+
+        return self.low_power
+
+    @property
+    def firmware_version(self):
+        response = self.call_function(
+            _COMMAND_GETFIRMWAREVERSION, 4, timeout=0.5
+        )
+
+        if response is None:
+            raise RuntimeError("Failed to detect the PN532")
+
+        return tuple(response)
+
+    def SAM_configuration(self):
+        self.call_function(
+            _COMMAND_SAMCONFIGURATION, params=[0x01, 0x14, 0x01]
+        )
+
+    def read_passive_target(self, card_baud=MIFARE_ISO14443A, timeout=1):
+        response = self.listen_for_passive_target(
+            card_baud=card_baud, timeout=timeout
+        )
+
+        if not response:
+            return None
+
+        return self.get_passive_target(timeout=timeout)
+
+    def listen_for_passive_target(self, card_baud=MIFARE_ISO14443A, timeout=1):
+        try:
+            response = self.send_command(
+                _COMMAND_INLISTPASSIVETARGET,
+                params=[0x01, card_baud],
+                timeout=timeout,
+            )
+        except BusyError:
+            return False
+
+        return response
+
+    def get_passive_target(self, timeout=1):
+        response = self.process_response(
+            _COMMAND_INLISTPASSIVETARGET, response_length=30, timeout=timeout
+        )
+
+        if response is None:
+            return None
+
+        if response[0] != 0x01:
+            raise RuntimeError("More than one card detected!")
+
+        if response[5] > 7:
+            raise RuntimeError("Found card with unexpectedly long UID!")
+
+        return response[6 : 6 + response[5]]
+
+    def mifare_classic_authenticate_block(
+        self, uid, block_number, key_number, key
+    ):
+        uidlen = len(uid)
+        keylen = len(key)
+        params = bytearray(3 + uidlen + keylen)
+        params[0] = 0x01
+        params[1] = key_number & 0xFF
+        params[2] = block_number & 0xFF
+        params[3 : 3 + keylen] = key
+        params[3 + keylen :] = uid
+        response = self.call_function(
+            _COMMAND_INDATAEXCHANGE, params=params, response_length=1
+        )
+
+        return response[0] == 0x00
+
+    def mifare_classic_read_block(self, block_number):
+        response = self.call_function(
+            _COMMAND_INDATAEXCHANGE,
+            params=[0x01, MIFARE_CMD_READ, block_number & 0xFF],
+            response_length=17,
+        )
+
+        if response[0] != 0x00:
+            return None
+
+        return response[1:]
+
+    def mifare_classic_write_block(self, block_number, data):
+        assert (
+            data is not None and len(data) == 16
+        ), "Data must be an array of 16 bytes!"
+        params = bytearray(19)
+        params[0] = 0x01
+        params[1] = MIFARE_CMD_WRITE
+        params[2] = block_number & 0xFF
+        params[3:] = data
+        response = self.call_function(
+            _COMMAND_INDATAEXCHANGE, params=params, response_length=1
+        )
+
+        return response[0] == 0x0
+
+    def ntag2xx_write_block(self, block_number, data):
+        assert (
+            data is not None and len(data) == 4
+        ), "Data must be an array of 4 bytes!"
+        params = bytearray(3 + len(data))
+        params[0] = 0x01
+        params[1] = MIFARE_ULTRALIGHT_CMD_WRITE
+        params[2] = block_number & 0xFF
+        params[3:] = data
+        response = self.call_function(
+            _COMMAND_INDATAEXCHANGE, params=params, response_length=1
+        )
+
+        return response[0] == 0x00
+
+    def ntag2xx_read_block(self, block_number):
+        ntag2xx_block = self.mifare_classic_read_block(block_number)
+
+        if ntag2xx_block is not None:
+            return ntag2xx_block[0:4]
+
+        return None
+
@@ -0,0 +1,5 @@
+"""Stand-in for ``adafruit_pn532.i2c``, see ``I2C.py``."""
+
+from adafruit_pn532.I2C import PN532_I2C
+
+__all__ = ("PN532_I2C",)
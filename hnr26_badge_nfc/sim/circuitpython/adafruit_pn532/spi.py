@@ -0,0 +1,87 @@
+"""Stand-in for ``adafruit_pn532.spi``.
+
+Like the Adafruit library, every bus access waits 20ms first and the bytes
+are bit reversed, as the PN532 talks LSB first.
+"""
+
+import time
+
+from adafruit_bus_device import spi_device
+
+from adafruit_pn532.adafruit_pn532 import PN532
+
+_SPI_STATREAD = 0x02
+_SPI_DATAWRITE = 0x01
+_SPI_DATAREAD = 0x03
+_SPI_READY = 0x01
+
+
+def reverse_bit(num):
+    result = 0
+
+    for _ in range(8):
+        result <<= 1
+        result += num & 1
+        num >>= 1
+
+    return result
+
+
+class PN532_SPI(PN532):
+    """Driver for the PN532 connected over SPI."""
+
+    def __init__(self, spi, cs_pin, *, irq=None, reset=None, debug=False):
+        self.debug = debug
+        self._spi = spi_device.SPIDevice(spi, cs_pin)
+        super().__init__(debug=debug, irq=irq, reset=reset)
+
+    def _wakeup(self):
+        if self._reset_pin:
+            self._reset_pin.value = True
+            time.sleep(0.01)
+
+        with self._spi as spi:
+            spi.write(bytearray([0x00]))
+
+        time.sleep(0.01)
+        self.low_power = False
+        self.SAM_configuration()
+
+    def _wait_ready(self, timeout=1):
+        status_cmd = bytearray([reverse_bit(_SPI_STATREAD), 0x00])
+        status_response = bytearray([0x00, 0x00])
+        timestamp = time.monotonic()
+
+        with self._spi as spi:
+            while (time.monotonic() - timestamp) < timeout:
+                time.sleep(0.02)
+                spi.write_readinto(status_cmd, status_response)
+
+                if reverse_bit(status_response[1]) == _SPI_READY:
+                    return True
+
+                time.sleep(0.01)
+
+        return False
+
+    def _read_data(self, count):
+        frame = bytearray(count + 1)
+        frame[0] = reverse_bit(_SPI_DATAREAD)
+
+        with self._spi as spi:
+            time.sleep(0.02)
+            spi.write_readinto(frame, frame)
+
+        for i, val in enumerate(frame):
+            frame[i] = reverse_bit(val)
+
+        return frame[1:]
+
+    def _write_data(self, framebytes):
+        rev_frame = [
+            reverse_bit(x) for x in bytes([_SPI_DATAWRITE]) + framebytes
+        ]
+
+        with self._spi as spi:
+            time.sleep(0.02)
+            spi.write(bytes(rev_frame))
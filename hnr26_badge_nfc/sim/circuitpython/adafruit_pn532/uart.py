@@ -0,0 +1,46 @@
+"""Stand-in for ``adafruit_pn532.uart``, following the Adafruit library."""
+
+import time
+
+from adafruit_pn532.adafruit_pn532 import PN532, BusyError
+
+
+class PN532_UART(PN532):
+    """Driver for the PN532 connected over serial UART."""
+
+    def __init__(self, uart, *, irq=None, reset=None, debug=False):
+        self.debug = debug
+        self._uart = uart
+        super().__init__(debug=debug, irq=irq, reset=reset)
+
+    def _wakeup(self):
+        if self._reset_pin:
+            self._reset_pin.value = True
+            time.sleep(0.01)
+
+        self.low_power = False
+        self._uart.write(b"\x55\x55\x00\x00\x00\x00\x00")
+        self.SAM_configuration()
+
+    def _wait_ready(self, timeout=1):
+        timestamp = time.monotonic()
+
+        while (time.monotonic() - timestamp) < timeout:
+            if self._uart.in_waiting > 0:
+                return True
+
+            time.sleep(0.01)
+
+        return False
+
+    def _read_data(self, count):
+        frame = self._uart.read(count)
+
+        if not frame:
+            raise BusyError("No data read from PN532")
+
+        return frame
+
+    def _write_data(self, framebytes):
+        self._uart.reset_input_buffer()
+        self._uart.write(framebytes)
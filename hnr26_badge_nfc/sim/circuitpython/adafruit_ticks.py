@@ -0,0 +1,24 @@
+"""Stand-in for ``adafruit_ticks`` on the simulated clock."""
+
+from hnr26_badge_nfc.sim import hardware
+
+_TICKS_PERIOD = 1 << 29
+_TICKS_MAX = _TICKS_PERIOD - 1
+_TICKS_HALFPERIOD = _TICKS_PERIOD // 2
+
+
+def ticks_ms():
+    return int(hardware.current.clock.now() * 1000) & _TICKS_MAX
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) % _TICKS_PERIOD
+
+
+def ticks_diff(ticks1, ticks2):
+    diff = (ticks1 - ticks2) & _TICKS_MAX
+    return ((diff + _TICKS_HALFPERIOD) & _TICKS_MAX) - _TICKS_HALFPERIOD
+
+
+def ticks_less(ticks1, ticks2):
+    return ticks_diff(ticks1, ticks2) < 0
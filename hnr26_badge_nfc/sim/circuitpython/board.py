@@ -0,0 +1,26 @@
+"""Stand-in for ``board`` on a Seeed Studio XIAO ESP32-C3."""
+
+from hnr26_badge_nfc.sim import hardware
+
+board_id = "seeed_xiao_esp32c3"
+
+
+def __getattr__(name):
+    pins = hardware.current.pins
+
+    if name in pins:
+        return pins[name]
+
+    raise AttributeError(f"module 'board' has no attribute '{name}'")
+
+
+def I2C():
+    # Like CircuitPython, every call hands out the same bus object
+    board = hardware.current
+
+    if getattr(board, "board_i2c", None) is None:
+        import busio
+
+        board.board_i2c = busio.I2C(board.pins["SCL"], board.pins["SDA"])
+
+    return board.board_i2c
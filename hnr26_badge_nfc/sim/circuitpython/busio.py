@@ -0,0 +1,270 @@
+"""Stand-in for ``busio``, backed by the simulated bus wires."""
+
+from hnr26_badge_nfc.sim import hardware
+
+
+class I2C:
+    def __init__(self, scl, sda, *, frequency=100000, timeout=255):
+        self._bus = hardware.current.i2c
+        self._bus.frequency = frequency
+        self._timeout = timeout
+        self._is_deinited = False
+
+    @property
+    def frequency(self):
+        return self._bus.frequency
+
+    def _check_lock(self):
+        if self._is_deinited:
+            raise ValueError(
+                "Object has been deinitialized and can no longer be used."
+            )
+
+        if self._bus.owner is not self:
+            raise RuntimeError("Function requires lock")
+
+    def try_lock(self):
+        if self._bus.owner is not None:
+            return False
+
+        self._bus.owner = self
+        return True
+
+    def unlock(self):
+        if self._bus.owner is self:
+            self._bus.owner = None
+
+    def scan(self):
+        self._check_lock()
+        found = []
+
+        for address in range(0x08, 0x78):
+            try:
+                self._bus.write(address, b"")
+            except OSError:
+                continue
+
+            found.append(address)
+
+        return found
+
+    def writeto(self, address, buffer, *, start=0, end=None):
+        self._check_lock()
+        self._bus.write(address, bytes(memoryview(buffer)[start:end]))
+
+    def readfrom_into(self, address, buffer, *, start=0, end=None):
+        self._check_lock()
+
+        if end is None:
+            end = len(buffer)
+
+        buffer[start:end] = self._bus.read(address, end - start)
+
+    def writeto_then_readfrom(
+        self,
+        address,
+        out_buffer,
+        in_buffer,
+        *,
+        out_start=0,
+        out_end=None,
+        in_start=0,
+        in_end=None,
+    ):
+        self.writeto(address, out_buffer, start=out_start, end=out_end)
+        self.readfrom_into(address, in_buffer, start=in_start, end=in_end)
+
+    def deinit(self):
+        self.unlock()
+        self._is_deinited = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.deinit()
+
+
+class SPI:
+    def __init__(self, clock, MOSI=None, MISO=None, half_duplex=False):
+        self._bus = hardware.current.spi
+        self._baudrate = 250000
+        self._is_deinited = False
+
+    @property
+    def frequency(self):
+        return self._baudrate
+
+    def _check_lock(self):
+        if self._is_deinited:
+            raise ValueError(
+                "Object has been deinitialized and can no longer be used."
+            )
+
+        if self._bus.owner is not self:
+            raise RuntimeError("Function requires lock")
+
+    def try_lock(self):
+        if self._bus.owner is not None:
+            return False
+
+        self._bus.owner = self
+        return True
+
+    def unlock(self):
+        if self._bus.owner is self:
+            self._bus.owner = None
+
+    def configure(self, *, baudrate=100000, polarity=0, phase=0, bits=8):
+        self._check_lock()
+        self._baudrate = baudrate
+        self._bus.baudrate = baudrate
+
+    def write(self, buffer, *, start=0, end=None):
+        self._check_lock()
+        self._bus.transfer(bytes(memoryview(buffer)[start:end]))
+
+    def readinto(self, buffer, *, start=0, end=None, write_value=0):
+        self._check_lock()
+
+        if end is None:
+            end = len(buffer)
+
+        out = bytes((write_value,)) * (end - start)
+        buffer[start:end] = self._bus.transfer(out)
+
+    def write_readinto(
+        self,
+        out_buffer,
+        in_buffer,
+        *,
+        out_start=0,
+        out_end=None,
+        in_start=0,
+        in_end=None,
+    ):
+        self._check_lock()
+
+        out = bytes(memoryview(out_buffer)[out_start:out_end])
+
+        if in_end is None:
+            in_end = len(in_buffer)
+
+        if len(out) != in_end - in_start:
+            raise ValueError("buffer slices must be of equal length")
+
+        in_buffer[in_start:in_end] = self._bus.transfer(out)
+
+    def deinit(self):
+        self.unlock()
+        self._is_deinited = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.deinit()
+
+
+class UART:
+    class Parity:
+        ODD = "ODD"
+        EVEN = "EVEN"
+
+    def __init__(
+        self,
+        tx=None,
+        rx=None,
+        *,
+        baudrate=9600,
+        bits=8,
+        parity=None,
+        stop=1,
+        timeout=1,
+        receiver_buffer_size=64,
+    ):
+        self._line = hardware.current.uart
+        self._line.baudrate = baudrate
+        self.timeout = timeout
+        self._is_deinited = False
+
+    @property
+    def baudrate(self):
+        return self._line.baudrate
+
+    @baudrate.setter
+    def baudrate(self, baudrate):
+        self._line.baudrate = baudrate
+
+    @property
+    def in_waiting(self):
+        return self._line.available()
+
+    def _wait(self, nbytes, timeout):
+        # Until nbytes have arrived or the line went quiet for timeout
+        clock = self._line.clock
+        started = clock.now()
+
+        while self._line.available() < nbytes:
+            if clock.now() - started >= timeout:
+                return
+
+            clock.advance(0.001)
+
+    def read(self, nbytes=None):
+        if self._is_deinited:
+            raise ValueError(
+                "Object has been deinitialized and can no longer be used."
+            )
+
+        if nbytes is None:
+            nbytes = max(self._line.available(), 1)
+
+        self._wait(1, self.timeout)
+        self._wait(nbytes, self.timeout)
+        data = self._line.read(nbytes)
+
+        return data or None
+
+    def readinto(self, buf, nbytes=None):
+        data = self.read(len(buf) if nbytes is None else nbytes)
+
+        if data is None:
+            return None
+
+        buf[0 : len(data)] = data
+
+        return len(data)
+
+    def readline(self):
+        data = b""
+
+        while not data.endswith(b"\n"):
+            byte = self.read(1)
+
+            if byte is None:
+                break
+
+            data += byte
+
+        return data or None
+
+    def write(self, buf):
+        self._line.write(bytes(buf))
+
+        return len(buf)
+
+    def reset_input_buffer(self):
+        available = self._line.available()
+
+        if available:
+            self._line.device.uart_read(available)
+
+    def deinit(self):
+        self._is_deinited = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.deinit()
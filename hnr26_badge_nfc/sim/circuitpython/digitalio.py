@@ -0,0 +1,77 @@
+"""Stand-in for ``digitalio``, reading and driving simulated pins."""
+
+
+class Direction:
+    INPUT = "INPUT"
+    OUTPUT = "OUTPUT"
+
+
+class Pull:
+    UP = "UP"
+    DOWN = "DOWN"
+
+
+class DriveMode:
+    PUSH_PULL = "PUSH_PULL"
+    OPEN_DRAIN = "OPEN_DRAIN"
+
+
+class DigitalInOut:
+    def __init__(self, pin):
+        if pin.claimed:
+            raise ValueError(f"{pin.name} in use")
+
+        pin.claimed = True
+
+        self._pin = pin
+        self._direction = Direction.INPUT
+        self._pull = None
+        self.drive_mode = DriveMode.PUSH_PULL
+
+    @property
+    def direction(self):
+        return self._direction
+
+    @direction.setter
+    def direction(self, direction):
+        self._direction = direction
+
+    @property
+    def pull(self):
+        return self._pull
+
+    @pull.setter
+    def pull(self, pull):
+        if self._direction != Direction.INPUT:
+            raise AttributeError("Pull not used when direction is output.")
+
+        self._pull = pull
+
+    @property
+    def value(self):
+        return bool(self._pin.value)
+
+    @value.setter
+    def value(self, value):
+        if self._direction != Direction.OUTPUT:
+            raise AttributeError("Cannot set value when direction is input.")
+
+        self._pin.level = bool(value)
+
+    def switch_to_input(self, pull=None):
+        self._direction = Direction.INPUT
+        self._pull = pull
+
+    def switch_to_output(self, value=False, drive_mode=DriveMode.PUSH_PULL):
+        self._direction = Direction.OUTPUT
+        self.drive_mode = drive_mode
+        self._pin.level = bool(value)
+
+    def deinit(self):
+        self._pin.claimed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.deinit()
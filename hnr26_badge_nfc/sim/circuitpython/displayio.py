@@ -0,0 +1,120 @@
+"""Stand-in for ``displayio``: groups, and rendering them to 1bpp frames."""
+
+from hnr26_badge_nfc.sim import hardware
+
+
+class Frame:
+    """A 1 bit per pixel picture laid out like SSD1306 GDDRAM pages."""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.pages = bytearray(width * ((height + 7) // 8))
+
+    def set_pixel(self, x, y, is_on=True):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            index = (y >> 3) * self.width + x
+
+            if is_on:
+                self.pages[index] |= 1 << (y & 7)
+            else:
+                self.pages[index] &= ~(1 << (y & 7)) & 0xFF
+
+    def fill_rect(self, x, y, width, height, is_on=True):
+        for py in range(max(y, 0), min(y + height, self.height)):
+            for px in range(max(x, 0), min(x + width, self.width)):
+                self.set_pixel(px, py, is_on)
+
+
+class Group:
+    def __init__(self, *, scale=1, x=0, y=0):
+        self._items = []
+        self._parent = None
+        self.scale = scale
+        self.x = x
+        self.y = y
+        self.hidden = False
+
+    def _claim(self, item):
+        if getattr(item, "_parent", None) is not None:
+            raise ValueError("Layer already in a group")
+
+        item._parent = self
+
+    def append(self, item):
+        self._claim(item)
+        self._items.append(item)
+
+    def insert(self, index, item):
+        self._claim(item)
+        self._items.insert(index, item)
+
+    def index(self, item):
+        return self._items.index(item)
+
+    def pop(self, index=-1):
+        item = self._items.pop(index)
+        item._parent = None
+
+        return item
+
+    def remove(self, item):
+        self.pop(self._items.index(item))
+
+    def sort(self, key=None, reverse=False):
+        self._items.sort(key=key, reverse=reverse)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, index):
+        return self._items[index]
+
+    def __setitem__(self, index, item):
+        self._claim(item)
+        self._items[index]._parent = None
+        self._items[index] = item
+
+    def __delitem__(self, index):
+        self.pop(index)
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __bool__(self):
+        return True
+
+    def _signature(self):
+        # Anything that changes the picture changes this
+        return (
+            self.x,
+            self.y,
+            self.hidden,
+            tuple(item._signature() for item in self._items),
+        )
+
+    def _render(self, frame, x, y):
+        for item in self._items:
+            if not item.hidden:
+                item._render(frame, x + self.x, y + self.y)
+
+
+class Palette:
+    def __init__(self, color_count, *, dither=False):
+        self._colors = [0] * color_count
+
+    def __len__(self):
+        return len(self._colors)
+
+    def __getitem__(self, index):
+        return self._colors[index]
+
+    def __setitem__(self, index, color):
+        self._colors[index] = color
+
+
+def release_displays():
+    hardware.current.displays.clear()
@@ -0,0 +1,31 @@
+"""Stand-in for ``i2cdisplaybus``."""
+
+
+class I2CDisplayBus:
+    def __init__(self, i2c_bus, *, device_address, reset=None):
+        self._i2c = i2c_bus
+        self._address = device_address
+
+    def reset(self):
+        pass
+
+    def _write(self, control, data):
+        # displayio skips the transfer if someone else holds the bus
+        if not self._i2c.try_lock():
+            return False
+
+        try:
+            self._i2c.writeto(self._address, bytes((control,)) + bytes(data))
+        finally:
+            self._i2c.unlock()
+
+        return True
+
+    def send(self, command, data):
+        return self._write(0x00, bytes((command,)) + bytes(data))
+
+    def send_commands(self, commands):
+        return self._write(0x00, commands)
+
+    def send_pixels(self, pixels):
+        return self._write(0x40, pixels)
@@ -0,0 +1,66 @@
+"""Stand-in for ``microcontroller``."""
+
+from hnr26_badge_nfc.sim import hardware
+from hnr26_badge_nfc.sim.hardware import Pin
+
+
+class NVM:
+    """Fixed size byte storage, like ``microcontroller.nvm``.
+
+    Every assignment is one commit to flash and costs ``write_time`` on the
+    simulated clock, whatever its size, which is roughly how the ESP32 port
+    behaves.
+    """
+
+    write_time = 0.02
+
+    def __init__(self, data):
+        self._data = data
+
+    def __len__(self):
+        return len(self._data)
+
+    def __getitem__(self, index):
+        return self._data[index]
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self._data))
+
+            if len(range(start, stop, step)) != len(value):
+                raise ValueError("Slice and value different lengths.")
+
+        self._data[index] = value
+
+        board = hardware.current
+        board.nvm_writes += 1
+        board.nvm_bytes += len(value) if isinstance(index, slice) else 1
+        board.clock.advance(self.write_time)
+
+
+class Processor:
+    temperature = 30.0
+    frequency = 160000000
+    voltage = 3.3
+    uid = b"\x34\x85\x18\x00\x00\x00"
+
+
+cpu = Processor()
+
+
+def __getattr__(name):
+    if name == "nvm":
+        return NVM(hardware.current.nvm)
+
+    raise AttributeError(f"module 'microcontroller' has no attribute '{name}'")
+
+
+def delay_us(delay):
+    hardware.current.clock.advance(delay / 1000000)
+
+
+def reset():
+    raise hardware.SimulationStop()
+
+
+__all__ = ("Pin", "cpu", "delay_us", "reset")
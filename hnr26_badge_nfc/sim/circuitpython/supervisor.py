@@ -0,0 +1,30 @@
+"""Stand-in for ``supervisor``."""
+
+from hnr26_badge_nfc.sim import hardware
+
+
+class Runtime:
+    autoreload = True
+
+    @property
+    def serial_connected(self):
+        return hardware.current.serial.connected
+
+    @property
+    def serial_bytes_available(self):
+        return hardware.current.serial.bytes_available
+
+    @property
+    def usb_connected(self):
+        return hardware.current.serial.connected
+
+
+runtime = Runtime()
+
+
+def ticks_ms():
+    return int(hardware.current.clock.now() * 1000) & 0x3FFFFFFF
+
+
+def reload():
+    raise hardware.SimulationStop()
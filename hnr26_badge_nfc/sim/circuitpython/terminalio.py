@@ -0,0 +1,9 @@
+"""Stand-in for ``terminalio``; only the built-in font is needed."""
+
+
+class BuiltinFont:
+    def get_bounding_box(self):
+        return 6, 12
+
+
+FONT = BuiltinFont()
@@ -0,0 +1,486 @@
+"""Emulated peripherals that sit on the simulated buses."""
+
+import itertools
+
+_ACK = b"\x00\x00\xff\x00\xff\x00"
+_ERROR_FRAME = b"\x00\x00\xff\x01\xff\x7f\x81\x00"
+
+_HOSTTOPN532 = 0xD4
+_PN532TOHOST = 0xD5
+
+# InDataExchange/InCommunicateThru status codes
+STATUS_OK = 0x00
+STATUS_TIMEOUT = 0x01
+STATUS_NAK = 0x14
+STATUS_BUFFER_OVERFLOW = 0x07
+
+# The largest frame data the PN532 sends back (TFI, command, status, data)
+_MAX_FRAME_DATA = 255
+
+
+def _reverse_bits(byte):
+    return int(f"{byte:08b}"[::-1], 2)
+
+
+def _frame(data):
+    length = len(data)
+
+    return (
+        bytes((0x00, 0x00, 0xFF, length, (~length + 1) & 0xFF))
+        + data
+        + bytes(((~sum(data) + 1) & 0xFF, 0x00))
+    )
+
+
+class SSD1306Device:
+    """SSD1306 controller in horizontal addressing mode at I2C 0x3C.
+
+    Keeps the controller's GDDRAM (8 pages of 128 one-byte columns) so the
+    picture the firmware pushed can be inspected, and counts what it cost.
+    """
+
+    I2C_ADDRESS = 0x3C
+    WIDTH = 128
+    HEIGHT = 64
+
+    # Number of argument bytes following each multi-byte command
+    _COMMAND_ARGS = {
+        0x20: 1,
+        0x21: 2,
+        0x22: 2,
+        0x81: 1,
+        0x8D: 1,
+        0xA8: 1,
+        0xD3: 1,
+        0xD5: 1,
+        0xD9: 1,
+        0xDA: 1,
+        0xDB: 1,
+    }
+
+    def __init__(self):
+        self.gddram = bytearray(self.WIDTH * self.HEIGHT // 8)
+        self.is_on = False
+
+        self._col_start = 0
+        self._col_end = self.WIDTH - 1
+        self._page_start = 0
+        self._page_end = self.HEIGHT // 8 - 1
+        self._col = 0
+        self._page = 0
+
+        self.windows = 0
+        self.data_bytes = 0
+        self.command_bytes = 0
+
+    def i2c_write(self, data):
+        if not data:
+            return
+
+        # Control byte: Co (bit 7) and D/C# (bit 6)
+        if data[0] & 0x40:
+            self._write_data(data[1:])
+        else:
+            self._write_commands(data[1:])
+
+    def i2c_read(self, nbytes):
+        return bytes(nbytes)
+
+    def _write_commands(self, payload):
+        self.command_bytes += len(payload)
+        i = 0
+
+        while i < len(payload):
+            command = payload[i]
+            nargs = self._COMMAND_ARGS.get(command, 0)
+            args = payload[i + 1 : i + 1 + nargs]
+            i += 1 + nargs
+
+            if command == 0x21 and len(args) == 2:
+                self._col_start, self._col_end = args[0], args[1]
+                self._col = self._col_start
+                self.windows += 1
+            elif command == 0x22 and len(args) == 2:
+                self._page_start, self._page_end = args[0], args[1]
+                self._page = self._page_start
+            elif command == 0xAE:
+                self.is_on = False
+            elif command == 0xAF:
+                self.is_on = True
+
+    def _write_data(self, payload):
+        self.data_bytes += len(payload)
+
+        for byte in payload:
+            self.gddram[self._page * self.WIDTH + self._col] = byte
+
+            self._col += 1
+
+            if self._col > self._col_end:
+                self._col = self._col_start
+                self._page += 1
+
+                if self._page > self._page_end:
+                    self._page = self._page_start
+
+    def pixel(self, x, y):
+        return bool(self.gddram[(y >> 3) * self.WIDTH + x] >> (y & 7) & 1)
+
+    def to_text(self, on="#", off="."):
+        return "\n".join(
+            "".join(
+                on if self.pixel(x, y) else off for x in range(self.WIDTH)
+            )
+            for y in range(self.HEIGHT)
+        )
+
+    def reset_stats(self):
+        self.windows = 0
+        self.data_bytes = 0
+        self.command_bytes = 0
+
+
+class NtagTag:
+    """NTAG215 sticker: 135 pages of 4 bytes, user memory in pages 4-129."""
+
+    PAGES = 135
+    USER_START = 4
+    USER_END = 129
+    VERSION = b"\x00\x04\x04\x02\x01\x00\x11\x03"
+
+    _uids = itertools.count(1)
+
+    def __init__(self, uid=None, badge_id=None):
+        if uid is None:
+            uid = b"\x04" + next(self._uids).to_bytes(6, "big")
+
+        self.uid = bytes(uid)
+        self.memory = bytearray(self.PAGES * 4)
+
+        # Pages 0-2 hold the UID and its check bytes, page 3 the NDEF CC
+        u = self.uid.ljust(7, b"\x00")
+        bcc0 = 0x88 ^ u[0] ^ u[1] ^ u[2]
+        self.memory[0:4] = bytes((u[0], u[1], u[2], bcc0))
+        self.memory[4:8] = u[3:7]
+        self.memory[8:12] = bytes((u[3] ^ u[4] ^ u[5] ^ u[6], 0x48, 0, 0))
+        self.memory[12:16] = b"\xe1\x10\x3e\x00"
+
+        self.reads = 0
+        self.writes = 0
+
+        if badge_id is not None:
+            self.write_page(self.USER_START, badge_id.to_bytes(4, "big"))
+
+    def __repr__(self):
+        return f"NtagTag(uid={self.uid.hex()})"
+
+    def read_page(self, page):
+        return bytes(self.memory[page * 4 : page * 4 + 4])
+
+    def write_page(self, page, data):
+        data = bytes(data[:4]).ljust(4, b"\x00")
+        self.memory[page * 4 : page * 4 + 4] = data
+
+    @property
+    def badge_id(self):
+        return int.from_bytes(self.read_page(self.USER_START), "big")
+
+    def command(self, data):
+        """Run one NTAG command, returning (status, response, seconds)."""
+        if not data:
+            return STATUS_NAK, b"", 0.0005
+
+        op = data[0]
+
+        if op == 0x30 and len(data) == 2:
+            # READ: 4 pages from the given one, rolling over at the end
+            self.reads += 1
+            response = bytearray()
+
+            for i in range(4):
+                response += self.read_page((data[1] + i) % self.PAGES)
+
+            return STATUS_OK, bytes(response), 0.0025
+
+        if op == 0x3A and len(data) == 3:
+            # FAST_READ: start to end page inclusive
+            start, end = data[1], data[2]
+
+            if start > end or end >= self.PAGES:
+                return STATUS_NAK, b"", 0.0005
+
+            if (end - start + 1) * 4 > _MAX_FRAME_DATA - 3:
+                return STATUS_BUFFER_OVERFLOW, b"", 0.0005
+
+            self.reads += 1
+            response = bytes(self.memory[start * 4 : (end + 1) * 4])
+
+            return STATUS_OK, response, 0.001 + 0.00004 * len(response)
+
+        if op in (0xA2, 0xA0) and len(data) >= 6:
+            # WRITE, or COMPATIBILITY_WRITE which only keeps 4 bytes
+            page = data[1]
+
+            if page < 2 or page > self.USER_END + 4:
+                return STATUS_NAK, b"", 0.0005
+
+            self.writes += 1
+            self.write_page(page, data[2:6])
+
+            return STATUS_OK, b"", 0.0045
+
+        if op == 0x60 and len(data) == 1:
+            return STATUS_OK, self.VERSION, 0.001
+
+        return STATUS_NAK, b"", 0.0005
+
+
+class PN532Device:
+    """PN532 NFC controller with a field that tags enter/leave.
+
+    Speaks the PN532 host frame protocol: every command frame is answered by
+    an ACK frame, then by a response frame once the command has finished.
+    InListPassiveTarget only finishes once a tag is in the field.
+
+    It answers on all three host interfaces, the firmware picks one. Over
+    I2C (at 0x24) the status byte read first is 0x01 when the next frame is
+    ready, SPI has a status read of its own, and over UART the frames are
+    streamed once ready.
+    """
+
+    I2C_ADDRESS = 0x24
+
+    def __init__(self, board, firmware=(0x32, 0x01, 0x06, 0x07), irq=None):
+        self.board = board
+        self.clock = board.clock
+        self.firmware = bytes(firmware)
+
+        # Tags in the field, closest first
+        self.field = []
+
+        self._output = b""
+        self._ready_at = 0.0
+        self._pending = None
+        self._waiting = None
+        self._targets = []
+
+        self.commands = {}
+
+        # Optional IRQ line, pulled low while a frame is ready
+        self.irq = irq
+
+        if irq is not None:
+            irq.driver = lambda: not self.is_ready()
+
+    # Test harness side
+
+    def place(self, tag):
+        if tag not in self.field:
+            self.field.append(tag)
+
+    def remove(self, tag):
+        if tag in self.field:
+            self.field.remove(tag)
+
+    def clear_field(self):
+        self.field.clear()
+
+    # Bus side
+
+    def is_ready(self):
+        now = self.clock.now()
+
+        if self._waiting is not None and not self._output:
+            self._start(*self._waiting)
+
+        return bool(self._output) and now >= self._ready_at
+
+    def i2c_write(self, data):
+        self._receive(data)
+
+    def i2c_read(self, nbytes):
+        is_ready = self.is_ready()
+        frame = bytearray(nbytes)
+
+        if nbytes:
+            frame[0] = 0x01 if is_ready else 0x00
+
+        if not is_ready or nbytes <= 1:
+            return bytes(frame)
+
+        # Reading past the status byte consumes the frame
+        data = self._take(nbytes - 1, is_whole=True)
+        frame[1 : 1 + len(data)] = data
+
+        return bytes(frame)
+
+    def spi_transfer(self, data):
+        # LSB first on the wire. The first byte says what the host wants:
+        # 0x01 data write, 0x02 status read, 0x03 data read
+        data = bytes(_reverse_bits(byte) for byte in data)
+        reply = bytearray(len(data))
+
+        if not data:
+            return b""
+
+        if data[0] == 0x01:
+            self._receive(data[1:])
+        elif data[0] == 0x02 and len(data) > 1:
+            reply[1] = 0x01 if self.is_ready() else 0x00
+        elif data[0] == 0x03 and self.is_ready():
+            frame = self._take(len(data) - 1, is_whole=True)
+            reply[1 : 1 + len(frame)] = frame
+
+        return bytes(_reverse_bits(byte) for byte in reply)
+
+    def uart_write(self, data):
+        # The wake up preamble (0x55 0x55 0x00...) is skipped by the parser
+        self._receive(data)
+
+    def uart_available(self):
+        return len(self._output) if self.is_ready() else 0
+
+    def uart_read(self, nbytes):
+        if not self.is_ready():
+            return b""
+
+        # A stream, whatever isn't read yet stays for the next read
+        return self._take(nbytes, is_whole=False)
+
+    def _take(self, nbytes, is_whole):
+        data = self._output[:nbytes]
+        was_ack = self._output == _ACK
+
+        self._output = b"" if is_whole else self._output[nbytes:]
+
+        if was_ack and not self._output and self._pending is not None:
+            pending, self._pending = self._pending, None
+            self._start(*pending)
+
+        return data
+
+    def _receive(self, data):
+        if data == _ACK:
+            # A host ACK aborts whatever the PN532 is doing
+            self._output = b""
+            self._pending = None
+            self._waiting = None
+            return
+
+        parsed = self._parse_frame(data)
+
+        if parsed is None:
+            return
+
+        command, params = parsed
+        self.commands[command] = self.commands.get(command, 0) + 1
+
+        self._output = _ACK
+        self._ready_at = self.clock.now() + 0.0005
+        self._pending = (command, params)
+        self._waiting = None
+
+    def _parse_frame(self, data):
+        start = data.find(b"\x00\xff")
+
+        if start < 0 or start + 4 > len(data):
+            return None
+
+        length = data[start + 2]
+
+        if (length + data[start + 3]) & 0xFF != 0:
+            return None
+
+        body = data[start + 4 : start + 4 + length]
+
+        if len(body) != length or length < 2 or body[0] != _HOSTTOPN532:
+            return None
+
+        if start + 4 + length >= len(data):
+            return None
+
+        if (sum(body) + data[start + 4 + length]) & 0xFF != 0:
+            return None
+
+        return body[1], body[2:]
+
+    def _start(self, command, params):
+        result = self._run(command, params)
+
+        if result is None:
+            # Keep waiting, e.g. for a tag to enter the field
+            self._waiting = (command, params)
+            return
+
+        self._waiting = None
+        data, seconds = result
+
+        if data is None:
+            self._output = _ERROR_FRAME
+        else:
+            self._output = _frame(bytes((_PN532TOHOST, command + 1)) + data)
+
+        self._ready_at = self.clock.now() + seconds
+
+    def _run(self, command, params):
+        if command == 0x02:
+            # GetFirmwareVersion
+            return self.firmware, 0.001
+
+        if command in (0x14, 0x32):
+            # SAMConfiguration, RFConfiguration
+            return b"", 0.001
+
+        if command == 0x16:
+            # PowerDown
+            return b"\x00", 0.001
+
+        if command == 0x4A:
+            return self._in_list_passive_target(params)
+
+        if command == 0x52:
+            # InRelease
+            self._targets = []
+            return b"\x00", 0.0005
+
+        if command == 0x40:
+            # InDataExchange, addressed to a target number
+            index = params[0] - 1 if params else -1
+            tag = None
+
+            if 0 <= index < len(self._targets):
+                tag = self._targets[index]
+
+            return self._exchange(tag, params[1:])
+
+        if command == 0x42:
+            # InCommunicateThru, to the first selected target
+            tag = self._targets[0] if self._targets else None
+            return self._exchange(tag, params)
+
+        # Anything else gets the PN532's application error frame
+        return None, 0.0005
+
+    def _in_list_passive_target(self, params):
+        max_targets = min(max(params[0], 1), 2) if params else 1
+        tags = self.field[:max_targets]
+
+        if not tags:
+            return None
+
+        self._targets = list(tags)
+        response = bytearray((len(tags),))
+
+        for number, tag in enumerate(tags, 1):
+            response += bytes((number, 0x00, 0x44, 0x00, len(tag.uid)))
+            response += tag.uid
+
+        return bytes(response), 0.003 + 0.002 * len(tags)
+
+    def _exchange(self, tag, data):
+        if tag is None or tag not in self.field:
+            return bytes((STATUS_TIMEOUT,)), 0.005
+
+        status, response, seconds = tag.command(bytes(data))
+
+        return bytes((status,)) + response, seconds
@@ -0,0 +1,358 @@
+"""Shared state of the simulated badge.
+
+The stand-in CircuitPython modules in ``circuitpython/`` look everything up
+through ``current`` at call time, so a fresh ``Board`` can be swapped in for
+each simulation run.
+"""
+
+import heapq
+from time import perf_counter
+
+
+class SimulationStop(BaseException):
+    """Raised to unwind the firmware once the simulation is over.
+
+    Derives from BaseException so ``except Exception`` blocks in the firmware
+    don't swallow it.
+    """
+
+
+class Clock:
+    """Time as seen by the firmware.
+
+    Sleeps are skipped and added to an offset, so idle time costs nothing.
+    Compute time is host time multiplied by ``compute_scale``; with a scale of
+    0 every reading advances the clock by ``read_cost`` instead, which keeps
+    busy loops moving while staying fully deterministic.
+    """
+
+    def __init__(self, compute_scale=1.0, read_cost=0.000001):
+        self.compute_scale = compute_scale
+        self.read_cost = read_cost
+        self.deadline = None
+
+        self._started = perf_counter()
+        self._skipped = 0.0
+        self._timers = []
+        self._timer_seq = 0
+        self._in_timers = False
+
+    def now(self):
+        if self.compute_scale:
+            elapsed = (perf_counter() - self._started) * self.compute_scale
+        else:
+            self._skipped += self.read_cost
+            elapsed = 0.0
+
+        now = self._skipped + elapsed
+
+        if self._timers and self._timers[0][0] <= now:
+            self._run_timers(now)
+
+        if self.deadline is not None and now >= self.deadline:
+            raise SimulationStop()
+
+        return now
+
+    def advance(self, seconds):
+        if seconds > 0:
+            self._skipped += seconds
+
+        self.now()
+
+    def call_at(self, when, callback):
+        self._timer_seq += 1
+        heapq.heappush(self._timers, (when, self._timer_seq, callback))
+
+    def call_later(self, delay, callback):
+        self.call_at(self.now() + delay, callback)
+
+    def _run_timers(self, now):
+        # Timers can read the clock themselves, don't re-enter
+        if self._in_timers:
+            return
+
+        self._in_timers = True
+
+        try:
+            while self._timers and self._timers[0][0] <= now:
+                _, _, callback = heapq.heappop(self._timers)
+                callback()
+        finally:
+            self._in_timers = False
+
+
+class Pin:
+    def __init__(self, name, level=True):
+        self.name = name
+        self.level = level
+        self.claimed = False
+
+        # Set by a device that drives the line, e.g. the PN532 IRQ
+        self.driver = None
+
+    @property
+    def value(self):
+        return self.driver() if self.driver is not None else self.level
+
+    def __repr__(self):
+        return f"board.{self.name}"
+
+
+class I2CBus:
+    """The wires of an I2C bus, shared by every busio.I2C on the same pins.
+
+    Each transfer advances the clock by the time the bytes take on the wire
+    (9 bits per byte, plus the address byte) at the current frequency.
+    """
+
+    def __init__(self, clock, frequency=100000):
+        self.clock = clock
+        self.frequency = frequency
+        self.devices = {}
+        self.owner = None
+
+        self.transactions = 0
+        self.bytes = 0
+        self.busy_time = 0.0
+        self.by_address = {}
+
+    def attach(self, address, device):
+        self.devices[address] = device
+
+    def transfer(self, address, nbytes):
+        seconds = (nbytes + 1) * 9 / self.frequency
+
+        self.transactions += 1
+        self.bytes += nbytes
+        self.busy_time += seconds
+
+        stats = self.by_address.setdefault(address, [0, 0])
+        stats[0] += 1
+        stats[1] += nbytes
+
+        self.clock.advance(seconds)
+
+    def write(self, address, data):
+        device = self.devices.get(address)
+        self.transfer(address, len(data) if device else 0)
+
+        if device is None:
+            # Nobody acknowledged the address
+            raise OSError(19, "No such device")
+
+        device.i2c_write(bytes(data))
+
+    def read(self, address, nbytes):
+        device = self.devices.get(address)
+        self.transfer(address, nbytes if device else 0)
+
+        if device is None:
+            raise OSError(19, "No such device")
+
+        return device.i2c_read(nbytes)
+
+    def reset_stats(self):
+        self.transactions = 0
+        self.bytes = 0
+        self.busy_time = 0.0
+        self.by_address = {}
+
+
+class SPIBus:
+    """The wires of an SPI bus with one device on it.
+
+    Each transfer advances the clock by 8 bits per byte at the baudrate the
+    bus was last configured for. Chip select is taken as wired correctly.
+    """
+
+    def __init__(self, clock, baudrate=100000):
+        self.clock = clock
+        self.baudrate = baudrate
+        self.device = None
+        self.owner = None
+
+        self.transactions = 0
+        self.bytes = 0
+        self.busy_time = 0.0
+
+    def attach(self, device):
+        self.device = device
+
+    def transfer(self, data):
+        seconds = len(data) * 8 / self.baudrate
+
+        self.transactions += 1
+        self.bytes += len(data)
+        self.busy_time += seconds
+        self.clock.advance(seconds)
+
+        if self.device is None:
+            # Nothing drives MISO
+            return bytes(len(data))
+
+        return self.device.spi_transfer(bytes(data))
+
+    def reset_stats(self):
+        self.transactions = 0
+        self.bytes = 0
+        self.busy_time = 0.0
+
+
+class UARTLine:
+    """A UART with one device on the other end.
+
+    Every byte takes 10 bits (start, 8 data, stop) at the baudrate on the
+    clock, in either direction.
+    """
+
+    def __init__(self, clock, baudrate=9600):
+        self.clock = clock
+        self.baudrate = baudrate
+        self.device = None
+
+        self.bytes = 0
+        self.busy_time = 0.0
+
+    def attach(self, device):
+        self.device = device
+
+    def _spend(self, nbytes):
+        seconds = nbytes * 10 / self.baudrate
+
+        self.bytes += nbytes
+        self.busy_time += seconds
+        self.clock.advance(seconds)
+
+    def write(self, data):
+        self._spend(len(data))
+
+        if self.device is not None:
+            self.device.uart_write(bytes(data))
+
+    def available(self):
+        if self.device is None:
+            return 0
+
+        return self.device.uart_available()
+
+    def read(self, nbytes):
+        if self.device is None:
+            return b""
+
+        data = self.device.uart_read(nbytes)
+        self._spend(len(data))
+
+        return data
+
+    def reset_stats(self):
+        self.bytes = 0
+        self.busy_time = 0.0
+
+
+class SerialPort:
+    """USB CDC console: what the host types and what the firmware prints."""
+
+    def __init__(self, echo=None):
+        self.connected = True
+        self.echo = echo
+
+        self._input = ""
+        self._output = []
+
+    # Host side
+
+    def send(self, text):
+        self._input += text
+
+    def take_output(self):
+        output = "".join(self._output)
+        self._output.clear()
+
+        return output
+
+    @property
+    def output(self):
+        return "".join(self._output)
+
+    # Firmware side, installed as sys.stdin and sys.stdout
+
+    @property
+    def bytes_available(self):
+        return len(self._input)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self._input)
+
+        data, self._input = self._input[:size], self._input[size:]
+
+        return data
+
+    def readline(self):
+        index = self._input.find("\n")
+        size = len(self._input) if index < 0 else index + 1
+
+        return self.read(size)
+
+    def write(self, text):
+        self._output.append(text)
+
+        if self.echo is not None:
+            self.echo.write(text)
+
+        return len(text)
+
+    def flush(self):
+        if self.echo is not None:
+            self.echo.flush()
+
+
+class Board:
+    """Everything wired to the simulated XIAO ESP32-C3."""
+
+    PIN_NAMES = (
+        "D0",
+        "D1",
+        "D2",
+        "D3",
+        "D4",
+        "D5",
+        "D6",
+        "D7",
+        "D8",
+        "D9",
+        "D10",
+        "SDA",
+        "SCL",
+        "TX",
+        "RX",
+        "SCK",
+        "MISO",
+        "MOSI",
+    )
+
+    def __init__(
+        self, compute_scale=1.0, heap_size=160 * 1024, nvm_size=8192, echo=None
+    ):
+        self.clock = Clock(compute_scale=compute_scale)
+        self.pins = {name: Pin(name) for name in self.PIN_NAMES}
+        self.i2c = I2CBus(self.clock)
+        self.spi = SPIBus(self.clock)
+        self.uart = UARTLine(self.clock)
+        self.serial = SerialPort(echo=echo)
+        self.heap_size = heap_size
+        self.nvm = bytearray(b"\xff" * nvm_size)
+        self.nvm_writes = 0
+        self.nvm_bytes = 0
+        self.displays = []
+
+        # Filled in by the simulator, see devices.py
+        self.display = None
+        self.pn532 = None
+
+    def pin(self, name):
+        return self.pins[name]
+
+
+current = None
@@ -0,0 +1,393 @@
+"""Run CircuitPython firmware under CPython against the simulated badge.
+
+While a ``Simulator`` is entered, the stand-in modules in ``circuitpython/``
+shadow the CircuitPython ones, ``time`` follows the simulated clock, and the
+firmware's stdin/stdout are the badge's USB serial console. asyncio event
+loops skip their idle waits on the same clock, so a firmware that sleeps most
+of the time simulates hours in seconds. ``os.getenv`` reads the firmware's
+``settings.toml``, with ``settings`` taking precedence, like CircuitPython.
+
+    with Simulator("esp32c3-dump/fs") as sim:
+        sim.place_tag(NtagTag(badge_id=42))
+        sim.run(scenario=my_scenario, duration=10)
+        print(sim.output)
+
+``serve_pty`` puts the serial console on a pty instead, so host tools can
+talk to the simulated badge like to a real one.
+"""
+
+import asyncio
+import gc
+import inspect
+import os
+import runpy
+import selectors
+import sys
+import time
+import tomllib
+import tracemalloc
+from pathlib import Path
+
+from hnr26_badge_nfc.sim import hardware
+from hnr26_badge_nfc.sim.devices import PN532Device, SSD1306Device
+
+STANDINS_PATH = Path(__file__).parent / "circuitpython"
+
+# The pins the badge buttons are wired to
+BUTTON_PINS = {"a": "D7", "b": "D9", "c": "D8"}
+
+
+class _VirtualSelector(selectors.DefaultSelector):
+    """Selector that spends its timeout on the simulated clock."""
+
+    def __init__(self, clock):
+        super().__init__()
+        self._clock = clock
+
+    def select(self, timeout=None):
+        events = super().select(0)
+
+        if not events and timeout is not None:
+            self._clock.advance(timeout)
+
+        return events
+
+
+class Simulator:
+    def __init__(
+        self,
+        fs_path,
+        compute_scale=1.0,
+        heap_size=160 * 1024,
+        echo=None,
+        trace_heap=False,
+        settings=None,
+    ):
+        self.fs_path = Path(fs_path)
+        self.compute_scale = compute_scale
+        self.heap_size = heap_size
+        self.echo = echo
+        self.trace_heap = trace_heap
+        self.settings = dict(settings or {})
+
+        self.board = None
+        self.display = None
+        self.pn532 = None
+
+        self._saved = None
+        self._scenario = None
+        self._unread = ""
+
+    # Setup and teardown
+
+    def __enter__(self):
+        board = hardware.Board(
+            compute_scale=self.compute_scale,
+            heap_size=self.heap_size,
+            echo=self.echo,
+        )
+        board.display = SSD1306Device()
+        board.pn532 = PN532Device(board)
+        board.i2c.attach(SSD1306Device.I2C_ADDRESS, board.display)
+        board.i2c.attach(PN532Device.I2C_ADDRESS, board.pn532)
+        board.spi.attach(board.pn532)
+        board.uart.attach(board.pn532)
+
+        self.board = board
+        self.display = board.display
+        self.pn532 = board.pn532
+
+        clock = board.clock
+        serial = board.serial
+
+        self._saved = {
+            "current": hardware.current,
+            "time": (time.monotonic, time.monotonic_ns, time.sleep),
+            "gc": {
+                name: getattr(gc, name)
+                for name in ("mem_free", "mem_alloc")
+                if hasattr(gc, name)
+            },
+            "stdio": (sys.stdin, sys.stdout),
+            "asyncio_run": asyncio.run,
+            "getenv": os.getenv,
+            "path": list(sys.path),
+        }
+
+        hardware.current = board
+
+        time.monotonic = clock.now
+        time.monotonic_ns = lambda: int(clock.now() * 1000000000)
+        time.sleep = clock.advance
+
+        gc.mem_alloc = self._mem_alloc
+        gc.mem_free = lambda: max(self.heap_size - self._mem_alloc(), 0)
+
+        if self.trace_heap:
+            tracemalloc.start()
+
+        sys.stdin = serial
+        sys.stdout = serial
+        asyncio.run = self._asyncio_run
+        os.getenv = self._getenv_factory(self._saved["getenv"])
+
+        sys.path[0:0] = [
+            str(STANDINS_PATH),
+            str(self.fs_path / "lib"),
+            str(self.fs_path),
+        ]
+
+        self._purge_modules()
+
+        return self
+
+    def __exit__(self, *exc):
+        saved = self._saved
+
+        if self.trace_heap:
+            tracemalloc.stop()
+
+        time.monotonic, time.monotonic_ns, time.sleep = saved["time"]
+
+        for name in ("mem_free", "mem_alloc"):
+            if name in saved["gc"]:
+                setattr(gc, name, saved["gc"][name])
+            elif hasattr(gc, name):
+                delattr(gc, name)
+
+        sys.stdin, sys.stdout = saved["stdio"]
+        asyncio.run = saved["asyncio_run"]
+        os.getenv = saved["getenv"]
+        sys.path[:] = saved["path"]
+
+        self._purge_modules()
+        hardware.current = saved["current"]
+
+        return False
+
+    def _purge_modules(self):
+        # Firmware and stand-in modules must not leak between simulations
+        roots = (str(STANDINS_PATH), str(self.fs_path))
+
+        for name, module in list(sys.modules.items()):
+            path = getattr(module, "__file__", None) or ""
+
+            if path.startswith(roots):
+                del sys.modules[name]
+
+    def _getenv_factory(self, getenv):
+        settings = {}
+        path = self.fs_path / "settings.toml"
+
+        if path.exists():
+            settings.update(tomllib.loads(path.read_text()))
+
+        settings.update(self.settings)
+
+        def sim_getenv(key, default=None):
+            if key in settings:
+                return settings[key]
+
+            return getenv(key, default)
+
+        return sim_getenv
+
+    def _mem_alloc(self):
+        if not self.trace_heap:
+            return 0
+
+        return tracemalloc.get_traced_memory()[0]
+
+    # Running firmware
+
+    def load(self, script="code.py"):
+        """Import a firmware script without running its main()."""
+        return runpy.run_path(str(self.fs_path / script), run_name="firmware")
+
+    def run(self, script="code.py", scenario=None, duration=None):
+        """Run a firmware script until the scenario ends or time runs out.
+
+        ``scenario`` is an async function taking the simulator, run alongside
+        asyncio firmware. For firmware with a plain loop it is a normal
+        function, called before the script starts to schedule input, and
+        ``duration`` is needed to stop the loop.
+        """
+        clock = self.board.clock
+        is_async_scenario = inspect.iscoroutinefunction(scenario)
+
+        self._scenario = scenario if is_async_scenario else None
+
+        if scenario is not None and not is_async_scenario:
+            scenario(self)
+
+        if duration is not None:
+            # Only plain loops get stopped through the clock, the asyncio
+            # supervisor stops itself
+            clock.deadline = clock.now() + duration
+
+        try:
+            runpy.run_path(str(self.fs_path / script), run_name="__main__")
+        except hardware.SimulationStop:
+            pass
+        finally:
+            clock.deadline = None
+
+        if self._scenario is not None:
+            raise RuntimeError("The firmware never started an asyncio loop")
+
+    def _new_loop(self):
+        return asyncio.SelectorEventLoop(_VirtualSelector(self.board.clock))
+
+    def _asyncio_run(self, main, *, debug=None, loop_factory=None):
+        clock = self.board.clock
+        deadline, clock.deadline = clock.deadline, None
+        scenario, self._scenario = self._scenario, None
+
+        async def supervise():
+            firmware = asyncio.ensure_future(main)
+            tasks = [firmware]
+
+            if scenario is not None:
+                tasks.append(asyncio.ensure_future(scenario(self)))
+
+            if deadline is not None:
+                timeout = asyncio.sleep(deadline - clock.now())
+                tasks.append(asyncio.ensure_future(timeout))
+
+            done, pending = await asyncio.wait(
+                tasks, return_when=asyncio.FIRST_COMPLETED
+            )
+
+            for task in pending:
+                task.cancel()
+
+            await asyncio.gather(*pending, return_exceptions=True)
+
+            for task in done:
+                task.result()
+
+        runner = asyncio.Runner(debug=debug, loop_factory=self._new_loop)
+
+        with runner:
+            return runner.run(supervise())
+
+    # Scripted input
+
+    def button_pin(self, button):
+        return self.board.pin(BUTTON_PINS.get(button, button))
+
+    async def press(self, button, hold=0.1, release=0.1):
+        """Press and release a button, from an async scenario."""
+        pin = self.button_pin(button)
+        pin.level = False
+        await asyncio.sleep(hold)
+        pin.level = True
+        await asyncio.sleep(release)
+
+    def schedule_press(self, button, at, hold=0.1):
+        """Press a button at a given simulated time, for plain loops."""
+        pin = self.button_pin(button)
+        clock = self.board.clock
+
+        clock.call_at(at, lambda: setattr(pin, "level", False))
+        clock.call_at(at + hold, lambda: setattr(pin, "level", True))
+
+    def send(self, text):
+        """Type text into the serial console."""
+        self.board.serial.send(text)
+
+    def place_tag(self, tag):
+        self.pn532.place(tag)
+        return tag
+
+    def remove_tag(self, tag):
+        self.pn532.remove(tag)
+
+    async def tap(self, tag, hold=0.5):
+        """Hold a tag over the reader for a while, from an async scenario."""
+        self.place_tag(tag)
+        await asyncio.sleep(hold)
+        self.remove_tag(tag)
+
+    async def wait_for_output(self, text, timeout=5.0, poll=0.01):
+        """Wait until the firmware prints ``text``, from an async scenario.
+
+        Returns everything printed up to and including it. That output is
+        consumed, whatever came after is kept for the next wait.
+        """
+        started = self.now
+
+        while True:
+            self._unread += self.take_output()
+            index = self._unread.find(text)
+
+            if index >= 0:
+                end = index + len(text)
+                seen, self._unread = self._unread[:end], self._unread[end:]
+
+                return seen
+
+            if self.now - started > timeout:
+                raise TimeoutError(
+                    f"Firmware didn't print {text!r} within {timeout}s"
+                )
+
+            await asyncio.sleep(poll)
+
+    async def serve_pty(self, fd, poll=0.001):
+        """Bridge the serial console to a pty master, from an async scenario.
+
+        What the host writes to the other end is typed into the console and
+        what the firmware prints goes back with CircuitPython's ``\\r\\n``
+        line endings. The simulated clock is held back to real time, so
+        timeouts mean the same on both ends; that needs a ``compute_scale``
+        of 0, or compute time would count twice. Runs until cancelled.
+        """
+        real_sleep = self._saved["time"][2]
+        os.set_blocking(fd, False)
+        started_real = time.perf_counter()
+        started = self.now
+
+        while True:
+            try:
+                data = os.read(fd, 4096)
+            except (BlockingIOError, OSError):
+                # OSError while nothing has the other end open
+                data = b""
+
+            if data:
+                self.send(data.decode("latin-1"))
+
+            output = self.take_output()
+
+            if output:
+                output = output.replace("\n", "\r\n").encode("latin-1")
+
+                try:
+                    os.write(fd, output)
+                except OSError:
+                    pass
+
+            elapsed_real = time.perf_counter() - started_real
+            ahead = self.now - started - elapsed_real
+
+            if ahead > 0:
+                real_sleep(ahead)
+
+            await asyncio.sleep(poll)
+
+    # Inspection
+
+    @property
+    def now(self):
+        return self.board.clock.now()
+
+    @property
+    def output(self):
+        return self.board.serial.output
+
+    def take_output(self):
+        return self.board.serial.take_output()
+
+    def screen_text(self, on="#", off="."):
+        return self.display.to_text(on=on, off=off)
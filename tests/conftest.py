@@ -0,0 +1,14 @@
+from pathlib import Path
+
+import pytest
+
+from hnr26_badge_nfc.sim import Simulator
+
+FIRMWARE_PATH = Path(__file__).parent.parent / "esp32c3-dump" / "fs"
+
+
+@pytest.fixture
+def sim():
+    """A simulated badge, for loading firmware modules and running them."""
+    with Simulator(FIRMWARE_PATH, compute_scale=0) as sim:
+        yield sim
@@ -0,0 +1,123 @@
+"""Frames between host tools and the firmware, and the console input they
+arrive through: hnr26_badge_nfc/protocol.py against esp32c3-dump/fs/frames.py,
+and LineBuffer in esp32c3-dump/fs/code.py.
+"""
+
+import asyncio
+import binascii
+
+from hnr26_badge_nfc import protocol
+from hnr26_badge_nfc.bench import FIRMWARE_PATH
+from hnr26_badge_nfc.sim import Simulator
+
+
+def _corrupt(line):
+    # Flip a bit in the first payload byte, past type and request ID
+    frame = bytearray(binascii.a2b_base64(line[1:]))
+    frame[3] ^= 0x01
+
+    return protocol.START + binascii.b2a_base64(bytes(frame))
+
+
+def _reply(text):
+    # Send text in parts, one console read each, and decode the frame back.
+    # Not the sim fixture: pytest puts its own sys.stdout back between
+    # setting up and running a test, and the firmware prints to it
+    async def scenario(sim):
+        # Past the splash screen
+        await asyncio.sleep(3.5)
+
+        for part in text:
+            sim.send(part)
+            await asyncio.sleep(0.05)
+
+        await sim.wait_for_output(protocol.START.decode())
+        line = await sim.wait_for_output("\n")
+        reader = protocol.FrameReader()
+        items.extend(reader.feed(protocol.START + line.encode()))
+
+    items = []
+
+    with Simulator(FIRMWARE_PATH, compute_scale=0) as sim:
+        sim.run(scenario=scenario)
+
+    return items
+
+
+def test_frames_round_trip_between_host_and_firmware(sim):
+    frames = sim.load("frames.py")
+    payload = bytes(range(256))[:protocol.MAX_PAYLOAD]
+
+    line = protocol.encode_frame(protocol.QUEUE_WRITES, 0x1234, payload)
+    assert frames["decode"](line[1:].decode()) == (
+        protocol.QUEUE_WRITES,
+        0x1234,
+        payload,
+    )
+
+    line = frames["encode"](frames["FOOD_SCAN"], 0, b"\x00\x2a")
+    assert protocol.FrameReader().feed(b"log\n" + line.encode()) == [
+        (False, "log"),
+        (True, (protocol.FOOD_SCAN, 0, b"\x00\x2a")),
+    ]
+
+
+def test_bad_crc_is_rejected(sim):
+    frames = sim.load("frames.py")
+    line = _corrupt(protocol.encode_frame(protocol.PING, 7, b"hi"))
+
+    assert frames["decode"](line[1:].decode()) is None
+    assert protocol.FrameReader().feed(line) == [(True, None)]
+
+
+def test_ping_split_across_reads():
+    line = protocol.encode_frame(protocol.PING, 7, b"hi").decode()
+
+    # The RS on its own, then the rest of the frame in two reads
+    items = _reply([line[:1], line[1:6], line[6:]])
+
+    assert items == [
+        (True, (protocol.PING | protocol.REPLY, 7, b"\x00hi")),
+    ]
+
+
+def test_corrupt_frame_gets_an_error_reply():
+    line = _corrupt(protocol.encode_frame(protocol.PING, 7, b"hi")).decode()
+    items = _reply([line])
+
+    assert items == [
+        (True, (protocol.ERROR, 0, bytes((protocol.STATUS_BAD_FRAME,)))),
+    ]
+
+
+def test_line_buffer_joins_a_line_split_across_reads(sim):
+    line_buffer = sim.load()["LineBuffer"](size=16)
+
+    # Wraps round the ring on the way
+    line_buffer.feed("0123456789\n")
+    assert line_buffer.readline() == "0123456789"
+
+    line_buffer.feed("\x1eabc")
+    assert line_buffer.readline() is None
+
+    line_buffer.feed("def\r")
+    line_buffer.feed("\nnext\r\n")
+    assert line_buffer.readline() == "\x1eabcdef"
+    assert line_buffer.readline() == "next"
+    assert line_buffer.readline() is None
+
+
+def test_line_buffer_cuts_a_line_too_long_for_it(sim):
+    line_buffer = sim.load()["LineBuffer"](size=16)
+    line_buffer.feed("x" * 20)
+    line_buffer.feed("y" * 20 + "\n")
+
+    # The rest of the long line is dropped, not run as the next one
+    assert line_buffer.readline() == "x" * 15
+    assert line_buffer.readline() is None
+
+    line_buffer.feed("ok\n")
+    assert line_buffer.readline() == "ok"
+    assert line_buffer.readline() is None
+    assert line_buffer.cut_lines == 1
+    assert line_buffer.free == 16
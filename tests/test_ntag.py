@@ -0,0 +1,45 @@
+"""Page reads in esp32c3-dump/fs/ntag.py against a scripted PN532."""
+
+
+class ScriptedPn532:
+    # Answers each InDataExchange with the next reply, status byte first
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.calls = []
+
+    def call_function(self, command, params=(), response_length=0):
+        self.calls.append(params)
+
+        return self.replies.pop(0)
+
+
+def _pages(sim, *replies):
+    ntag = sim.load("ntag.py")
+    tag_pages = ntag["NtagPages"](ScriptedPn532(*replies))
+    tag_pages.select(b"\x04\x01\x02\x03\x04\x05\x06")
+
+    return tag_pages
+
+
+def test_read_caches_the_four_pages_read_returns(sim):
+    tag_pages = _pages(sim, b"\x00" + bytes(range(16)))
+
+    assert tag_pages.read(4) == bytes(range(4))
+    assert tag_pages.read(5, 3) == bytes(range(4, 16))
+    assert len(tag_pages.pn532.calls) == 1
+
+
+def test_short_read_reply_fails(sim):
+    tag_pages = _pages(sim, b"\x00" + bytes(range(8)), b"\x00" + bytes(16))
+
+    assert tag_pages.read(4) is None
+
+    # Nothing from the short reply counts as cached
+    assert tag_pages.read(6) == bytes(4)
+    assert len(tag_pages.pn532.calls) == 2
+
+
+def test_short_fast_read_reply_fails(sim):
+    tag_pages = _pages(sim, b"\x00" + bytes(range(40)))
+
+    assert tag_pages.read(4, 12) is None
@@ -0,0 +1,212 @@
+"""ReaderPool.provision sharing IDs out over readers that come and go.
+
+Runs against fake readers that stand in for BadgeReader: each one writes
+whatever is queued on it straight away when tapped, and can be unplugged.
+"""
+
+import asyncio
+from collections import deque
+
+from hnr26_badge_nfc import protocol
+from hnr26_badge_nfc.client import WriteResult
+from hnr26_badge_nfc.orchestrator import IdAllocator, ReaderPool
+
+
+class FakeReader:
+    def __init__(self, port, is_tapped=True):
+        self.port = port
+        self.is_tapped = is_tapped
+        self.reconnects = 0
+        self.write_results = asyncio.Queue()
+
+        # Queue requests to take but not answer, and whether "queue clear"
+        # gets no answer either
+        self.lost_replies = 0
+        self.is_clear_failing = False
+
+        self.queued = deque()
+        # Every badge ID it wrote, counted or not
+        self.written = []
+        self._connected = asyncio.Event()
+        self._connected.set()
+
+    @property
+    def is_connected(self):
+        return self._connected.is_set()
+
+    async def wait_connected(self):
+        await self._connected.wait()
+
+    def unplug(self):
+        # The badge's queue goes with it
+        self._connected.clear()
+        self.queued.clear()
+
+    def tap(self):
+        # Blank badges for everything queued
+        while self.queued:
+            badge_id = self.queued.popleft()
+            self.written.append(badge_id)
+            self.write_results.put_nowait(
+                WriteResult(
+                    protocol.STATUS_OK, badge_id, 0, bytes(7), badge_id
+                )
+            )
+
+    async def queue_writes(self, runs):
+        # A round trip to the badge
+        await asyncio.sleep(0.001)
+
+        if not self.is_connected:
+            raise ConnectionError(f"{self.port} lost")
+
+        for run in runs:
+            self.queued.extend(run)
+
+        if self.is_tapped:
+            self.tap()
+
+        if self.lost_replies:
+            self.lost_replies -= 1
+            raise TimeoutError
+
+        return len(self.queued)
+
+    async def command(self, text):
+        if not self.is_connected:
+            raise ConnectionError(f"{self.port} lost")
+
+        if text == "queue clear":
+            if self.is_clear_failing:
+                raise TimeoutError
+
+            self.queued.clear()
+
+        return [f"queue: {len(self.queued)} waiting"]
+
+
+def _pool(*readers):
+    pool = ReaderPool([])
+    pool.readers = list(readers)
+
+    return pool
+
+
+def _provision(pool, allocator, during=None):
+    async def main():
+        task = asyncio.create_task(
+            pool.provision(allocator, reconnect_timeout=0.1)
+        )
+
+        if during is not None:
+            await during()
+
+        async with asyncio.timeout(10):
+            return await task
+
+    return asyncio.run(main())
+
+
+def test_every_id_written_once_over_several_readers():
+    readers = [FakeReader(f"/dev/fake{i}") for i in range(3)]
+    allocator = IdAllocator(1, 250, block=20)
+    written = _provision(_pool(*readers), allocator)
+
+    assert sorted(item.badge_id for item in written) == list(range(1, 251))
+    assert {item.port for item in written} == {r.port for r in readers}
+    assert allocator.is_done
+    assert allocator.unused() == []
+
+
+def test_ids_given_back_after_the_others_finished_are_written():
+    stuck = FakeReader("/dev/stuck", is_tapped=False)
+    busy = FakeReader("/dev/busy")
+    allocator = IdAllocator(1, 60, block=10)
+
+    async def during():
+        # busy writes everything it gets, stuck sits on its blocks
+        while allocator.remaining:
+            await asyncio.sleep(0.01)
+
+        assert len(stuck.queued) == 20
+
+        stuck.unplug()
+
+    written = _provision(_pool(stuck, busy), allocator, during)
+
+    assert sorted(item.badge_id for item in written) == list(range(1, 61))
+    assert {item.port for item in written} == {"/dev/busy"}
+    assert allocator.unused() == []
+
+
+def test_ends_when_every_reader_is_gone():
+    readers = [FakeReader(f"/dev/fake{i}", is_tapped=False) for i in range(2)]
+    allocator = IdAllocator(1, 100, block=10)
+
+    async def during():
+        await asyncio.sleep(0.05)
+
+        for reader in readers:
+            reader.unplug()
+
+    written = _provision(_pool(*readers), allocator, during)
+
+    assert written == []
+    assert allocator.unused() == [range(1, 101)]
+    assert allocator.outstanding == 0
+
+
+def test_reader_that_comes_back_carries_on():
+    reader = FakeReader("/dev/fake0", is_tapped=False)
+    allocator = IdAllocator(1, 30, block=10)
+
+    async def during():
+        await asyncio.sleep(0.05)
+        reader.unplug()
+
+        # Back well within reconnect_timeout, as after a reset
+        await asyncio.sleep(0.05)
+        reader.reconnects += 1
+        reader.is_tapped = True
+        reader._connected.set()
+
+    written = _provision(_pool(reader), allocator, during)
+
+    assert sorted(item.badge_id for item in written) == list(range(1, 31))
+
+
+def test_queued_block_whose_reply_was_lost_is_written_once():
+    # Taken and written straight away, then the reply never came
+    readers = [FakeReader(f"/dev/fake{i}") for i in range(2)]
+    readers[0].lost_replies = 2
+    readers[1].is_tapped = False
+    readers[1].lost_replies = 1
+    allocator = IdAllocator(1, 60, block=10)
+
+    async def during():
+        await asyncio.sleep(0.05)
+        readers[1].tap()
+        readers[1].is_tapped = True
+
+    written = _provision(_pool(*readers), allocator, during)
+
+    assert sorted(item.badge_id for item in written) == list(range(1, 61))
+    assert sorted(readers[0].written + readers[1].written) == list(
+        range(1, 61)
+    )
+    assert allocator.lost == []
+
+
+def test_block_is_lost_when_the_queue_cannot_be_cleared(capsys):
+    reader = FakeReader("/dev/fake0")
+    reader.lost_replies = 1
+    reader.is_clear_failing = True
+    allocator = IdAllocator(1, 30, block=10)
+    written = _provision(_pool(reader), allocator)
+
+    # Written, but nobody can tell, so its IDs are never handed out again
+    assert allocator.lost == [range(1, 11)]
+    assert sorted(item.badge_id for item in written) == list(range(11, 31))
+    assert sorted(reader.written) == list(range(1, 31))
+    assert allocator.is_done
+    assert "wrote 1, which it wasn't expected to" in capsys.readouterr().err
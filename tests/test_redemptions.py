@@ -0,0 +1,244 @@
+"""Crash safety of the redemptions journal in esp32c3-dump/fs/redemptions.py.
+
+Runs Redemptions over a plain bytearray standing in for microcontroller.nvm,
+cutting power by reloading from whatever the storage holds at that point.
+"""
+
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+_PATH = Path(__file__).parent.parent / "esp32c3-dump" / "fs" / "redemptions.py"
+
+# Loaded by path, the firmware directory also holds a code.py that would
+# shadow the standard library's
+_spec = importlib.util.spec_from_file_location("redemptions", _PATH)
+redemptions = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(redemptions)
+
+Redemptions = redemptions.Redemptions
+RECORD_SIZE = redemptions.RECORD_SIZE
+
+# Like the firmware, with SavedBadgeId in front
+OFFSET = 4
+NVM_SIZE = 8192
+
+
+def _blank():
+    return bytearray(b"\xff" * NVM_SIZE)
+
+
+def _load(storage):
+    # What the firmware finds after a reset
+    store = Redemptions(storage, offset=OFFSET)
+    store.load()
+
+    return store
+
+
+def _record_offset(store, index):
+    return OFFSET + store.size + 6 + index * RECORD_SIZE
+
+
+def _redeemed(store, badge_ids, session=None):
+    return [
+        badge_id
+        for badge_id in badge_ids
+        if store.is_redeemed(badge_id, session)
+    ]
+
+
+def test_flushed_redemptions_survive_a_reset():
+    storage = _blank()
+    store = _load(storage)
+    store.redeem(1, b"\x04\x01")
+    store.redeem(2)
+    store.flush()
+    store.redeem(3)
+
+    # 3 was still waiting for the next flush
+    store = _load(storage)
+
+    assert _redeemed(store, (1, 2, 3)) == [1, 2]
+    assert store.count() == 2
+    assert store.journal_count == 2
+
+
+def test_bytes_in_front_of_the_offset_are_left_alone():
+    storage = _blank()
+    storage[0:OFFSET] = b"\x00\x2a\xff\xd5"
+    store = _load(storage)
+    store.redeem(5)
+    store.flush()
+    store.compact()
+    store.set_session(2)
+
+    assert storage[0:OFFSET] == b"\x00\x2a\xff\xd5"
+
+
+@pytest.mark.parametrize("byte", [0, 8, RECORD_SIZE - 1])
+def test_replay_stops_at_a_torn_record(byte):
+    storage = _blank()
+    store = _load(storage)
+
+    for badge_id in (10, 11, 12):
+        store.redeem(badge_id)
+
+    store.flush()
+
+    # The second record was half written when power went
+    storage[_record_offset(store, 1) + byte] ^= 0x5A
+    store = _load(storage)
+
+    assert _redeemed(store, (10, 11, 12)) == [10]
+    assert store.journal_count == 1
+
+
+def test_replay_stops_at_a_blank_record():
+    storage = _blank()
+    store = _load(storage)
+    store.redeem(10)
+    store.flush()
+
+    # Flash past the end reads blank, a good record further on is garbage
+    start = _record_offset(store, 2)
+    storage[start : start + RECORD_SIZE] = storage[
+        _record_offset(store, 0) : _record_offset(store, 1)
+    ]
+    store = _load(storage)
+
+    assert store.journal_count == 1
+
+
+def test_stale_records_from_before_a_compaction_are_ignored():
+    storage = _blank()
+    store = _load(storage)
+
+    for badge_id in (20, 21, 22):
+        store.redeem(badge_id)
+
+    store.flush()
+    store.clear_session()
+    store.compact()
+
+    # The old generation's records are still in flash after the new header
+    store = _load(storage)
+
+    assert _redeemed(store, (20, 21, 22)) == []
+    assert store.journal_count == 0
+
+    store.redeem(30)
+    store.flush()
+    store = _load(storage)
+
+    assert _redeemed(store, (20, 21, 22, 30)) == [30]
+    assert store.journal_count == 1
+
+
+class TornStorage(bytearray):
+    # Power goes after the first tear_at bytes of the write at OFFSET,
+    # which is the snapshot
+    tear_at = None
+
+    def __setitem__(self, index, value):
+        if self.tear_at is None or getattr(index, "start", None) != OFFSET:
+            return super().__setitem__(index, value)
+
+        end = OFFSET + self.tear_at
+        super().__setitem__(slice(OFFSET, end), value[: self.tear_at])
+
+        raise RuntimeError("power cut")
+
+
+@pytest.mark.parametrize("cut", ["start", "snapshot", "header", "end"])
+def test_reset_during_compaction_keeps_pending_records(cut):
+    storage = TornStorage(_blank())
+    store = _load(storage)
+    store.redeem(40)
+    store.flush()
+    store.clear_session()
+    store.flush()
+
+    # Still pending, only in memory and in whatever compact() writes
+    store.redeem(41)
+
+    storage.tear_at = {
+        "start": 0,
+        "snapshot": store.size // 2,
+        "header": store.size,
+        "end": store.size + 3,
+    }[cut]
+
+    with pytest.raises(RuntimeError):
+        store.compact()
+
+    storage.tear_at = None
+    store = _load(storage)
+
+    # The old journal, CLEAR included, replays over part of the snapshot
+    assert _redeemed(store, (40, 41)) == [41]
+    assert store.count() == 1
+
+
+def test_clear_records_replay_in_order():
+    storage = _blank()
+    store = _load(storage)
+    store.redeem(50)
+    store.set_session(1)
+    store.redeem(50)
+    store.redeem(51)
+    store.clear_session()
+    store.redeem(52)
+    store.flush()
+    store = _load(storage)
+
+    assert store.session == 1
+    assert _redeemed(store, (50, 51, 52), session=0) == [50]
+    assert _redeemed(store, (50, 51, 52), session=1) == [52]
+    assert store.count(0) == 1
+    assert store.count(1) == 1
+
+
+def test_generation_wraps_around_without_reading_as_blank():
+    storage = _blank()
+    store = _load(storage)
+    generations = set()
+
+    for badge_id in range(1, 300):
+        store.redeem(badge_id)
+        store.flush()
+        store.compact()
+        generations.add(store._generation)
+
+        # Leave a record of this generation behind the next header
+        store.redeem(badge_id + 1000)
+        store.flush()
+        store.clear_session()
+        store.compact()
+        generations.add(store._generation)
+
+        store = _load(storage)
+
+        assert store.count() == 0
+        assert store.journal_count == 0
+
+    assert 0xFF not in generations
+    assert len(generations) == 0xFF
+
+
+def test_full_journal_compacts_on_flush():
+    storage = _blank()
+    store = _load(storage)
+
+    for badge_id in range(1, store.journal_capacity + 10):
+        store.redeem(badge_id)
+
+        if badge_id % 16 == 0:
+            store.flush()
+
+    store.flush()
+    store = _load(storage)
+
+    assert store.count() == store.journal_capacity + 9
+    assert store.journal_count < store.journal_capacity